@@ -37,8 +37,19 @@ export async function DELETE(request: NextRequest) {
     // Xóa file
     await fs.remove(fullPath);
 
-    // Kiểm tra xem thư mục có còn file nào không, nếu không thì xóa thư mục
+    // Xóa ảnh thu nhỏ đi kèm (<tên gốc>.thumb.webp, <tên gốc>.medium.webp, ...)
     const dirPath = path.dirname(fullPath);
+    const baseName = path.basename(fullPath);
+    for (const file of await fs.readdir(dirPath)) {
+      if (
+        file.startsWith(`${baseName}.thumb.`) ||
+        file.startsWith(`${baseName}.medium.`)
+      ) {
+        await fs.remove(path.join(dirPath, file));
+      }
+    }
+
+    // Kiểm tra xem thư mục có còn file nào không, nếu không thì xóa thư mục
     const files = await fs.readdir(dirPath);
     if (files.length === 0) {
       await fs.remove(dirPath);
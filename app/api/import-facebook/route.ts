@@ -1,14 +1,16 @@
 import { NextRequest, NextResponse } from 'next/server';
 import fs from 'fs-extra';
 import path from 'path';
-import { exec } from 'child_process';
-import { promisify } from 'util';
-
-const execAsync = promisify(exec);
+import { getImportWorker, ImportJob } from '../../lib/importWorker';
+import { DATA_FILE, readTimeline } from '../../lib/timelineStore';
 
 const FACEBOOK_DIR =
   '/Users/tuannguyen8888/Downloads/facebook-tuannguyen8888-30_11_2025-BPwDyk9R';
-const DATA_FILE = path.join(process.cwd(), 'data', 'timeline.json');
+// Nhiều export (ngăn cách bởi ':' hoặc ';' trên Windows), worker Python đọc cùng biến môi trường này
+const FACEBOOK_DIRS = (process.env.FACEBOOK_EXPORT_DIRS || '')
+  .split(path.delimiter)
+  .filter((dir) => dir.trim());
+const SOURCES = FACEBOOK_DIRS.length ? FACEBOOK_DIRS : [FACEBOOK_DIR];
 const IMAGES_DIR = path.join(process.cwd(), 'public', 'images');
 
 // GET - Kiểm tra xem có dữ liệu Facebook để import không
@@ -17,8 +19,22 @@ export async function GET(request: NextRequest) {
     const { searchParams } = new URL(request.url);
     const checkOnly = searchParams.get('check') === 'true';
 
-    // Kiểm tra xem thư mục Facebook export có tồn tại không
-    const hasFacebookData = await fs.pathExists(FACEBOOK_DIR);
+    // Tiến độ của job import đang chạy nền
+    const jobId = searchParams.get('job');
+    if (jobId) {
+      const job = getImportWorker().getJob(jobId);
+      if (!job) {
+        return NextResponse.json(
+          { error: `Không tìm thấy job ${jobId}` },
+          { status: 404 }
+        );
+      }
+      return NextResponse.json(await jobResponse(job));
+    }
+
+    // Kiểm tra xem có thư mục Facebook export nào tồn tại không
+    const existing = await Promise.all(SOURCES.map((dir) => fs.pathExists(dir)));
+    const hasFacebookData = existing.some(Boolean);
 
     if (checkOnly) {
       return NextResponse.json({
@@ -29,7 +45,8 @@ export async function GET(request: NextRequest) {
     // Nếu không phải check only, trả về thông tin
     return NextResponse.json({
       hasData: hasFacebookData,
-      facebookDir: FACEBOOK_DIR,
+      facebookDir: SOURCES[0],
+      facebookDirs: SOURCES.map((dir, i) => ({ dir, exists: existing[i] })),
     });
   } catch (error: any) {
     return NextResponse.json({
@@ -40,39 +57,30 @@ export async function GET(request: NextRequest) {
 }
 
 // POST - Import events từ Facebook
+// Job chạy trong worker Python lâu dài (import_worker.py); ?async=true trả về jobId ngay,
+// client hỏi tiến độ qua GET ?job=<jobId>
 export async function POST(request: NextRequest) {
   try {
-    // Chạy script Python để parse Facebook data và ghi trực tiếp vào timeline.json
-    const scriptPath = path.join(process.cwd(), 'import_facebook_events.py');
-
-    const { stdout, stderr } = await execAsync(`python3 "${scriptPath}"`);
-
-    // Log output để debug
-    if (stdout) {
-      console.log('Script output:', stdout);
-    }
-    if (stderr && !stderr.includes('Đang đọc')) {
-      console.error('Script error:', stderr);
-    }
+    // Mặc định chỉ quét file mới/thay đổi theo manifest, ?full=true để quét lại toàn bộ
+    const { searchParams } = new URL(request.url);
+    const full = searchParams.get('full') === 'true';
+    const runAsync = searchParams.get('async') === 'true';
 
-    // Đọc timeline.json sau khi script đã cập nhật
-    await fs.ensureDir(path.dirname(DATA_FILE));
-    let currentData = { timelineEvents: [], lastSaved: null, version: '1.0' };
+    const worker = getImportWorker();
+    const job = await worker.startImport({ full });
 
-    if (await fs.pathExists(DATA_FILE)) {
-      currentData = await fs.readJson(DATA_FILE);
+    if (runAsync) {
+      return NextResponse.json(
+        { success: true, jobId: job.jobId, state: job.state },
+        { status: 202 }
+      );
     }
 
-    // Đếm số sự kiện mới (so với trước khi chạy script)
-    // Script đã tự merge và copy ảnh, nên chỉ cần trả về kết quả
-    const totalEvents = currentData.timelineEvents?.length || 0;
-
-    return NextResponse.json({
-      success: true,
-      message: `Đã import sự kiện từ Facebook vào timeline.json`,
-      imported: totalEvents,
-      total: totalEvents,
-    });
+    // Job chạy quá lâu thì trả về jobId (202) để client hỏi tiếp qua GET ?job=<jobId>
+    const finished = await worker.waitForJob(job.jobId);
+    const status =
+      finished.state === 'failed' ? 500 : finished.state === 'completed' ? 200 : 202;
+    return NextResponse.json(await jobResponse(finished), { status });
   } catch (error: any) {
     console.error('Error importing Facebook events:', error);
     return NextResponse.json(
@@ -81,3 +89,48 @@ export async function POST(request: NextRequest) {
     );
   }
 }
+
+// Kết quả trả về cho client từ trạng thái job (report là metrics do importer tạo)
+async function jobResponse(job: ImportJob) {
+  if (job.state === 'failed') {
+    return {
+      success: false,
+      jobId: job.jobId,
+      state: job.state,
+      error: `Không thể import: ${job.report?.error || 'lỗi không xác định'}`,
+      log: job.log.slice(-20),
+    };
+  }
+  if (job.state !== 'completed') {
+    return {
+      success: true,
+      jobId: job.jobId,
+      state: job.state,
+      log: job.log.slice(-20),
+    };
+  }
+
+  const summary = job.report?.summary;
+
+  // Metrics không có thì quay về đếm trực tiếp trong timeline
+  let totalEvents = summary?.totalEvents;
+  if (totalEvents === undefined) {
+    await fs.ensureDir(path.dirname(DATA_FILE));
+    const currentData = (await fs.pathExists(DATA_FILE))
+      ? await readTimeline()
+      : { timelineEvents: [] };
+    totalEvents = currentData.timelineEvents?.length || 0;
+  }
+
+  return {
+    success: true,
+    jobId: job.jobId,
+    state: job.state,
+    message: `Đã import sự kiện từ Facebook vào timeline.json`,
+    imported: summary?.newEvents ?? totalEvents,
+    total: totalEvents,
+    // Client đang giữ version cũ lấy phần thay đổi qua GET /api/timeline?since=<version>
+    version: summary?.timelineVersion ?? null,
+    metrics: job.report,
+  };
+}
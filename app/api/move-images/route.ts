@@ -70,10 +70,30 @@ export async function POST(request: NextRequest) {
         if (await fs.pathExists(oldFilePath)) {
           // Di chuyển file
           await fs.move(oldFilePath, newFilePath, { overwrite: true });
-          
+
+          // Di chuyển cả ảnh thu nhỏ (thumbnail, medium) đi kèm
+          const derivatives: Record<string, string> = {};
+          for (const key of ['thumbnail', 'medium']) {
+            if (!img[key]) continue;
+            const derivativeName = path.basename(img[key]);
+            const oldDerivativePath = path.join(
+              IMAGES_DIR,
+              img[key].replace('/images/', '')
+            );
+            if (await fs.pathExists(oldDerivativePath)) {
+              await fs.move(
+                oldDerivativePath,
+                path.join(newDir, derivativeName),
+                { overwrite: true }
+              );
+              derivatives[key] = `/images/${newFolderName}/${derivativeName}`;
+            }
+          }
+
           // Cập nhật đường dẫn
           movedImages.push({
             ...img,
+            ...derivatives,
             path: `/images/${newFolderName}/${fileName}`,
           });
         } else {
@@ -1,8 +1,13 @@
 import { NextRequest, NextResponse } from 'next/server';
 import fs from 'fs-extra';
 import path from 'path';
-
-const DATA_FILE = path.join(process.cwd(), 'data', 'timeline.json');
+import {
+  DATA_FILE,
+  readTimeline,
+  readTimelineChanges,
+  readTimelineRange,
+  writeTimeline,
+} from '../../lib/timelineStore';
 
 // Đảm bảo thư mục data tồn tại
 async function ensureDataDir() {
@@ -11,12 +16,33 @@ async function ensureDataDir() {
 }
 
 // GET - Lấy tất cả timeline events
-export async function GET() {
+// ?from=&to= (YYYY, YYYY-MM hoặc YYYY-MM-DD) chỉ lấy event trong khoảng ngày, đọc từ shard nếu có
+// ?since=N chỉ lấy thay đổi từ version N (added/updated/removed); reset=true thì phải tải lại cả timeline
+export async function GET(request: NextRequest) {
   try {
     await ensureDataDir();
     
+    const { searchParams } = new URL(request.url);
+    const from = searchParams.get('from');
+    const to = searchParams.get('to');
+    const since = searchParams.get('since');
+    
+    if (since !== null) {
+      if (!/^\d+$/.test(since)) {
+        return NextResponse.json(
+          { error: 'since phải là số nguyên >= 0' },
+          { status: 400 }
+        );
+      }
+      return NextResponse.json(await readTimelineChanges(Number(since)));
+    }
+    
+    if ((from || to) && (await fs.pathExists(DATA_FILE))) {
+      return NextResponse.json(await readTimelineRange(from, to));
+    }
+    
     if (await fs.pathExists(DATA_FILE)) {
-      const data = await fs.readJson(DATA_FILE);
+      const data = await readTimeline();
       return NextResponse.json(data);
     } else {
       // Tạo file mới nếu chưa có
@@ -25,7 +51,7 @@ export async function GET() {
         lastSaved: new Date().toISOString(),
         version: '1.0'
       };
-      await fs.writeJson(DATA_FILE, initialData, { spaces: 2 });
+      await writeTimeline(initialData);
       return NextResponse.json(initialData);
     }
   } catch (error) {
@@ -58,7 +84,7 @@ export async function POST(request: NextRequest) {
       version: '1.0'
     };
     
-    await fs.writeJson(DATA_FILE, data, { spaces: 2 });
+    await writeTimeline(data);
     
     return NextResponse.json({ 
       success: true,
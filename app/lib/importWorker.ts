@@ -0,0 +1,213 @@
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+import path from 'path';
+import readline from 'readline';
+
+// Worker Python chạy lâu dài (import_worker.py), giao tiếp JSON-RPC qua stdin/stdout
+
+const WORKER_SCRIPT = path.join(process.cwd(), 'import_worker.py');
+// Số dòng log giữ lại cho mỗi job
+const LOG_TAIL_SIZE = 200;
+// Số job đã xong được giữ lại để tra cứu trạng thái
+const MAX_FINISHED_JOBS = 20;
+// Thời gian tối đa một request chờ job chạy xong; quá hạn thì trả về trạng thái hiện tại, job vẫn chạy tiếp
+const JOB_WAIT_TIMEOUT_MS = 10 * 60 * 1000;
+
+export type ImportJob = {
+  jobId: string;
+  args: string[];
+  state: 'queued' | 'running' | 'completed' | 'failed';
+  createdAt: string;
+  startedAt: string | null;
+  finishedAt: string | null;
+  report: any;
+  log: string[];
+};
+
+type Pending = {
+  resolve: (value: any) => void;
+  reject: (error: Error) => void;
+};
+
+class ImportWorkerClient {
+  private child: ChildProcessWithoutNullStreams | null = null;
+  private nextId = 1;
+  private pending = new Map<number, Pending>();
+  private jobs = new Map<string, ImportJob>();
+  private waiters = new Map<string, Array<(job: ImportJob) => void>>();
+
+  // Khởi động worker nếu chưa chạy (hoặc đã chết)
+  private ensureStarted() {
+    if (this.child && this.child.exitCode === null) {
+      return this.child;
+    }
+
+    const child = spawn('python3', [WORKER_SCRIPT], { cwd: process.cwd() });
+    this.child = child;
+
+    // Không có python3 (ENOENT), hoặc ghi vào stdin khi worker đã chết (EPIPE): không để lỗi
+    // 'error' không ai bắt làm sập server, chỉ đánh dấu worker hỏng để lần gọi sau khởi động lại
+    child.on('error', (error) => {
+      this.onWorkerDown(child, new Error(`Không chạy được import worker: ${error.message}`));
+      child.kill();
+    });
+    child.stdin.on('error', (error) => {
+      this.onWorkerDown(child, new Error(`Mất kết nối với import worker: ${error.message}`));
+      child.kill();
+    });
+
+    readline.createInterface({ input: child.stdout }).on('line', (line) => {
+      let message: any;
+      try {
+        message = JSON.parse(line);
+      } catch {
+        console.error('Import worker: dòng không hợp lệ', line);
+        return;
+      }
+      this.onMessage(message);
+    });
+    child.stderr.on('data', (data) => {
+      console.error('Import worker:', data.toString());
+    });
+    child.on('exit', (code) => {
+      this.onWorkerDown(child, new Error(`Import worker đã dừng (code ${code})`));
+    });
+    return child;
+  }
+
+  // Worker chết hoặc không khởi động được: hủy mọi lời gọi đang chờ, job chưa xong coi như thất bại
+  private onWorkerDown(child: ChildProcessWithoutNullStreams, error: Error) {
+    if (this.child !== child) {
+      // Đã xử lý (vd. 'error' rồi 'exit' của cùng một process)
+      return;
+    }
+    this.child = null;
+    this.pending.forEach(({ reject }) => reject(error));
+    this.pending.clear();
+    // Để request đang chờ không bị treo
+    this.jobs.forEach((job) => {
+      if (job.state === 'queued' || job.state === 'running') {
+        this.updateJob({
+          ...job,
+          state: 'failed',
+          report: { status: 'error', error: error.message },
+        });
+      }
+    });
+  }
+
+  private onMessage(message: any) {
+    if (message.id !== undefined && message.id !== null) {
+      const pending = this.pending.get(message.id);
+      if (!pending) return;
+      this.pending.delete(message.id);
+      if (message.error) {
+        pending.reject(new Error(message.error.message));
+      } else {
+        pending.resolve(message.result);
+      }
+      return;
+    }
+
+    if (message.method === 'progress') {
+      const job = this.jobs.get(message.params.jobId);
+      if (job) {
+        job.log.push(message.params.line);
+        if (job.log.length > LOG_TAIL_SIZE) {
+          job.log.splice(0, job.log.length - LOG_TAIL_SIZE);
+        }
+      }
+    } else if (message.method === 'job') {
+      this.updateJob(message.params);
+    }
+  }
+
+  private updateJob(data: any) {
+    const job: ImportJob = {
+      ...data,
+      log: this.jobs.get(data.jobId)?.log || [],
+    };
+    this.jobs.set(job.jobId, job);
+
+    if (job.state === 'completed' || job.state === 'failed') {
+      const waiters = this.waiters.get(job.jobId) || [];
+      this.waiters.delete(job.jobId);
+      waiters.forEach((resolve) => resolve(job));
+      this.pruneJobs();
+    }
+  }
+
+  // Bỏ bớt job cũ đã xong để bộ nhớ không tăng mãi
+  private pruneJobs() {
+    const finished = Array.from(this.jobs.values()).filter(
+      (job) => job.state === 'completed' || job.state === 'failed'
+    );
+    for (const job of finished.slice(0, -MAX_FINISHED_JOBS)) {
+      this.jobs.delete(job.jobId);
+    }
+  }
+
+  call(method: string, params: Record<string, any> = {}): Promise<any> {
+    const child = this.ensureStarted();
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      child.stdin.write(
+        JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n'
+      );
+    });
+  }
+
+  // Xếp một job import vào hàng đợi của worker, trả về ngay
+  async startImport(options: { full?: boolean; args?: string[] } = {}) {
+    const result = await this.call('import', options);
+    if (!this.jobs.has(result.jobId)) {
+      this.updateJob(result);
+    }
+    return this.getJob(result.jobId) as ImportJob;
+  }
+
+  getJob(jobId: string) {
+    return this.jobs.get(jobId) || null;
+  }
+
+  // Chờ job chạy xong (completed hoặc failed); quá timeoutMs thì trả về trạng thái hiện tại của job
+  waitForJob(jobId: string, timeoutMs = JOB_WAIT_TIMEOUT_MS): Promise<ImportJob> {
+    const job = this.jobs.get(jobId);
+    if (!job) {
+      return Promise.reject(new Error(`Không tìm thấy job ${jobId}`));
+    }
+    if (job.state === 'completed' || job.state === 'failed') {
+      return Promise.resolve(job);
+    }
+    return new Promise((resolve) => {
+      const timer = setTimeout(() => {
+        const waiters = (this.waiters.get(jobId) || []).filter((waiter) => waiter !== done);
+        if (waiters.length) {
+          this.waiters.set(jobId, waiters);
+        } else {
+          this.waiters.delete(jobId);
+        }
+        resolve(this.jobs.get(jobId) || job);
+      }, timeoutMs);
+      const done = (finished: ImportJob) => {
+        clearTimeout(timer);
+        resolve(finished);
+      };
+      const waiters = this.waiters.get(jobId) || [];
+      waiters.push(done);
+      this.waiters.set(jobId, waiters);
+    });
+  }
+}
+
+// Giữ một worker duy nhất cho cả server (kể cả khi Next.js dev reload module)
+const globalForWorker = globalThis as unknown as {
+  importWorker?: ImportWorkerClient;
+};
+
+export function getImportWorker() {
+  if (!globalForWorker.importWorker) {
+    globalForWorker.importWorker = new ImportWorkerClient();
+  }
+  return globalForWorker.importWorker;
+}
@@ -0,0 +1,179 @@
+import fs from 'fs-extra';
+import path from 'path';
+
+export const DATA_FILE = path.join(process.cwd(), 'data', 'timeline.json');
+// Log append-only do importer Python ghi (xem timeline_storage.py), mỗi dòng một event mới
+export const LOG_FILE = path.join(process.cwd(), 'data', 'timeline.log.jsonl');
+
+// Đọc snapshot timeline.json rồi replay log để có timeline đầy đủ
+export async function readTimeline() {
+  const data = await fs.readJson(DATA_FILE);
+
+  if (!(await fs.pathExists(LOG_FILE))) {
+    return data;
+  }
+
+  const events: any[] = data.timelineEvents || [];
+  const knownIds = new Set(events.map((e) => e.id));
+  const lines = (await fs.readFile(LOG_FILE, 'utf-8')).split('\n');
+  let replayed = 0;
+
+  for (const line of lines) {
+    if (!line.trim()) continue;
+    let record: any;
+    try {
+      record = JSON.parse(line);
+    } catch {
+      // Dòng ghi dở khi importer bị dừng giữa chừng
+      continue;
+    }
+    if (record.op === 'add' && record.event && !knownIds.has(record.event.id)) {
+      events.push(record.event);
+      knownIds.add(record.event.id);
+      replayed++;
+    }
+    if (record.savedAt) {
+      data.lastSaved = record.savedAt;
+    }
+  }
+
+  if (replayed > 0) {
+    events.sort((a, b) =>
+      a.dateParsed.date < b.dateParsed.date ? -1 : a.dateParsed.date > b.dateParsed.date ? 1 : 0
+    );
+  }
+  data.timelineEvents = events;
+  return data;
+}
+
+// Ghi toàn bộ timeline (ghi file tạm rồi rename) và bỏ log vì snapshot đã chứa mọi event
+export async function writeTimeline(data: any) {
+  await fs.ensureDir(path.dirname(DATA_FILE));
+  const tmpFile = `${DATA_FILE}.${process.pid}.tmp`;
+  await fs.writeJson(tmpFile, data, { spaces: 2 });
+  await fs.rename(tmpFile, DATA_FILE);
+  await fs.remove(LOG_FILE);
+}
+
+// Shard theo năm/tháng do importer ghi khi chạy với --shards (xem TimelineShards trong timeline_storage.py)
+export const SHARD_DIR = path.join(process.cwd(), 'data', 'shards');
+const SHARD_MANIFEST = path.join(SHARD_DIR, 'manifest.json');
+
+function inRange(date: string, from?: string | null, to?: string | null) {
+  return (!from || date >= from) && (!to || date.slice(0, to.length) <= to);
+}
+
+// Trạng thái snapshot + log mà shard/change feed được dựng từ đó (_source_state trong timeline_storage.py)
+async function readSourceState() {
+  const snapshotMtime = (await fs.pathExists(DATA_FILE))
+    ? (await fs.stat(DATA_FILE, { bigint: true })).mtimeNs.toString()
+    : null;
+  const logSize = (await fs.pathExists(LOG_FILE)) ? (await fs.stat(LOG_FILE)).size : 0;
+  return { snapshotMtime, logSize };
+}
+
+function isSameSource(source: any, current: { snapshotMtime: string | null; logSize: number }) {
+  return source?.snapshotMtime === current.snapshotMtime && source?.logSize === current.logSize;
+}
+
+// Shard còn khớp với snapshot + log hiện tại không (web lưu timeline thì không còn khớp)
+async function readCurrentShardManifest() {
+  if (!(await fs.pathExists(SHARD_MANIFEST))) {
+    return null;
+  }
+  const manifest = await fs.readJson(SHARD_MANIFEST);
+  if (!isSameSource(manifest.source, await readSourceState())) {
+    return null;
+  }
+  return manifest;
+}
+
+// Đọc event trong khoảng ngày (YYYY, YYYY-MM hoặc YYYY-MM-DD, tính cả hai đầu):
+// chỉ mở các shard giao với khoảng đó, shard không khớp thì đọc cả timeline rồi lọc
+export async function readTimelineRange(from?: string | null, to?: string | null) {
+  const manifest = await readCurrentShardManifest();
+  if (!manifest) {
+    const data = await readTimeline();
+    return {
+      ...data,
+      timelineEvents: (data.timelineEvents || []).filter((e: any) =>
+        inRange(e.dateParsed.date, from, to)
+      ),
+    };
+  }
+
+  const events: any[] = [];
+  for (const key of Object.keys(manifest.shards).sort()) {
+    const shard = manifest.shards[key];
+    if (from && shard.to < from) continue;
+    if (to && shard.from.slice(0, to.length) > to) continue;
+    const data = await fs.readJson(path.join(SHARD_DIR, shard.file));
+    events.push(...data.timelineEvents.filter((e: any) => inRange(e.dateParsed.date, from, to)));
+  }
+  return { timelineEvents: events, lastSaved: manifest.lastSaved, version: '1.0' };
+}
+
+// Change feed do importer ghi sau mỗi lần ghi timeline (xem ChangeFeed trong timeline_storage.py)
+export const CHANGE_FEED_FILE = path.join(process.cwd(), 'data', 'timeline_changes.json');
+const CHANGE_FEED_VERSION = 1;
+
+// Gộp các changeset sau version since: {version, since, reset, added, updated, removed}
+// reset=true khi không trả được delta (chưa có feed, timeline bị sửa ngoài importer,
+// since lạ hoặc cũ hơn history đang giữ): client phải tải lại cả timeline
+export async function readTimelineChanges(since: number) {
+  const result = {
+    version: null as number | null,
+    since,
+    reset: true,
+    added: [] as any[],
+    updated: [] as any[],
+    removed: [] as any[],
+  };
+  if (!(await fs.pathExists(CHANGE_FEED_FILE))) {
+    return result;
+  }
+  let feed: any;
+  try {
+    feed = await fs.readJson(CHANGE_FEED_FILE);
+  } catch {
+    // Feed đang được importer ghi dở hoặc hỏng: coi như chưa có
+    return result;
+  }
+  if (feed.format !== CHANGE_FEED_VERSION) {
+    return result;
+  }
+  const version: number = feed.version;
+  const changes: any[] = feed.changes || [];
+  const oldest = changes.length ? changes[0].version - 1 : version;
+  result.version = version;
+  if (!isSameSource(feed.source, await readSourceState()) || since < oldest || since > version) {
+    return result;
+  }
+
+  // id -> [loại thay đổi, event]: thêm rồi xóa thì bỏ, xóa rồi thêm lại thành sửa
+  const merged = new Map<any, ['added' | 'updated' | 'removed', any]>();
+  for (const changeset of changes) {
+    if (changeset.version <= since) continue;
+    for (const event of changeset.added) {
+      const kind = merged.get(event.id)?.[0];
+      merged.set(event.id, [kind === 'removed' ? 'updated' : 'added', event]);
+    }
+    for (const event of changeset.updated) {
+      const kind = merged.get(event.id)?.[0];
+      merged.set(event.id, [kind === 'added' ? 'added' : 'updated', event]);
+    }
+    for (const eventId of changeset.removed) {
+      if (merged.get(eventId)?.[0] === 'added') {
+        merged.delete(eventId);
+      } else {
+        merged.set(eventId, ['removed', null]);
+      }
+    }
+  }
+
+  result.reset = false;
+  merged.forEach(([kind, event], eventId) => {
+    result[kind].push(kind === 'removed' ? eventId : event);
+  });
+  return result;
+}
@@ -34,6 +34,9 @@ interface TimelineEvent {
     name: string;
     path?: string;
     type: string;
+    // Ảnh thu nhỏ do importer tạo (xem image_derivatives.py)
+    thumbnail?: string;
+    medium?: string;
   }>;
 }
 
@@ -1090,10 +1093,17 @@ export default function Home() {
                                 key={img.id}
                                 className='timeline-image-item'
                                 onClick={() =>
-                                  openImageModal(img.path || '', img.name)
+                                  openImageModal(
+                                    img.medium || img.path || '',
+                                    img.name
+                                  )
                                 }
                               >
-                                <img src={img.path || ''} alt={img.name} />
+                                <img
+                                  src={img.thumbnail || img.path || ''}
+                                  alt={img.name}
+                                  loading='lazy'
+                                />
                               </div>
                             ))}
                           </div>
@@ -1270,7 +1280,7 @@ export default function Home() {
                       {existingImages.map((img) => (
                         <div key={img.id} className='image-preview-item'>
                           <img
-                            src={img.path || ''}
+                            src={img.thumbnail || img.path || ''}
                             alt={img.name}
                             onError={(e) => {
                               (e.target as HTMLImageElement).src =
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark cho import_facebook_events.py
+- Sinh export Facebook giả lập (cùng cấu trúc mà scan_all_posts đọc, text bị lỗi encoding như export thật)
+- Đo thời gian từng bước: parse, classify, title, dedup, copy ảnh, ghi timeline
+- Báo posts/giây và RSS đỉnh, lưu kết quả JSON để so với baseline
+
+Ví dụ:
+    python3 benchmark_import.py --posts 20000 --albums 10 --output bench.json
+    python3 benchmark_import.py --posts 20000 --albums 10 --baseline bench.json
+    python3 benchmark_import.py --posts 5000 --description-length 4000   # title trên mô tả dài
+"""
+
+import argparse
+import contextlib
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import import_facebook_events as importer
+import json_backend
+from event_model import to_dicts
+from image_store import INDEX_FILE_NAME as IMAGE_INDEX_FILE, ImageStore
+from post_classifier import build_event_title
+from post_parsing import iter_posts_streaming, load_posts
+from timeline_dedup import UNIQUE, NEAR_DUPLICATE, DedupIndex
+from timeline_storage import TimelineStore, sort_events
+
+RESULTS_VERSION = 1
+STAGES = ["media_index", "parse", "classify", "title", "dedup", "copy", "write"]
+
+VI_PHRASES = [
+    "Đi chơi với vợ yêu", "Chúc mừng sinh nhật vợ", "Bee đầy tháng", "Sam tròn 1 tháng",
+    "ăn tối cùng vợ ở nhà hàng", "check in với Nương Nương", "du lịch Đà Lạt cùng vợ",
+    "con trai Bee đi học", "kỷ niệm 5 năm ngày cưới", "Võ Tuấn Nguyên đã thêm 3 ảnh mới.",
+    "đang cảm thấy hạnh phúc.", "đã chia sẻ một kỷ niệm.", "ku Sam ngủ ngon", "hẹn hò lần đầu",
+    "gặp nhau lần đầu ở quán cà phê", "Em yêu ơi. Anh nhớ em!\nVề sớm nhé", "mang thai con đầu lòng",
+    "nhận lời yêu anh", "Tạm biệt Sài Gòn", "Bé Bee cười toe", "sinh nhật Bee", "em trai tôi",
+    "với bạn bè cũ", "trời hôm nay mưa quá", "cuối tuần ở nhà dọn dẹp",
+]
+EN_PHRASES = [
+    "Happy birthday my love", "dinner with my wife", "Sam's first day at school", "our anniversary trip",
+    "travel to Da Lat with family", "birthday party for Bee", "full month celebration for Sam",
+    "met my friends downtown", "rainy weekend at home", "check in at the beach",
+]
+SPAM_PHRASES = [
+    "Đăng ký ngay nhận quà", "http://khuyenmai.example.com", "voucher giảm giá 50%",
+    "www.shop.example.com trúng thưởng", "mã số dự thưởng 12345",
+]
+TAG_NAMES = ["Nương Nương", "Bee", "Sam", "Ai đó", "Bạn cũ"]
+
+def _mojibake(text):
+    """Export Facebook lưu UTF-8 như latin1, sinh text lỗi y như vậy"""
+    return text.encode('utf-8').decode('latin1')
+
+def _synthetic_post(rng, media_uris, attachments, english_ratio, spam_ratio, description_length=0):
+    """Một post giả lập theo cấu trúc export Facebook"""
+    timestamp = rng.randint(1388534400, 1764460800)  # 2014 -> 2025, một phần bị lọc vì trước 2015
+    phrases = EN_PHRASES if rng.random() < english_ratio else VI_PHRASES
+    text = " ".join(rng.choice(phrases) for _ in range(rng.randint(1, 5)))
+    # Mô tả dài (kể chuyện nhiều câu) để đo bước tạo title trên text lớn
+    while len(text) < description_length:
+        text += rng.choice([". ", "! ", "\n"]) + rng.choice(phrases)
+    if rng.random() < spam_ratio:
+        text += " " + rng.choice(SPAM_PHRASES)
+
+    post = {"timestamp": timestamp, "data": [{"post": _mojibake(text)}, {"update_timestamp": timestamp}]}
+    if rng.random() < 0.3:
+        post["title"] = _mojibake(rng.choice(phrases))
+    if attachments and media_uris:
+        count = rng.randint(0, attachments)
+        if count:
+            post["attachments"] = [{"data": [
+                {"media": {
+                    "uri": rng.choice(media_uris),
+                    "creation_timestamp": timestamp,
+                    "description": _mojibake(rng.choice(phrases)),
+                }}
+                for _ in range(count)
+            ]}]
+    if rng.random() < 0.3:
+        post["tags"] = [{"name": _mojibake(rng.choice(TAG_NAMES))}]
+    return post
+
+def generate_export(root, posts=5000, albums=5, attachments=3, english_ratio=0.2, spam_ratio=0.1,
+                    media_files=200, media_size=32 * 1024, seed=1, description_length=0):
+    """Sinh export giả lập vào root, trả về số post đã ghi"""
+    rng = random.Random(seed)
+    posts_dir = os.path.join(root, "your_facebook_activity", "posts")
+    media_dir = os.path.join(posts_dir, "media", "synthetic")
+    os.makedirs(os.path.join(posts_dir, "album"), exist_ok=True)
+    os.makedirs(media_dir, exist_ok=True)
+
+    media_uris = []
+    for i in range(media_files if attachments else 0):
+        uri = f"your_facebook_activity/posts/media/synthetic/img{i}.jpg"
+        with open(os.path.join(root, uri), 'wb') as f:
+            # Cứ 10 ảnh có một ảnh trùng nội dung để kho ảnh có việc khử trùng
+            f.write(b"duplicate".ljust(media_size, b"\0") if i % 10 == 0 else rng.randbytes(media_size))
+        media_uris.append(uri)
+
+    def make_posts(count):
+        return [
+            _synthetic_post(rng, media_uris, attachments, english_ratio, spam_ratio, description_length)
+            for _ in range(count)
+        ]
+
+    # Chia post cho file chính và các file album; sinh và ghi từng file để không giữ cả export trong bộ nhớ
+    album_share = posts // (albums + 2) if albums else 0
+    main_count = posts - album_share * albums
+    json_backend.dump(
+        make_posts(main_count),
+        os.path.join(posts_dir, "your_posts__check_ins__photos_and_videos_1.json"),
+    )
+    for i in range(albums):
+        json_backend.dump(
+            {"name": f"Album {i}", "data": make_posts(album_share)},
+            os.path.join(posts_dir, "album", f"{i}.json"),
+        )
+    return posts
+
+def peak_rss_mb():
+    """RSS đỉnh của process (MB), None nếu hệ điều hành không hỗ trợ"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak / (1048576 if sys.platform == "darwin" else 1024)
+
+class StageTimer:
+    """Ghi thời gian và RSS đỉnh sau từng bước"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        started = time.perf_counter()
+        yield
+        self.stages[name] = {"seconds": time.perf_counter() - started, "items": items, "peakRssMb": peak_rss_mb()}
+
+def run_benchmark(export_dir, work_dir, stream=False, copy_workers=4, media_index=True, repair_on_parse=False,
+                  quiet=True):
+    """Chạy từng bước của importer trên export_dir, trả về dict kết quả"""
+    timer = StageTimer()
+    output = open(os.devnull, 'w', encoding='utf-8') if quiet else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            file_paths = importer.list_post_files(export_dir)
+
+            with timer.stage("media_index"):
+                importer.set_media_index(importer.MediaIndex(export_dir) if media_index else None)
+
+            with timer.stage("parse"):
+                posts = []
+                for file_path in file_paths:
+                    if stream:
+                        posts.extend(iter_posts_streaming(file_path, repair=repair_on_parse))
+                    else:
+                        posts.extend(load_posts(file_path, repair=repair_on_parse))
+            timer.stages["parse"]["items"] = len(posts)
+
+            with timer.stage("classify", len(posts)):
+                screened_posts = [importer.screen_post(post, export_dir) for post in posts]
+                screened_posts = [screened for screened in screened_posts if screened is not None]
+
+            with timer.stage("title", len(screened_posts)):
+                titles = [
+                    build_event_title(screened.text, screened.verdict, screened.dt)
+                    for screened in screened_posts
+                ]
+            events = [importer.event_from_screened(screened, title) for screened, title in zip(screened_posts, titles)]
+
+            with timer.stage("dedup", len(events)):
+                dedup_index = DedupIndex()
+                accepted = []
+                near_duplicates = 0
+                for event in events:
+                    kind, _ = dedup_index.check(event)
+                    if kind not in (UNIQUE, NEAR_DUPLICATE):
+                        continue
+                    near_duplicates += kind == NEAR_DUPLICATE
+                    dedup_index.add(event)
+                    accepted.append(event)
+
+            image_count = sum(len(event.images) for event in accepted)
+            with timer.stage("copy", image_count):
+                image_store = ImageStore(
+                    os.path.join(work_dir, "public", "images"), os.path.join(work_dir, "data", IMAGE_INDEX_FILE)
+                )
+                pipeline = importer.ImageCopyPipeline(work_dir, image_store, workers=copy_workers)
+                for event in accepted:
+                    pipeline.submit(event)
+                pipeline.finish()
+                image_store.save()
+
+            with timer.stage("write", len(accepted)):
+                store = TimelineStore(os.path.join(work_dir, "data", "timeline.json"))
+                store.compact(sort_events(to_dicts(accepted)))
+    finally:
+        importer.set_media_index(None)
+        if quiet:
+            output.close()
+
+    total_seconds = sum(stage["seconds"] for stage in timer.stages.values())
+    for stage in timer.stages.values():
+        stage["postsPerSec"] = len(posts) / stage["seconds"] if stage["seconds"] else None
+    return {
+        "posts": len(posts),
+        "screened": len(screened_posts),
+        "events": len(accepted),
+        "nearDuplicates": near_duplicates,
+        "images": image_count,
+        "stages": timer.stages,
+        "totalSeconds": total_seconds,
+        "postsPerSec": len(posts) / total_seconds if total_seconds else None,
+        "peakRssMb": peak_rss_mb(),
+    }
+
+def compare_with_baseline(results, baseline, tolerance, min_seconds=0.05):
+    """In bảng so sánh với baseline, trả về danh sách bước bị chậm hơn ngưỡng cho phép"""
+    regressions = []
+    print(f"\n{'Bước':<12} {'Baseline (s)':>13} {'Hiện tại (s)':>13} {'Chênh lệch':>11}")
+    for name in STAGES + ["total"]:
+        if name == "total":
+            before, after = baseline.get("totalSeconds"), results["totalSeconds"]
+        else:
+            before = baseline.get("stages", {}).get(name, {}).get("seconds")
+            after = results["stages"].get(name, {}).get("seconds")
+        if not before or after is None:
+            continue
+        change = after / before - 1
+        marker = ""
+        # Bước quá ngắn thì chênh lệch chủ yếu là nhiễu đo
+        if change > tolerance and after - before > min_seconds:
+            marker = "  ✗ chậm hơn"
+            regressions.append(name)
+        print(f"{name:<12} {before:>13.3f} {after:>13.3f} {change:>+10.1%}{marker}")
+    if baseline.get("peakRssMb") and results.get("peakRssMb"):
+        print(f"{'peak RSS':<12} {baseline['peakRssMb']:>11.1f}MB {results['peakRssMb']:>11.1f}MB")
+    if baseline.get("params") != results.get("params"):
+        print("⚠ Tham số sinh dữ liệu khác baseline, so sánh chỉ mang tính tham khảo")
+    return regressions
+
+def print_results(results):
+    """In kết quả từng bước"""
+    print(f"\nPosts: {results['posts']}, qua bộ lọc: {results['screened']}, "
+          f"event: {results['events']}, ảnh: {results['images']}")
+    print(f"{'Bước':<12} {'Thời gian (s)':>14} {'posts/s':>12} {'RSS đỉnh (MB)':>14}")
+    for name in STAGES:
+        stage = results["stages"][name]
+        posts_per_sec = f"{stage['postsPerSec']:.0f}" if stage["postsPerSec"] else "-"
+        rss = f"{stage['peakRssMb']:.1f}" if stage["peakRssMb"] is not None else "-"
+        print(f"{name:<12} {stage['seconds']:>14.3f} {posts_per_sec:>12} {rss:>14}")
+    print(f"{'total':<12} {results['totalSeconds']:>14.3f} {results['postsPerSec'] or 0:>12.0f}")
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(description="Benchmark import Facebook trên export giả lập")
+    parser.add_argument("--posts", type=int, default=5000, help="Tổng số post (mặc định 5000)")
+    parser.add_argument("--albums", type=int, default=5, help="Số file album (mặc định 5)")
+    parser.add_argument("--attachments", type=int, default=3, help="Số ảnh tối đa mỗi post (mặc định 3)")
+    parser.add_argument("--english-ratio", type=float, default=0.2, help="Tỉ lệ post tiếng Anh (0-1)")
+    parser.add_argument("--spam-ratio", type=float, default=0.1, help="Tỉ lệ post spam/quảng cáo (0-1)")
+    parser.add_argument("--media-files", type=int, default=200, help="Số file ảnh trong export")
+    parser.add_argument("--media-size", type=int, default=32 * 1024, help="Kích thước mỗi ảnh (byte)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed sinh dữ liệu")
+    parser.add_argument("--description-length", type=int, default=0, metavar="N",
+                        help="Kéo dài text mỗi post tới ít nhất N ký tự (đo title trên mô tả dài)")
+    parser.add_argument("--export-dir", help="Dùng export có sẵn thay vì sinh mới")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại thư mục tạm sau khi chạy")
+    parser.add_argument("--stream", action="store_true", help="Parse bằng chế độ streaming")
+    parser.add_argument("--copy-workers", type=int, default=4, help="Số luồng copy ảnh")
+    parser.add_argument("--no-media-index", action="store_true", help="Không dùng index media")
+    parser.add_argument("--repair-on-parse", action="store_true",
+                        help="Sửa encoding toàn bộ chuỗi lúc parse thay vì từng trường khi trích xuất")
+    parser.add_argument("--output", metavar="FILE", help="Lưu kết quả JSON vào FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="So sánh với kết quả JSON đã lưu")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Chậm hơn baseline quá tỉ lệ này thì coi là regression (mặc định 0.2)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Bỏ qua chênh lệch tuyệt đối nhỏ hơn số giây này (mặc định 0.05)")
+    args = parser.parse_args(argv)
+    if args.posts < 1 or args.albums < 0 or args.attachments < 0 or args.copy_workers < 1:
+        parser.error("--posts, --copy-workers phải >= 1; --albums, --attachments phải >= 0")
+    if args.description_length < 0:
+        parser.error("--description-length phải >= 0")
+    for name in ("english_ratio", "spam_ratio"):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name.replace('_', '-')} phải nằm trong khoảng 0-1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    temp_dir = tempfile.mkdtemp(prefix="timeline-bench-")
+    params = {
+        "posts": args.posts,
+        "albums": args.albums,
+        "attachments": args.attachments,
+        "englishRatio": args.english_ratio,
+        "spamRatio": args.spam_ratio,
+        "mediaFiles": args.media_files,
+        "mediaSize": args.media_size,
+        "seed": args.seed,
+        "descriptionLength": args.description_length,
+        "stream": args.stream,
+        "copyWorkers": args.copy_workers,
+        "mediaIndex": not args.no_media_index,
+        "repairOnParse": args.repair_on_parse,
+    }
+    try:
+        export_dir = args.export_dir
+        if export_dir:
+            params = {"exportDir": os.path.abspath(export_dir), "stream": args.stream,
+                      "copyWorkers": args.copy_workers, "mediaIndex": not args.no_media_index,
+                      "repairOnParse": args.repair_on_parse}
+        else:
+            export_dir = os.path.join(temp_dir, "export")
+            print(f"Đang sinh export giả lập ({args.posts} posts, {args.albums} album) vào {export_dir}...")
+            generate_export(
+                export_dir, posts=args.posts, albums=args.albums, attachments=args.attachments,
+                english_ratio=args.english_ratio, spam_ratio=args.spam_ratio,
+                media_files=args.media_files, media_size=args.media_size, seed=args.seed,
+                description_length=args.description_length,
+            )
+
+        print("Đang chạy benchmark...")
+        results = run_benchmark(
+            export_dir, os.path.join(temp_dir, "work"), stream=args.stream,
+            copy_workers=args.copy_workers, media_index=not args.no_media_index,
+            repair_on_parse=args.repair_on_parse,
+        )
+    finally:
+        if args.keep:
+            print(f"Giữ lại thư mục tạm: {temp_dir}")
+        else:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "createdAt": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "jsonBackend": json_backend.BACKEND,
+        "params": params,
+        **results,
+    }
+    print_results(results)
+
+    if args.output:
+        json_backend.dump(results, args.output)
+        print(f"\nĐã lưu kết quả vào {args.output}")
+
+    if args.baseline:
+        baseline = json_backend.load(args.baseline)
+        regressions = compare_with_baseline(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"\n✗ Chậm hơn baseline quá {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+        print(f"\n✓ Không bước nào chậm hơn baseline quá {args.tolerance:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
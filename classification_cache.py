@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache kết quả phân loại post cho importer (SQLite, data/classification_cache.sqlite)
+- Mỗi dòng là kết luận của bước phân loại (hoặc lý do loại cuối cùng) + title cho một post, key là hash nội dung post
+  cùng fingerprint của bộ luật (từ khóa, pattern) đang dùng
+- Quét lại post không đổi với bộ luật cũ thì chỉ tra cache, không phải sửa encoding, phân loại và tạo title lại
+- Đổi bộ luật chỉ làm các dòng của fingerprint cũ không còn được dùng; chỉ giữ dòng của vài bộ luật dùng gần nhất
+  để đổi qua đổi lại giữa các bộ luật (hoặc so sánh hai bộ luật) vẫn dùng được cache
+Nhiều process quét cùng ghi được vào cache (WAL, chờ khóa)
+"""
+
+import os
+import sqlite3
+import time
+
+CACHE_FILE_NAME = "classification_cache.sqlite"
+# Số bộ luật dùng gần nhất được giữ lại dòng cache
+DEFAULT_KEEP_RULESETS = 3
+# Thời gian chờ khóa khi nhiều process cùng ghi (giây)
+LOCK_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rulesets (
+    fingerprint TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    ruleset TEXT NOT NULL,
+    post TEXT NOT NULL,
+    reason TEXT,
+    significant INTEGER NOT NULL,
+    children INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    title TEXT,
+    PRIMARY KEY (ruleset, post)
+) WITHOUT ROWID;
+"""
+
+class CachedVerdict:
+    """Kết luận đã cache của một post: lý do bị loại (None nếu qua) và title nếu đã tạo"""
+
+    __slots__ = ("reason", "significant", "children", "event_type", "title")
+
+    def __init__(self, reason, significant, children, event_type, title=None):
+        self.reason = reason
+        self.significant = bool(significant)
+        self.children = bool(children)
+        self.event_type = event_type
+        self.title = title
+
+    def row(self, ruleset, post_key):
+        return (ruleset, post_key, self.reason, int(self.significant), int(self.children), self.event_type, self.title)
+
+class ClassificationCache:
+    """Cache kết luận phân loại theo (fingerprint bộ luật, hash post)
+
+    Dòng của bộ luật hiện tại được đọc hết vào bộ nhớ ở lần tra đầu tiên (chỉ post qua bước lọc thô
+    mới có trong cache nên số dòng nhỏ); dòng mới được gom lại và ghi một lần khi flush()
+    """
+
+    def __init__(self, db_file, ruleset):
+        self.db_file = db_file
+        self.ruleset = ruleset
+        self.stats = {"stored": 0}
+        self._conn = None
+        self._entries = None
+        self._pending = {}
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_file)), exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=LOCK_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load(self):
+        if self._entries is None:
+            rows = self._connect().execute(
+                "SELECT post, reason, significant, children, event_type, title FROM verdicts WHERE ruleset = ?",
+                (self.ruleset,),
+            )
+            self._entries = {row[0]: CachedVerdict(*row[1:]) for row in rows}
+        return self._entries
+
+    def get(self, post_key):
+        """CachedVerdict của post, None nếu chưa có (importer tự đếm hit/miss theo dòng có dùng được không)"""
+        return self._load().get(post_key)
+
+    def put(self, post_key, entry):
+        """Ghi nhận kết luận của post (ghi xuống đĩa khi flush)"""
+        self._load()[post_key] = entry
+        self._pending[post_key] = entry
+
+    def set_title(self, post_key, title):
+        """Bổ sung title cho post đã ghi nhận kết luận"""
+        entry = self._load().get(post_key)
+        if entry is not None and entry.title != title:
+            entry.title = title
+            self._pending[post_key] = entry
+
+    def set_reason(self, post_key, reason):
+        """Ghi lý do loại cuối cùng (vd. ở bước media) cho post đã ghi nhận kết luận phân loại"""
+        entry = self._load().get(post_key)
+        if entry is not None and entry.reason != reason:
+            entry.reason = reason
+            self._pending[post_key] = entry
+
+    def flush(self):
+        """Ghi các dòng mới xuống đĩa trong một transaction"""
+        if not self._pending:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [entry.row(self.ruleset, post_key) for post_key, entry in self._pending.items()],
+            )
+            conn.execute("INSERT OR REPLACE INTO rulesets VALUES (?, ?)", (self.ruleset, time.time()))
+        self.stats["stored"] += len(self._pending)
+        self._pending.clear()
+
+    def prune(self, keep=DEFAULT_KEEP_RULESETS):
+        """Đánh dấu bộ luật hiện tại vừa dùng, xóa dòng của các bộ luật cũ ngoài keep bộ gần nhất
+
+        Trả về số dòng đã xóa
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO rulesets VALUES (?, ?)", (self.ruleset, time.time()))
+            stale = [
+                row[0] for row in conn.execute(
+                    "SELECT fingerprint FROM rulesets ORDER BY last_used DESC LIMIT -1 OFFSET ?", (keep,)
+                )
+            ]
+            removed = 0
+            for fingerprint in stale:
+                removed += conn.execute("DELETE FROM verdicts WHERE ruleset = ?", (fingerprint,)).rowcount
+                conn.execute("DELETE FROM rulesets WHERE fingerprint = ?", (fingerprint,))
+        return removed
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
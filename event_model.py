@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Model event/ảnh gọn nhẹ cho pipeline import
+- Dùng __slots__ thay cho dict lồng nhau: ít bộ nhớ và ít cấp phát hơn cho mỗi event ứng viên
+- Các trường dẫn xuất (id, ngày DD/MM/YYYY, ngày ISO) chỉ tính một lần khi tạo event
+- to_dict() cho ra đúng schema của timeline.json (cùng thứ tự key như trước)
+- get()/[] đọc được như dict để dùng chung với code xử lý event đã có trong timeline (khử trùng lặp, tìm kiếm)
+"""
+
+DATE_FORMAT = "DD/MM/YYYY"
+DEFAULT_IMAGE_TYPE = "image/jpeg"
+
+class Image:
+    """Một ảnh của event: path là đường dẫn gốc trong export, sau khi copy là /images/..."""
+
+    __slots__ = ("id", "name", "path", "type")
+
+    def __init__(self, image_id, name, path, image_type=DEFAULT_IMAGE_TYPE):
+        self.id = image_id
+        self.name = name
+        self.path = path
+        self.type = image_type
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "path": self.path, "type": self.type}
+
+class Event:
+    """Event import từ một post, giữ các trường của timeline.json dưới dạng thuộc tính"""
+
+    __slots__ = ("id", "date", "date_iso", "year", "month", "day", "type", "title", "description", "images")
+
+    def __init__(self, timestamp, dt, event_type, title, description):
+        self.id = int(timestamp * 1000)
+        self.set_date(dt)
+        self.type = event_type
+        self.title = title
+        self.description = description
+        self.images = []
+
+    def set_date(self, dt):
+        """Đặt ngày của event (id vẫn theo timestamp của post)"""
+        self.date = dt.strftime("%d/%m/%Y")
+        self.date_iso = dt.isoformat()
+        self.year = dt.year
+        self.month = dt.month
+        self.day = dt.day
+
+    def add_image(self, name, path):
+        """Thêm ảnh, id ảnh = id event + thứ tự ảnh"""
+        self.images.append(Image(self.id + len(self.images), name, path))
+
+    @property
+    def date_parsed(self):
+        return {
+            "original": self.date,
+            "date": self.date_iso,
+            "year": self.year,
+            "month": self.month,
+            "day": self.day,
+            "format": DATE_FORMAT,
+        }
+
+    def get(self, key, default=None):
+        """Đọc trường theo key của timeline.json"""
+        if key == "dateParsed":
+            return self.date_parsed
+        if key in ("location", "witnesses", "documents"):
+            return ""
+        if key in Event.__slots__ and key != "date_iso":
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def to_dict(self):
+        """Event theo đúng schema timeline.json"""
+        return {
+            "id": self.id,
+            "date": self.date,
+            "dateParsed": self.date_parsed,
+            "type": self.type,
+            "title": self.title,
+            "description": self.description,
+            "location": "",
+            "witnesses": "",
+            "documents": "",
+            "images": [img.to_dict() for img in self.images],
+        }
+
+def to_dicts(events):
+    """Đổi danh sách Event (hoặc event đã là dict) sang dict để ghi ra timeline"""
+    return [event.to_dict() if isinstance(event, Event) else event for event in events]
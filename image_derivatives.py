@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tạo ảnh thu nhỏ cho public/images
+- Mỗi ảnh gốc có thêm bản thumb (cạnh dài 320px) và medium (1280px), WebP nếu Pillow hỗ trợ, không thì JPEG
+- File nằm cạnh ảnh gốc: <tên gốc>.thumb.webp, <tên gốc>.medium.webp
+- Index ảnh đã làm nằm ở data/derivatives_index.json (không nằm trong public/ để web không phục vụ ra ngoài)
+- Chạy song song trên nhiều process; nội dung ảnh gốc đã có ảnh thu nhỏ thì chỉ hardlink sang tên mới
+Cần Pillow (pip install Pillow); chưa cài thì importer vẫn chạy, chỉ không tạo ảnh thu nhỏ
+"""
+
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import json_backend
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# (tên, cạnh dài tối đa, chất lượng nén)
+DERIVATIVE_SPECS = (
+    ("thumb", 320, 75),
+    ("medium", 1280, 82),
+)
+IMAGE_EXTENSIONS = frozenset([".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"])
+
+# File index hash nội dung ảnh gốc -> ảnh thu nhỏ đã tạo, nằm trong data/
+INDEX_FILE_NAME = "derivatives_index.json"
+# Vị trí cũ trong public/images: được đọc một lần rồi xóa
+LEGACY_INDEX_FILE_NAME = ".derivatives_index.json"
+# Bản 1 index theo đường dẫn ảnh gốc: không dùng lại được, bỏ qua
+INDEX_VERSION = 2
+
+def derivative_format():
+    """Định dạng ảnh thu nhỏ: WebP nếu bản Pillow đang cài hỗ trợ"""
+    if Image is None:
+        return None
+    return "WEBP" if features.check("webp") else "JPEG"
+
+def derivative_path(relative_path, name, image_format):
+    """/images/a/x.jpg -> /images/a/x.jpg.thumb.webp"""
+    extension = ".webp" if image_format == "WEBP" else ".jpg"
+    return f"{relative_path}.{name}{extension}"
+
+def is_derivative_name(file_name):
+    """Tên file có phải ảnh thu nhỏ do module này tạo không (x.jpg.thumb.webp, x.jpg.medium.jpg, ...)"""
+    stem, extension = os.path.splitext(file_name)
+    if extension.lower() not in (".webp", ".jpg"):
+        return False
+    return any(stem.endswith("." + name) for name, _, _ in DERIVATIVE_SPECS)
+
+def _source_digest(source_path):
+    """Hash nội dung ảnh gốc (cùng cách với ImageStore), dùng khi không có ImageStore"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def render_derivatives(source_path, targets, image_format):
+    """Tạo các ảnh thu nhỏ cho một ảnh gốc (chạy trong process con)
+
+    targets: [(tên, cạnh dài tối đa, chất lượng, đường dẫn đích)], trả về {tên: (rộng, cao)}
+    """
+    sizes = {}
+    with Image.open(source_path) as image:
+        # Xoay theo EXIF để ảnh thu nhỏ đúng chiều như ảnh gốc hiển thị
+        image = ImageOps.exif_transpose(image)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for name, max_side, quality, dest_path in targets:
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            tmp_path = dest_path + ".tmp"
+            try:
+                resized.save(tmp_path, format=image_format, quality=quality, optimize=True)
+                os.replace(tmp_path, dest_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            sizes[name] = resized.size
+    return sizes
+
+class DerivativeGenerator:
+    """Tạo ảnh thu nhỏ cho ảnh trong public/images, nhớ theo hash nội dung ảnh gốc để lần sau không tạo lại
+
+    Mỗi lần import ảnh gốc có tên mới (ImageStore hardlink nội dung đã có sang tên mới), nên index theo
+    hash nội dung chứ không theo đường dẫn: nội dung đã có ảnh thu nhỏ thì chỉ hardlink sang tên mới
+    """
+
+    def __init__(self, images_dir, index_file, workers=None, store=None):
+        self.images_dir = images_dir
+        self.public_dir = os.path.dirname(images_dir)
+        self.index_file = index_file
+        self.legacy_index_file = os.path.join(images_dir, LEGACY_INDEX_FILE_NAME)
+        self.workers = workers or os.cpu_count() or 1
+        # ImageStore cho biết hash nội dung của ảnh đã lưu (không phải đọc lại ảnh)
+        self.store = store
+        self.image_format = derivative_format()
+        self.stats = {"created": 0, "linked": 0, "skipped": 0, "failed": 0}
+        self._index = None
+        self._dirty = False
+
+    @property
+    def available(self):
+        return self.image_format is not None
+
+    def _abs_path(self, relative_path):
+        return os.path.join(self.public_dir, relative_path.lstrip("/"))
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        for index_file in (self.index_file, self.legacy_index_file):
+            if not os.path.exists(index_file):
+                continue
+            try:
+                data = json_backend.load(index_file)
+                if data.get("version") == INDEX_VERSION:
+                    self._index = data.get("images", {})
+                    # Index cũ trong public/images: chuyển sang data/ ở lần save
+                    self._dirty = index_file == self.legacy_index_file
+                    break
+            except Exception as e:
+                print(f"Lỗi khi đọc index ảnh thu nhỏ {index_file}: {e}")
+        return self._index
+
+    def _spec_key(self):
+        """Đổi kích thước/định dạng thì tạo lại toàn bộ"""
+        return self.image_format + ";" + ",".join(f"{name}:{side}:{quality}" for name, side, quality in DERIVATIVE_SPECS)
+
+    def _up_to_date(self, entry):
+        return (
+            entry is not None
+            and entry.get("spec") == self._spec_key()
+            and all(os.path.exists(self._abs_path(output["path"])) for output in entry["outputs"].values())
+        )
+
+    def _digest(self, relative_path):
+        """Hash nội dung ảnh gốc, None nếu không đọc được"""
+        try:
+            if self.store is not None:
+                return self.store.digest_of(relative_path)
+            return _source_digest(self._abs_path(relative_path))
+        except OSError:
+            return None
+
+    def _link_outputs(self, outputs, relative_path):
+        """Ảnh thu nhỏ đã có của cùng nội dung -> bản riêng (hardlink, không được thì copy) cho relative_path"""
+        linked = {}
+        for name, output in outputs.items():
+            path = derivative_path(relative_path, name, self.image_format)
+            if path != output["path"]:
+                dest_path = self._abs_path(path)
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                try:
+                    os.link(self._abs_path(output["path"]), dest_path)
+                except OSError:
+                    shutil.copy2(self._abs_path(output["path"]), dest_path)
+            linked[name] = dict(output, path=path)
+        return linked
+
+    def generate(self, relative_paths):
+        """Tạo ảnh thu nhỏ cho các ảnh /images/..., trả về {ảnh gốc: {tên: {path, width, height}}}"""
+        if not self.available:
+            return {}
+        index = self._load()
+        spec_key = self._spec_key()
+        results = {}
+        # hash nội dung -> (ảnh gốc được render, targets, các ảnh gốc khác cùng nội dung)
+        pending = {}
+        for relative_path in dict.fromkeys(relative_paths):
+            if os.path.splitext(relative_path)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            digest = self._digest(relative_path)
+            if digest is None:
+                continue
+            if digest in pending:
+                pending[digest][2].append(relative_path)
+                continue
+            entry = index.get(digest)
+            if self._up_to_date(entry):
+                try:
+                    results[relative_path] = self._link_outputs(entry["outputs"], relative_path)
+                except OSError as e:
+                    self.stats["failed"] += 1
+                    print(f"  ✗ Không dùng lại được ảnh thu nhỏ cho {relative_path}: {e}")
+                    continue
+                self.stats["skipped" if results[relative_path] == entry["outputs"] else "linked"] += 1
+                continue
+            targets = [
+                (name, side, quality, self._abs_path(derivative_path(relative_path, name, self.image_format)))
+                for name, side, quality in DERIVATIVE_SPECS
+            ]
+            pending[digest] = (relative_path, targets, [])
+
+        if not pending:
+            return results
+
+        print(f"Đang tạo ảnh thu nhỏ cho {len(pending)} ảnh ({self.workers} process)...")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                digest: executor.submit(render_derivatives, self._abs_path(relative_path), targets, self.image_format)
+                for digest, (relative_path, targets, _) in pending.items()
+            }
+            for digest, future in futures.items():
+                relative_path, _, same_content = pending[digest]
+                try:
+                    sizes = future.result()
+                except Exception as e:
+                    # Ảnh hỏng hoặc định dạng Pillow không đọc được: vẫn dùng ảnh gốc
+                    self.stats["failed"] += 1 + len(same_content)
+                    print(f"  ✗ Không tạo được ảnh thu nhỏ cho {relative_path}: {e}")
+                    continue
+                outputs = {
+                    name: {
+                        "path": derivative_path(relative_path, name, self.image_format),
+                        "width": sizes[name][0],
+                        "height": sizes[name][1],
+                    }
+                    for name, _, _ in DERIVATIVE_SPECS
+                }
+                index[digest] = {"spec": spec_key, "outputs": outputs}
+                self._dirty = True
+                self.stats["created"] += 1
+                results[relative_path] = outputs
+                for other_path in same_content:
+                    try:
+                        results[other_path] = self._link_outputs(outputs, other_path)
+                        self.stats["linked"] += 1
+                    except OSError as e:
+                        self.stats["failed"] += 1
+                        print(f"  ✗ Không dùng lại được ảnh thu nhỏ cho {other_path}: {e}")
+        return results
+
+    def save(self):
+        """Ghi index xuống đĩa nếu có thay đổi (và xóa index cũ trong public/images)"""
+        if not self._dirty or self._index is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+        json_backend.dump({"version": INDEX_VERSION, "images": self._index}, self.index_file, pretty=False)
+        if os.path.exists(self.legacy_index_file):
+            os.remove(self.legacy_index_file)
+        self._dirty = False
+
+def apply_derivatives(events, derivatives):
+    """Ghi đường dẫn ảnh thu nhỏ vào images của từng event (thumbnail, medium)"""
+    for event in events:
+        for img in event.get("images") or []:
+            outputs = derivatives.get(img.get("path"))
+            if not outputs:
+                continue
+            img["thumbnail"] = outputs["thumb"]["path"]
+            img["medium"] = outputs["medium"]["path"]
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kho ảnh định danh theo nội dung cho public/images
+Ảnh trùng nội dung chỉ lưu một bản trên đĩa: mỗi tham chiếu vẫn có tên file riêng
+(hardlink tới bản đã có), nên xóa hoặc di chuyển ảnh của một sự kiện không làm hỏng sự kiện khác
+Index hash -> đường dẫn nằm ở data/image_index.json, không nằm trong public/ để web không phục vụ ra ngoài
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+import json_backend
+from image_derivatives import is_derivative_name
+
+# File index hash -> đường dẫn gốc (canonical) của nội dung đó, nằm trong data/ (public/ thì web phục vụ ra ngoài)
+INDEX_FILE_NAME = "image_index.json"
+# Vị trí cũ trong public/images: được đọc một lần rồi xóa
+LEGACY_INDEX_FILE_NAME = ".image_index.json"
+INDEX_VERSION = 2
+# Bản 1 lưu danh sách mọi đường dẫn theo hash: vẫn đọc được, chỉ giữ đường dẫn đầu tiên
+LEGACY_INDEX_VERSIONS = (1,)
+# Kích thước mỗi lần đọc khi vừa hash vừa copy
+COPY_BLOCK_SIZE = 1 << 20
+
+def file_digest(file_path):
+    """Hash nội dung file (blake2b 128 bit, đọc theo từng khối)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def copy_and_digest(source_path, dest_path):
+    """Copy file và hash nội dung trong cùng một lượt đọc, trả về hash"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+        for block in iter(lambda: src.read(COPY_BLOCK_SIZE), b""):
+            digest.update(block)
+            dst.write(block)
+    shutil.copystat(source_path, dest_path)
+    return digest.hexdigest()
+
+class ImageStore:
+    """Lưu ảnh vào public/images, khử trùng lặp theo hash nội dung"""
+
+    def __init__(self, images_dir, index_file):
+        self.images_dir = images_dir
+        self.public_dir = os.path.dirname(images_dir)
+        self.index_file = index_file
+        self.legacy_index_file = os.path.join(images_dir, LEGACY_INDEX_FILE_NAME)
+        self._index = None
+        self._dirty = False
+        self.stats = {"copied": 0, "linked": 0}
+        # Đường dẫn /images/... -> hash nội dung, cho các ảnh đã lưu hoặc đã hash trong lần chạy này
+        self._digests = {}
+        # Lock chung cho index, lock riêng theo hash để hai luồng không cùng copy một nội dung
+        self._lock = threading.Lock()
+        self._digest_locks = {}
+
+    def _abs_path(self, relative_path):
+        """Đổi /images/... thành đường dẫn tuyệt đối"""
+        return os.path.join(self.public_dir, relative_path.lstrip("/"))
+
+    def _load(self):
+        """Đọc index; lần đầu chưa có thì hash toàn bộ ảnh đang có trong public/images"""
+        if self._index is not None:
+            return self._index
+        for index_file in (self.index_file, self.legacy_index_file):
+            if not os.path.exists(index_file):
+                continue
+            try:
+                data = json_backend.load(index_file)
+                version = data.get("version")
+                if version == INDEX_VERSION or version in LEGACY_INDEX_VERSIONS:
+                    images = data.get("images", {})
+                    if version != INDEX_VERSION:
+                        images = {digest: paths[0] for digest, paths in images.items() if paths}
+                    self._index = images
+                    # Index cũ (bản cũ hoặc nằm trong public/images): ghi lại vào data/ ở lần save
+                    self._dirty = version != INDEX_VERSION or index_file == self.legacy_index_file
+                    return self._index
+            except Exception as e:
+                print(f"Lỗi khi đọc index ảnh {index_file}: {e}")
+
+        print("Đang lập index nội dung cho ảnh có sẵn trong public/images...")
+        self._index = {}
+        if os.path.isdir(self.images_dir):
+            for root, dirs, files in os.walk(self.images_dir):
+                dirs.sort()
+                for name in sorted(files):
+                    # Bỏ file ẩn, file tạm và ảnh thu nhỏ (sinh ra từ ảnh gốc, không phải ảnh của event)
+                    if name.startswith(".") or name.endswith(".tmp") or is_derivative_name(name):
+                        continue
+                    full_path = os.path.join(root, name)
+                    relative_path = "/" + os.path.relpath(full_path, self.public_dir).replace(os.sep, "/")
+                    try:
+                        self._index.setdefault(file_digest(full_path), relative_path)
+                    except OSError as e:
+                        print(f"Lỗi khi đọc ảnh {full_path}: {e}")
+        self._dirty = True
+        return self._index
+
+    def _canonical_path(self, digest):
+        """Bản gốc của nội dung này nếu vẫn còn trên đĩa; bản đã bị xóa thì bỏ khỏi index"""
+        index = self._load()
+        path = index.get(digest)
+        if path is None:
+            return None
+        if not os.path.exists(self._abs_path(path)):
+            del index[digest]
+            self._dirty = True
+            return None
+        return path
+
+    def store(self, source_path, folder_name, file_name):
+        """Lưu ảnh vào public/images/folder_name, trả về đường dẫn /images/... thực sự dùng"""
+        with self._lock:
+            self._load()
+        dest_path = os.path.join(self.images_dir, folder_name, file_name)
+        # Đọc ảnh nguồn một lần: vừa hash vừa copy ra file tạm cạnh file đích
+        tmp_path = dest_path + ".tmp"
+        try:
+            digest = copy_and_digest(source_path, tmp_path)
+        except BaseException:
+            # Không để lại file copy dở
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            digest_lock = self._digest_locks.setdefault(digest, threading.Lock())
+
+        with digest_lock:
+            with self._lock:
+                canonical = self._canonical_path(digest)
+
+            linked = False
+            if canonical is not None:
+                try:
+                    os.link(self._abs_path(canonical), dest_path)
+                    linked = True
+                except OSError:
+                    # Khác ổ đĩa hoặc filesystem không hỗ trợ hardlink: dùng bản vừa copy
+                    linked = False
+            if linked:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, dest_path)
+
+            relative_path = f"/images/{folder_name}/{file_name}"
+            with self._lock:
+                self.stats["linked" if linked else "copied"] += 1
+                if canonical is None:
+                    self._index[digest] = relative_path
+                    self._dirty = True
+                self._digests[relative_path] = digest
+            return relative_path
+
+    def digest_of(self, relative_path):
+        """Hash nội dung của ảnh /images/...; ảnh vừa lưu thì không phải đọc lại"""
+        with self._lock:
+            digest = self._digests.get(relative_path)
+        if digest is None:
+            digest = file_digest(self._abs_path(relative_path))
+            with self._lock:
+                self._digests[relative_path] = digest
+        return digest
+
+    def save(self):
+        """Ghi index xuống đĩa nếu có thay đổi"""
+        with self._lock:
+            if not self._dirty or self._index is None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+            json_backend.dump({"version": INDEX_VERSION, "images": self._index}, self.index_file, pretty=False)
+            if os.path.exists(self.legacy_index_file):
+                os.remove(self.legacy_index_file)
+            self._dirty = False
@@ -5,92 +5,224 @@ Script để import sự kiện từ Facebook export vào Timeline
 Phân tích ngữ cảnh để chỉ chọn sự kiện thực sự liên quan đến mối quan hệ
 """
 
-import json
+import argparse
+import contextlib
+import hashlib
+import io
 import os
-import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-# Đường dẫn thư mục Facebook export
-FACEBOOK_DIR = "/Users/tuannguyen8888/Downloads/facebook-tuannguyen8888-30_11_2025-BPwDyk9R"
-
-# Tên vợ để nhận diện
-WIFE_NAMES = ["nương nương", "nuong nuong", "nuongnuong", "vợ yêu", "vo yeu", "em yêu", "em yeu"]
-
-# Tên con để nhận diện
-CHILDREN_NAMES = ["bee", "sam", "con trai", "con gái", "con gai", "son", "daughter"]
-
-# Từ khóa loại trừ (spam, quảng cáo)
-EXCLUDE_KEYWORDS = [
-    "vnreview", "lenovo", "vibe", "vob", "lvs", "ls", "lvx",  # Quảng cáo điện thoại
-    "đăng ký", "dang ky", "đăng ký thành công", "mã số", "ma so",  # Spam
-    "kết quả trúng thưởng", "ket qua trung thuong",  # Quảng cáo
-    "nhận quà", "nhan qua", "chương trình", "chuong trinh",  # Marketing
-    "voucher", "nhommua", "affiliate",  # Quảng cáo
-    "đề xuất", "de xuat",  # Facebook suggestions
-]
-
-# Từ khóa loại trừ người khác
-EXCLUDE_PEOPLE = [
-    "em trai", "em gái", "em gai", "em trai", "anh trai", "chị gái", "chi gai",
-    "brother", "sister", "bạn", "ban", "friend"
-]
-
-def parse_timestamp(ts):
-    """Chuyển timestamp thành datetime"""
-    try:
-        return datetime.fromtimestamp(ts)
-    except:
-        return None
+import json_backend
+from classification_cache import CACHE_FILE_NAME as CLASSIFICATION_CACHE_FILE, CachedVerdict, ClassificationCache
+from image_derivatives import INDEX_FILE_NAME as DERIVATIVES_INDEX_FILE, DerivativeGenerator, apply_derivatives
+from event_model import Event, to_dicts
+from image_store import INDEX_FILE_NAME as IMAGE_INDEX_FILE, ImageStore
+from media_analysis import INDEX_FILE_NAME as MEDIA_ANALYSIS_FILE, ImageHashIndex, MediaAnalyzer, capture_date
+from import_metrics import ImportMetrics, RunProfiler, build_report, print_report
+import messenger_source
+from post_classifier import (
+    Ruleset,
+    build_event_title,
+    fallback_title,
+    get_classifier,
+    get_ruleset,
+    get_title_builder,
+    set_ruleset,
+)
+from post_parsing import (
+    FACEBOOK_DIR,
+    FACEBOOK_DIRS_ENV,
+    default_sources,
+    extract_tags,
+    extract_text_from_post,
+    has_raw_media,
+    iter_posts_streaming,
+    load_posts,
+    parse_timestamp,
+    post_cache_key,
+)
+from timeline_dedup import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    DUPLICATE_ID,
+    DUPLICATE_KEY,
+    DedupIndex,
+    merge_candidate,
+)
+from timeline_search import update_search_index
+from timeline_storage import (
+    DEFAULT_CHANGE_HISTORY,
+    DEFAULT_COMPACT_THRESHOLD,
+    SHARD_GRANULARITIES,
+    ChangeFeed,
+    TimelineShards,
+    TimelineStore,
+    atomic_write_bytes,
+    change_feed_path_for,
+    shard_dir_for,
+)
 
-def fix_encoding(text):
-    """Sửa lỗi encoding Unicode"""
-    if not text:
-        return ""
-    try:
-        if isinstance(text, str):
-            return text.encode('latin1').decode('utf-8')
-    except:
-        pass
-    return text
-
-def extract_text_from_post(post_data):
-    """Trích xuất text từ post"""
-    text_parts = []
-    
-    # Lấy title
-    if post_data.get("title"):
-        title = fix_encoding(post_data["title"])
-        text_parts.append(title)
-    
-    # Lấy post content
-    if post_data.get("data"):
-        for item in post_data["data"]:
-            if isinstance(item, dict):
-                if item.get("post"):
-                    post_text = fix_encoding(item["post"])
-                    text_parts.append(post_text)
-    
-    # Lấy description từ media
-    if post_data.get("attachments"):
-        for attachment in post_data["attachments"]:
-            if attachment.get("data"):
-                for data_item in attachment["data"]:
-                    if isinstance(data_item, dict) and data_item.get("media"):
-                        desc = data_item["media"].get("description")
-                        if desc:
-                            text_parts.append(fix_encoding(desc))
+def _normalize_roots(roots):
+    """Một thư mục hoặc danh sách thư mục -> tuple đường dẫn tuyệt đối, bỏ trùng, giữ thứ tự"""
+    if isinstance(roots, str):
+        roots = [roots]
+    return tuple(dict.fromkeys(os.path.abspath(root) for root in roots))
+
+class MediaIndex:
+    """Index các file media trong một hoặc nhiều export (đường dẫn -> kích thước, mtime), dựng bằng một lần duyệt thư mục"""
+    
+    def __init__(self, roots):
+        self.roots = _normalize_roots(roots)
+        # Đường dẫn -> (kích thước, mtime_ns)
+        self._files = {}
+        # mtime của từng thư mục lúc duyệt, để biết index còn đúng không mà chỉ cần stat thư mục
+        self._dir_mtimes = {}
+        self._lock = threading.Lock()
+        self.stat_calls_avoided = 0
+        self._build()
+    
+    def _build(self):
+        """Duyệt cây thư mục một lần, bỏ qua file JSON dữ liệu"""
+        pending = list(self.roots)
+        while pending:
+            directory = pending.pop()
+            try:
+                self._dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file() and not entry.name.endswith(".json"):
+                            st = entry.stat()
+                            self._files[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError as e:
+                print(f"Lỗi khi duyệt thư mục {directory}: {e}")
+    
+    def __len__(self):
+        return len(self._files)
+    
+    def is_stale(self):
+        """Có thư mục nào đã thêm/xóa file kể từ lúc index không"""
+        for directory, mtime in list(self._dir_mtimes.items()):
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
     
-    return " ".join(text_parts)
+    def __getstate__(self):
+        # Lock không pickle được khi gửi index sang process con
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def covers(self, path):
+        """Đường dẫn có nằm trong cây thư mục đã index không"""
+        path = os.path.abspath(path)
+        return any(path.startswith(root + os.sep) for root in self.roots)
+    
+    def _count(self):
+        with self._lock:
+            self.stat_calls_avoided += 1
+    
+    def exists(self, path):
+        """Kiểm tra file có tồn tại mà không cần stat"""
+        self._count()
+        return os.path.abspath(path) in self._files
+    
+    def size(self, path):
+        """Kích thước file từ index, None nếu không có"""
+        self._count()
+        entry = self._files.get(os.path.abspath(path))
+        return entry[0] if entry is not None else None
+    
+    def stat(self, path):
+        """(kích thước, mtime_ns) từ index, None nếu không có"""
+        self._count()
+        return self._files.get(os.path.abspath(path))
+    
+    def add(self, path):
+        """Ghi nhận file do chính importer vừa tạo (trong cây đã index)"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            self._files[path] = (st.st_size, st.st_mtime_ns)
+            # Thư mục mới: mtime được ghi lại ở refresh()
+            self._dir_mtimes.setdefault(os.path.dirname(path), None)
+    
+    def refresh(self):
+        """Ghi lại mtime các thư mục sau khi importer tự thêm file, để lần sau index không bị coi là cũ"""
+        with self._lock:
+            for directory in list(self._dir_mtimes):
+                try:
+                    self._dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+                except OSError:
+                    del self._dir_mtimes[directory]
+
+# Index media dùng cho process hiện tại (process con nhận qua initializer)
+_media_index = None
+
+def set_media_index(index):
+    """Đặt index media dùng cho mọi kiểm tra tồn tại/kích thước file"""
+    global _media_index
+    _media_index = index
+
+def get_media_index():
+    """Index media đang dùng trong process hiện tại (None nếu không dùng)"""
+    return _media_index
+
+def load_media_index(roots):
+    """Index media của các export; dùng lại index hiện tại nếu cùng các thư mục và chưa có gì thay đổi"""
+    current = _media_index
+    if current is not None and current.roots == _normalize_roots(roots) and not current.is_stale():
+        # Số stat tránh được tính riêng cho từng lần import
+        current.stat_calls_avoided = 0
+        return current, False
+    return MediaIndex(roots), True
+
+# Index ảnh trong public/images (ảnh của event đã có), worker giữ lại giữa các lần import
+_timeline_media_index = None
+
+def load_timeline_media_index(images_dir):
+    """Index ảnh trong public/images; dùng lại index hiện tại nếu chưa có ảnh nào bị thêm/xóa từ bên ngoài"""
+    global _timeline_media_index
+    current = _timeline_media_index
+    if current is not None and current.roots == _normalize_roots(images_dir) and not current.is_stale():
+        current.stat_calls_avoided = 0
+        return current, False
+    os.makedirs(images_dir, exist_ok=True)
+    _timeline_media_index = MediaIndex(images_dir)
+    return _timeline_media_index, True
 
-def extract_tags(post_data):
-    """Trích xuất tags từ post"""
-    tags = []
-    if post_data.get("tags"):
-        for tag in post_data["tags"]:
-            if isinstance(tag, dict) and tag.get("name"):
-                tags.append(fix_encoding(tag["name"]).lower())
-    return tags
+def media_exists(path):
+    """os.path.exists nhưng tra index nếu file nằm trong export đã index"""
+    if _media_index is not None and _media_index.covers(path):
+        return _media_index.exists(path)
+    return os.path.exists(path)
+
+def media_size(path):
+    """os.path.getsize nhưng tra index nếu file nằm trong export đã index"""
+    if _media_index is not None and _media_index.covers(path):
+        size = _media_index.size(path)
+        if size is not None:
+            return size
+    return os.path.getsize(path)
+
+def media_stat_calls_avoided():
+    """Số lần stat đã tránh được nhờ index trong process hiện tại"""
+    return _media_index.stat_calls_avoided if _media_index is not None else 0
 
 def extract_media_from_post(post_data, base_dir):
     """Trích xuất đường dẫn ảnh từ post"""
@@ -104,395 +236,382 @@ def extract_media_from_post(post_data, base_dir):
                         media_uri = data_item["media"].get("uri")
                         if media_uri:
                             full_path = os.path.join(base_dir, media_uri)
-                            if os.path.exists(full_path):
+                            if media_exists(full_path):
                                 media_paths.append(full_path)
     
     return media_paths
 
-def is_spam_or_advertisement(text):
-    """Kiểm tra xem post có phải spam/quảng cáo không"""
-    if not text:
-        return False
-    text_lower = text.lower()
-    
-    # Kiểm tra từ khóa loại trừ
-    for keyword in EXCLUDE_KEYWORDS:
-        if keyword in text_lower:
-            return True
-    
-    # Kiểm tra có link quảng cáo không
-    if "http" in text_lower or "www." in text_lower:
-        # Nếu có link + từ khóa quảng cáo thì là spam
-        ad_indicators = ["đăng ký", "mã số", "trúng thưởng", "nhận quà"]
-        if any(indicator in text_lower for indicator in ad_indicators):
-            return True
-    
-    return False
+# Số liệu đo đạc của process hiện tại (process con có bản riêng, gộp lại ở process chính)
+_metrics = ImportMetrics()
 
-def is_about_other_people(text):
-    """Kiểm tra xem post có về người khác (không phải vợ) không"""
-    if not text:
-        return False
-    text_lower = text.lower()
-    
-    # Kiểm tra từ khóa về người khác
-    for keyword in EXCLUDE_PEOPLE:
-        if keyword in text_lower:
-            # Nhưng nếu có mention vợ cùng lúc thì vẫn OK
-            if not any(wife_name in text_lower for wife_name in WIFE_NAMES):
-                return True
-    
-    return False
+def set_metrics(metrics):
+    """Đặt nơi ghi số liệu đo đạc cho process hiện tại"""
+    global _metrics
+    _metrics = metrics
 
-def is_about_wife(text, tags):
-    """Kiểm tra xem post có về vợ không"""
-    if not text:
-        return False
-    
-    text_lower = text.lower()
-    
-    # Kiểm tra tags trước (chính xác nhất)
-    for tag in tags:
-        if any(wife_name in tag for wife_name in WIFE_NAMES):
-            return True
-    
-    # Kiểm tra trong text
-    # Pattern 1: "vợ yêu", "em yêu", "Nương Nương"
-    wife_patterns = [
-        r"vợ\s+yêu", r"vo\s+yeu",
-        r"em\s+yêu", r"em\s+yeu",
-        r"nương\s+nương", r"nuong\s+nuong",
-        r"cùng\s+với\s+nương", r"cung\s+voi\s+nuong",
-        r"với\s+nương", r"voi\s+nuong",
-        r"vợ\s+@", r"vo\s+@",
-    ]
-    
-    for pattern in wife_patterns:
-        if re.search(pattern, text_lower):
-            return True
-    
-    # Pattern 2: "chúc mừng sinh nhật vợ", "happy birthday vợ"
-    birthday_patterns = [
-        r"chúc\s+mừng\s+sinh\s+nhật\s+vợ", r"chuc\s+munng\s+sinh\s+nhat\s+vo",
-        r"happy\s+birthday\s+.*vợ", r"happy\s+birthday\s+.*vo",
-        r"sinh\s+nhật\s+vợ", r"sinh\s+nhat\s+vo",
-    ]
-    
-    for pattern in birthday_patterns:
-        if re.search(pattern, text_lower):
-            return True
-    
-    # Pattern 3: "cùng vợ", "với vợ", "ăn tối cùng vợ"
-    together_patterns = [
-        r"cùng\s+vợ", r"cung\s+vo",
-        r"với\s+vợ", r"voi\s+vo",
-        r"ăn\s+tối\s+cùng\s+vợ", r"an\s+toi\s+cung\s+vo",
-        r"đi\s+chơi\s+với\s+vợ", r"di\s+choi\s+voi\s+vo",
-    ]
-    
-    for pattern in together_patterns:
-        if re.search(pattern, text_lower):
-            return True
-    
-    return False
+def get_metrics():
+    """Số liệu đo đạc của process hiện tại"""
+    return _metrics
 
-def is_about_children(text, tags):
-    """Kiểm tra xem post có về con (Bee, Sam) không"""
-    if not text:
-        return False
-    
-    text_lower = text.lower()
-    
-    # Kiểm tra tags trước
-    for tag in tags:
-        tag_lower = tag.lower()
-        if any(child_name in tag_lower for child_name in CHILDREN_NAMES):
-            return True
-    
-    # Kiểm tra trong text - tìm "Bee", "Sam", "con trai", "con gái"
-    children_patterns = [
-        r"\bbee\b",
-        r"\bsam\b",
-        r"con\s+trai",
-        r"con\s+gái", r"con\s+gai",
-        r"ku\s+bee", r"ku\s+sam",
-        r"bé\s+bee", r"bé\s+sam",
-    ]
-    
-    for pattern in children_patterns:
-        if re.search(pattern, text_lower):
-            return True
-    
-    return False
+# Post đã qua bộ lọc, đủ dữ liệu để dựng event
+# verdict là PostVerdict, hoặc CachedVerdict (đã có title) khi lấy từ cache phân loại
+ScreenedPost = namedtuple(
+    "ScreenedPost", ["timestamp", "dt", "text", "tags", "verdict", "media_paths", "cache_key"]
+)
 
-def is_significant_event(text):
-    """Đánh giá xem đây có phải sự kiện quan trọng không"""
-    if not text:
-        return False
-    
-    text_lower = text.lower()
-    
-    # Các từ khóa chỉ sự kiện quan trọng
-    significant_keywords = [
-        "cưới", "cuoi", "wedding", "kết hôn", "ket hon",
-        "đính hôn", "dinh hon", "engagement",
-        "sinh", "birth", "mang thai", "pregnancy",
-        "kỷ niệm", "ky niem", "anniversary",
-        "du lịch", "du lich", "travel", "trip",
-        "chúc mừng sinh nhật", "happy birthday",
-        "đầy tháng", "day thang", "tròn 1 tháng", "tron 1 thang", "full month",
-        "tạm biệt", "tam biet", "goodbye",
-        "ăn tối", "an toi", "dinner",
-        "check in", "checkin",
-    ]
-    
-    return any(keyword in text_lower for keyword in significant_keywords)
-
-def determine_event_type(text, tags):
-    """Xác định loại sự kiện dựa trên nội dung"""
-    text_lower = text.lower()
-    
-    # Kiểm tra sự kiện về con trước (đầy tháng, sinh nhật con)
-    if any(word in text_lower for word in ["đầy tháng", "day thang", "tròn 1 tháng", "tron 1 thang", "full month", "tròn 1 thang"]):
-        # Nếu có mention con (Bee, Sam) thì là family-event
-        if is_about_children(text, tags):
-            return "family-event"
-        return "birth"  # Nếu không rõ thì để birth
-    
-    if any(word in text_lower for word in ["cưới", "cuoi", "wedding", "kết hôn", "ket hon"]):
-        return "wedding"
-    elif any(word in text_lower for word in ["đính hôn", "dinh hon", "engagement"]):
-        return "engagement"
-    elif any(word in text_lower for word in ["sinh", "birth"]):
-        return "birth"
-    elif any(word in text_lower for word in ["mang thai", "pregnancy"]):
-        return "pregnancy"
-    elif any(word in text_lower for word in ["du lịch", "du lich", "travel", "trip", "đi chơi"]):
-        return "travel"
-    elif any(word in text_lower for word in ["kỷ niệm", "ky niem", "anniversary"]):
-        return "anniversary"
-    elif any(word in text_lower for word in ["chúc mừng sinh nhật", "happy birthday", "sinh nhật"]):
-        return "birth"
-    elif any(word in text_lower for word in ["nhận lời yêu", "nhan loi yeu", "chấp nhận yêu", "chap nhan yeu", "đồng ý yêu", "dong y yeu"]):
-        return "confess-love"
-    elif any(word in text_lower for word in ["ăn tối", "an toi", "dinner", "check in"]):
-        return "dating"
-    elif any(word in text_lower for word in ["hẹn hò", "hen ho", "dating"]):
-        return "dating"
-    elif any(word in text_lower for word in ["gặp", "gap", "meet", "lần đầu"]):
-        return "first-meet"
-    else:
-        return "other"
+def screen_post(post, base_dir=None):
+    """Lọc một post qua các bước phân loại, trả về ScreenedPost hoặc None nếu bị loại"""
+    with _metrics.stage("classify"):
+        screened, reason = _screen_post(post, base_dir)
+    _metrics.count(f"rejected.{reason}" if screened is None else "posts.screened")
+    return screened
 
-def process_posts_file(file_path):
-    """Xử lý file posts JSON với phân tích ngữ cảnh"""
+class _Screening:
+    """Trạng thái của một post khi đi qua các bước lọc"""
+
+    __slots__ = ("post", "base_dir", "timestamp", "dt", "text", "tags", "verdict", "media_paths", "cache_key")
+
+    def __init__(self, post, base_dir):
+        self.post = post
+        self.base_dir = base_dir
+        self.timestamp = self.dt = self.text = self.tags = self.verdict = self.media_paths = None
+        self.cache_key = None
+
+def _filter_timestamp(screening):
+    """Timestamp hợp lệ và từ năm 2015 trở đi"""
+    timestamp = screening.post.get("timestamp")
+    if not timestamp:
+        return "invalid"
+    dt = parse_timestamp(timestamp)
+    if not dt:
+        return "invalid"
+    # Chỉ lấy từ 2015 đến hiện tại
+    if dt.year < 2015:
+        return "too-old"
+    screening.timestamp, screening.dt = timestamp, dt
+    return None
+
+def _filter_anchor(screening):
+    """Lọc thô trên chuỗi gốc: không có chuỗi neo nào về vợ/con thì chắc chắn không liên quan"""
+    if not get_classifier().may_be_relevant(screening.post):
+        return "not-relevant"
+    return None
+
+def _filter_classify(screening):
+    """Phân loại đầy đủ: spam, liên quan tới vợ/con, về người khác (tra cache phân loại trước nếu có)"""
+    cache = _classification_cache
+    if cache is not None:
+        screening.cache_key = post_cache_key(screening.post)
+        cached = cache.get(screening.cache_key)
+        if cached is not None and cached.reason is not None:
+            _metrics.count("classify_cache.hits")
+            return cached.reason
+        if cached is not None and cached.title is not None:
+            # Post được chấp nhận: vẫn cần text (mô tả event) và tags, nhưng không phải phân loại lại
+            _metrics.count("classify_cache.hits")
+            screening.text = extract_text_from_post(screening.post)
+            screening.tags = extract_tags(screening.post)
+            screening.verdict = cached
+            return None
+        # Chưa có dòng, hoặc dòng chưa đủ để bỏ qua phân loại (chưa có title): phải phân loại lại
+        _metrics.count("classify_cache.misses")
+
+    # Trích xuất text và tags, quét text một lần để có mọi kết luận phân loại
+    screening.text = extract_text_from_post(screening.post)
+    screening.tags = extract_tags(screening.post)
+    verdict = screening.verdict = get_classifier().classify(screening.text, screening.tags)
+    reason = _classify_reason(verdict)
+    if cache is not None:
+        cache.put(
+            screening.cache_key,
+            CachedVerdict(reason, verdict.significant, verdict.children, verdict.event_type),
+        )
+    return reason
+
+def _classify_reason(verdict):
+    """Lý do post bị loại theo kết luận phân loại, None nếu được giữ"""
+    # BƯỚC 1: Loại bỏ spam/quảng cáo
+    if verdict.spam:
+        return "spam"
+
+    # BƯỚC 2: Kiểm tra có về vợ HOẶC về con (Bee, Sam) không
+    if not verdict.wife and not verdict.children:
+        return "not-relevant"
+
+    # BƯỚC 3: Loại bỏ posts về người khác
+    if verdict.other_people:
+        return "other-people"
+    return None
+
+def _filter_media(screening):
+    """Ưu tiên sự kiện quan trọng hoặc có ảnh (chỉ stat file media cho post còn lại tới đây)"""
+    screening.media_paths = extract_media_from_post(screening.post, screening.base_dir or FACEBOOK_DIR)
+    has_media = len(screening.media_paths) > 0
+
+    # Nếu không phải sự kiện quan trọng và không có ảnh, có thể bỏ qua
+    if not screening.verdict.significant and not has_media:
+        # Chỉ giữ lại nếu có tag "Nương Nương" (chắc chắn liên quan) hoặc về con
+        if not any("nuong" in tag for tag in screening.tags) and not screening.verdict.children:
+            # Post không trỏ tới file media nào thì kết luận chỉ phụ thuộc nội dung đã hash trong key:
+            # cache luôn lý do loại để lần sau không phải phân loại lại. Post có media nhưng file thiếu
+            # thì kết luận còn phụ thuộc đĩa nên không cache
+            cache = _classification_cache
+            if (cache is not None and screening.cache_key is not None
+                    and not isinstance(screening.verdict, CachedVerdict)
+                    and not has_raw_media(screening.post)):
+                cache.set_reason(screening.cache_key, "not-significant")
+            return "not-significant"
+    return None
+
+# (tên, hàm lọc, các bước phải chạy trước, bước mà nó lọc thô giúp)
+# Bước lọc thô chỉ loại những post mà bước kia chắc chắn cũng loại, nên có thể bỏ qua khi không có lợi
+FILTER_STAGES = (
+    ("timestamp", _filter_timestamp, (), None),
+    ("anchor", _filter_anchor, (), "classify"),
+    ("classify", _filter_classify, (), None),
+    ("media", _filter_media, ("classify",), None),
+)
+FILTER_STAGE_NAMES = tuple(stage[0] for stage in FILTER_STAGES)
+# Cứ bao nhiêu post thì đo thời gian một post (chạy đủ mọi bước kể cả bước lọc thô đang tắt)
+FILTER_SAMPLE_INTERVAL = 16
+# Số post giữa hai lần sắp xếp lại thứ tự lọc (chế độ tự động)
+FILTER_REORDER_INTERVAL = 512
+
+def validate_filter_order(names):
+    """Kiểm tra thứ tự lọc do người dùng chọn: đủ mọi bước, mỗi bước một lần, đúng phụ thuộc"""
+    if sorted(names) != sorted(FILTER_STAGE_NAMES):
+        raise ValueError(f"thứ tự lọc phải gồm đúng các bước: {', '.join(FILTER_STAGE_NAMES)}")
+    placed = set()
+    for name in names:
+        requires = next(stage[2] for stage in FILTER_STAGES if stage[0] == name)
+        missing = [required for required in requires if required not in placed]
+        if missing:
+            raise ValueError(f"bước {name} phải chạy sau {', '.join(missing)}")
+        placed.add(name)
+
+class FilterPipeline:
+    """Chạy các bước lọc post theo thứ tự, bước rẻ và loại nhiều chạy trước
+
+    order=None: tự sắp xếp lại theo số liệu đo được (thời gian trên mỗi post / tỉ lệ bị loại) và tắt bước
+    lọc thô khi nó tốn hơn phần nó tiết kiệm được; luôn giữ đúng phụ thuộc giữa các bước.
+    Thứ tự lọc không đổi kết quả, chỉ đổi bước ghi nhận lý do loại
+    """
+
+    def __init__(self, order=None):
+        self.adaptive = order is None
+        if order is not None:
+            validate_filter_order(order)
+        stages = {stage[0]: stage for stage in FILTER_STAGES}
+        # Mọi bước (dùng cho post được đo) và các bước đang bật
+        self._all_stages = [stages[name] for name in (order or FILTER_STAGE_NAMES)]
+        self._stages = list(self._all_stages)
+        # tên bước -> [số post đi vào, số post qua, số post được đo, tổng thời gian đo được]
+        self.stats = {name: [0, 0, 0, 0.0] for name in FILTER_STAGE_NAMES}
+        self._reported = {name: [0, 0, 0, 0.0] for name in FILTER_STAGE_NAMES}
+        self._until_sample = 1
+        self._until_reorder = FILTER_REORDER_INTERVAL
+
+    @property
+    def order(self):
+        """Thứ tự các bước đang bật"""
+        return [stage[0] for stage in self._stages]
+
+    def screen(self, post, base_dir):
+        """Trả về (ScreenedPost, None) hoặc (None, lý do bị loại)"""
+        if not isinstance(post, dict):
+            return None, "invalid"
+        screening = _Screening(post, base_dir)
+        stats = self.stats
+        reason = None
+        self._until_sample -= 1
+        if self._until_sample:
+            for stage in self._stages:
+                stage_stats = stats[stage[0]]
+                stage_stats[0] += 1
+                reason = stage[1](screening)
+                if reason is not None:
+                    break
+                stage_stats[1] += 1
+        else:
+            self._until_sample = FILTER_SAMPLE_INTERVAL
+            for stage in self._all_stages:
+                stage_stats = stats[stage[0]]
+                started = time.perf_counter()
+                reason = stage[1](screening)
+                stage_stats[3] += time.perf_counter() - started
+                stage_stats[2] += 1
+                stage_stats[0] += 1
+                if reason is not None:
+                    break
+                stage_stats[1] += 1
+        if self.adaptive:
+            self._until_reorder -= 1
+            if not self._until_reorder:
+                self._until_reorder = FILTER_REORDER_INTERVAL
+                self.reorder()
+        if reason is not None:
+            return None, reason
+        return ScreenedPost(
+            screening.timestamp, screening.dt, screening.text, screening.tags,
+            screening.verdict, screening.media_paths, screening.cache_key,
+        ), None
+
+    def _cost(self, name):
+        """Thời gian trung bình trên mỗi post của một bước"""
+        _, _, timed, seconds = self.stats[name]
+        return seconds / timed if timed else 0.0
+
+    def _rejection_rate(self, name):
+        seen, passed, _, _ = self.stats[name]
+        return (seen - passed) / seen if seen else 0.0
+
+    def _rank(self, name):
+        """Chi phí trên mỗi post chia cho tỉ lệ bị loại: nhỏ hơn thì nên chạy trước"""
+        return self._cost(name) / max(self._rejection_rate(name), 1e-6)
+
+    def reorder(self):
+        """Sắp xếp lại các bước theo _rank, bật/tắt bước lọc thô theo lợi ích đo được"""
+        remaining = sorted(self._all_stages, key=lambda stage: self._rank(stage[0]))
+        placed, order = set(), []
+        while remaining:
+            # Bước lọc thô phải đứng trước bước mà nó lọc giúp, nếu không thì vô ích
+            stage = next(
+                stage for stage in remaining
+                if all(required in placed for required in stage[2])
+                and all(other[0] in placed for other in remaining if other[3] == stage[0])
+            )
+            remaining.remove(stage)
+            placed.add(stage[0])
+            order.append(stage)
+        self._all_stages = order
+        self._stages = [
+            stage for stage in order
+            if stage[3] is None or self._rejection_rate(stage[0]) * self._cost(stage[3]) >= self._cost(stage[0])
+        ]
+
+    def report(self, metrics):
+        """Cộng phần số liệu chưa báo vào metrics: filter.<bước>.seen/.passed và thời gian ước tính"""
+        for name in FILTER_STAGE_NAMES:
+            current, reported = self.stats[name], self._reported[name]
+            seen = current[0] - reported[0]
+            if not seen:
+                continue
+            metrics.count(f"filter.{name}.seen", seen)
+            metrics.count(f"filter.{name}.passed", current[1] - reported[1])
+            metrics.add_time(f"filter.{name}", self._cost(name) * seen, seen)
+            self._reported[name] = list(current)
+
+_filter_pipeline = None
+
+def set_filter_order(order=None):
+    """Chọn thứ tự lọc cho process hiện tại (None: tự sắp xếp theo số liệu)"""
+    global _filter_pipeline
+    _filter_pipeline = FilterPipeline(order)
+
+def get_filter_pipeline():
+    """Pipeline lọc dùng chung cho process hiện tại"""
+    global _filter_pipeline
+    if _filter_pipeline is None:
+        _filter_pipeline = FilterPipeline()
+    return _filter_pipeline
+
+def _screen_post(post, base_dir):
+    """Như screen_post nhưng trả về (ScreenedPost, None) hoặc (None, lý do bị loại)"""
+    return get_filter_pipeline().screen(post, base_dir)
+
+_classification_cache = None
+
+def set_classification_cache(cache):
+    """Đặt cache phân loại cho process hiện tại (None để tắt)"""
+    global _classification_cache
+    _classification_cache = cache
+
+def get_classification_cache():
+    return _classification_cache
+
+def build_event_from_post(post, base_dir=None):
+    """Phân tích một post, trả về event cho timeline hoặc None nếu bị loại"""
+    screened = screen_post(post, base_dir)
+    if screened is None:
+        return None
+    if isinstance(screened.verdict, CachedVerdict):
+        return event_from_screened(screened, screened.verdict.title)
+    with _metrics.stage("title"):
+        title = build_event_title(screened.text, screened.verdict, screened.dt)
+    if _classification_cache is not None and screened.cache_key is not None:
+        _classification_cache.set_title(screened.cache_key, title)
+    return event_from_screened(screened, title)
+
+def event_from_screened(screened, title):
+    """Dựng event cho timeline từ post đã qua bộ lọc"""
+    timestamp, dt, text = screened.timestamp, screened.dt, screened.text
+    media_paths = screened.media_paths
+    event = Event(timestamp, dt, screened.verdict.event_type, title, text)
+    # Thêm ảnh nếu có (đường dẫn gốc, sẽ copy sau)
+    for media_path in media_paths[:10]:
+        event.add_image(os.path.basename(media_path), media_path)
+    return event
+
+def _process_posts_file(file_path, stream, base_dir, on_event=None):
+    """Xử lý một file posts, trả về (events, ok); ok=False nếu file bị lỗi giữa chừng"""
     events = []
     
     print(f"Đang đọc file: {file_path}")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Xử lý cả array và object
-        if isinstance(data, list):
-            posts = data
-        elif isinstance(data, dict):
-            posts = data.get("posts", data.get("data", []))
-            if not isinstance(posts, list):
-                posts = [data]
+        # Không dùng repair=True: sửa encoding mọi chuỗi lúc parse chậm hơn sửa từng trường khi trích xuất
+        # (benchmark_import.py --repair-on-parse), và làm đổi post_cache_key của cache phân loại
+        if stream:
+            # Đọc từng post một, bộ nhớ không phụ thuộc kích thước file
+            posts = _metrics.timed_iter("parse", iter_posts_streaming(file_path))
         else:
-            posts = []
-        
-        print(f"Tìm thấy {len(posts)} posts")
+            with _metrics.stage("parse"):
+                posts = load_posts(file_path)
+            print(f"Tìm thấy {len(posts)} posts")
         
+        post_count = 0
         for post in posts:
-            if not isinstance(post, dict):
+            post_count += 1
+            _metrics.count("posts.read")
+            event = build_event_from_post(post, base_dir)
+            if event is None:
                 continue
             
-            # Lấy timestamp
-            timestamp = post.get("timestamp")
-            if not timestamp:
-                continue
-            
-            dt = parse_timestamp(timestamp)
-            if not dt:
-                continue
-            
-            # Chỉ lấy từ 2015 đến hiện tại
-            if dt.year < 2015:
-                continue
-            
-            # Trích xuất text và tags
-            text = extract_text_from_post(post)
-            tags = extract_tags(post)
-            
-            # BƯỚC 1: Loại bỏ spam/quảng cáo
-            if is_spam_or_advertisement(text):
-                continue
-            
-            # BƯỚC 2: Kiểm tra có về vợ HOẶC về con (Bee, Sam) không
-            is_wife_related = is_about_wife(text, tags)
-            is_children_related = is_about_children(text, tags)
-            
-            if not is_wife_related and not is_children_related:
-                continue
-            
-            # BƯỚC 3: Loại bỏ posts về người khác
-            if is_about_other_people(text):
-                continue
-            
-            # BƯỚC 4: Ưu tiên sự kiện quan trọng hoặc có ảnh
-            media_paths = extract_media_from_post(post, FACEBOOK_DIR)
-            has_media = len(media_paths) > 0
-            
-            # Nếu không phải sự kiện quan trọng và không có ảnh, có thể bỏ qua
-            if not is_significant_event(text) and not has_media:
-                # Chỉ giữ lại nếu có tag "Nương Nương" (chắc chắn liên quan) hoặc về con
-                if not any("nuong" in tag for tag in tags) and not is_children_related:
-                    continue
-            
-            # Xác định loại sự kiện
-            event_type = determine_event_type(text, tags)
-            
-            # Tạo title ngắn gọn và có ý nghĩa từ nội dung
-            title = text[:200] if text else ""
-            
-            # Loại bỏ các phần không cần thiết
-            title = re.sub(r"Võ Tuấn Nguyên đã.*?\.", "", title, flags=re.IGNORECASE)
-            title = re.sub(r"đã thêm.*?ảnh", "", title, flags=re.IGNORECASE)
-            title = re.sub(r"đã chia sẻ.*?\.", "", title, flags=re.IGNORECASE)
-            title = re.sub(r"đã đăng.*?\.", "", title, flags=re.IGNORECASE)
-            title = re.sub(r"đang.*?\.", "", title, flags=re.IGNORECASE)
-            
-            # Nếu là sự kiện về con (đầy tháng, sinh nhật), tạo title rõ ràng hơn
-            if is_children_related:
-                desc_lower = text.lower()
-                if "đầy tháng" in desc_lower or "day thang" in desc_lower or "tròn 1 tháng" in desc_lower or "tron 1 thang" in desc_lower:
-                    if "bee" in desc_lower:
-                        title = "Đầy tháng con trai (Bee)"
-                    elif "sam" in desc_lower:
-                        title = "Đầy tháng con gái (Sam)"
-                    else:
-                        title = "Đầy tháng con"
-                elif "sinh nhật" in desc_lower or "birthday" in desc_lower:
-                    if "bee" in desc_lower:
-                        title = "Sinh nhật con trai (Bee)"
-                    elif "sam" in desc_lower:
-                        title = "Sinh nhật con gái (Sam)"
-                    else:
-                        title = "Sinh nhật con"
-            title = title.strip()
-            
-            # Nếu title quá ngắn hoặc không có ý nghĩa, tạo từ description
-            if len(title) < 10 or title.lower() in ["checkin", "check in", "sự kiện"]:
-                # Tìm phần quan trọng trong description
-                desc_lower = text.lower()
-                
-                # Kiểm tra sự kiện về con trước
-                if is_children_related:
-                    if "đầy tháng" in desc_lower or "day thang" in desc_lower or "tròn 1 tháng" in desc_lower or "tron 1 thang" in desc_lower:
-                        if "bee" in desc_lower:
-                            title = "Đầy tháng con trai (Bee)"
-                        elif "sam" in desc_lower:
-                            title = "Đầy tháng con gái (Sam)"
-                        else:
-                            title = "Đầy tháng con"
-                    elif "sinh nhật" in desc_lower or "birthday" in desc_lower:
-                        if "bee" in desc_lower:
-                            title = "Sinh nhật con trai (Bee)"
-                        elif "sam" in desc_lower:
-                            title = "Sinh nhật con gái (Sam)"
-                        else:
-                            title = "Sinh nhật con"
-                    else:
-                        # Lấy câu đầu tiên có mention Bee/Sam
-                        sentences = re.split(r'[.!?\n]', text)
-                        for sentence in sentences:
-                            sentence = sentence.strip()
-                            if len(sentence) > 10 and any(child_name in sentence.lower() for child_name in CHILDREN_NAMES):
-                                title = sentence[:80]
-                                break
-                # Kiểm tra sự kiện về vợ
-                elif "chúc mừng sinh nhật" in desc_lower or "happy birthday" in desc_lower:
-                    title = "Chúc mừng sinh nhật vợ yêu"
-                elif "cùng" in desc_lower and "vợ" in desc_lower:
-                    title = "Cùng vợ đi chơi"
-                elif "ăn tối" in desc_lower:
-                    title = "Ăn tối cùng vợ"
-                elif "du lịch" in desc_lower or "travel" in desc_lower:
-                    title = "Du lịch cùng vợ"
-                elif "kỷ niệm" in desc_lower or "anniversary" in desc_lower:
-                    title = "Kỷ niệm với vợ"
-                else:
-                    # Lấy câu đầu tiên có ý nghĩa
-                    sentences = re.split(r'[.!?\n]', text)
-                    for sentence in sentences:
-                        sentence = sentence.strip()
-                        if len(sentence) > 15 and any(wife_name in sentence.lower() for wife_name in WIFE_NAMES):
-                            title = sentence[:80]
-                            break
-                    
-                    if not title or len(title) < 10:
-                        if is_children_related:
-                            title = f"Sự kiện về con - {format_date_for_timeline(dt)}"
-                        else:
-                            title = f"Sự kiện với vợ - {format_date_for_timeline(dt)}"
-            
-            # Giới hạn độ dài
-            if len(title) > 100:
-                title = title[:97] + "..."
-            
-            # Tạo event
-            event = {
-                "id": int(timestamp * 1000),
-                "date": format_date_for_timeline(dt),
-                "dateParsed": {
-                    "original": format_date_for_timeline(dt),
-                    "date": dt.isoformat(),
-                    "year": dt.year,
-                    "month": dt.month,
-                    "day": dt.day,
-                    "format": "DD/MM/YYYY"
-                },
-                "type": event_type,
-                "title": title[:100],
-                "description": text,
-                "location": "",
-                "witnesses": "",
-                "documents": "",
-                "images": []
-            }
-            
-            # Thêm ảnh nếu có (sẽ copy sau)
-            for i, media_path in enumerate(media_paths[:10]):
-                event["images"].append({
-                    "id": int(timestamp * 1000) + i,
-                    "name": os.path.basename(media_path),
-                    "path": media_path,  # Đường dẫn gốc, sẽ copy sau
-                    "type": "image/jpeg"
-                })
-            
             events.append(event)
-            print(f"  ✓ {format_date_for_timeline(dt)} - {event_type} - {title[:50]}...")
+            print(f"  ✓ {event.date} - {event.type} - {event.title[:50]}...")
+            if on_event is not None:
+                on_event(event)
+        
+        if stream:
+            print(f"Đã duyệt {post_count} posts")
     
     except Exception as e:
         print(f"Lỗi khi đọc file {file_path}: {e}")
-        import traceback
         traceback.print_exc()
+        _metrics.count("files.failed")
+        return events, False
+    finally:
+        # Số post đi vào/qua từng bước lọc của file này
+        get_filter_pipeline().report(_metrics)
+        if _classification_cache is not None:
+            _classification_cache.flush()
     
+    _metrics.count("files.scanned")
+    return events, True
+
+def process_posts_file(file_path, stream=False, base_dir=None):
+    """Xử lý file posts JSON với phân tích ngữ cảnh"""
+    events, _ = _process_posts_file(file_path, stream, base_dir)
     return events
 
-def format_date_for_timeline(dt):
-    """Format date cho timeline (DD/MM/YYYY)"""
-    if not dt:
-        return None
-    return dt.strftime("%d/%m/%Y")
+# Tên file đích đã được giữ chỗ trong lần chạy này
+_reserved_names = set()
+_reserved_names_lock = threading.Lock()
 
-def copy_image_to_public(source_path, event_date, event_type, base_dir):
+def copy_image_to_public(source_path, event_date, event_type, base_dir, store=None):
     """Copy ảnh vào public/images theo định dạng YYYY-MM-DD-eventType/"""
     try:
-        if not os.path.exists(source_path):
+        if not media_exists(source_path):
             return None
         
         # Parse date để tạo folder name
@@ -513,9 +632,21 @@ def copy_image_to_public(source_path, event_date, event_type, base_dir):
         timestamp = int(datetime.now().timestamp() * 1000)
         original_name = os.path.basename(source_path)
         file_name = f"{timestamp}-{original_name}"
-        dest_path = os.path.join(public_images_dir, file_name)
+        with _reserved_names_lock:
+            # Nhiều luồng copy cùng lúc: giữ chỗ tên file để không ghi đè lẫn nhau
+            while (
+                os.path.exists(os.path.join(public_images_dir, file_name))
+                or os.path.join(public_images_dir, file_name) in _reserved_names
+            ):
+                timestamp += 1
+                file_name = f"{timestamp}-{original_name}"
+            _reserved_names.add(os.path.join(public_images_dir, file_name))
+        
+        if store is not None:
+            # Ảnh đã có trong kho thì dùng lại/hardlink thay vì copy thêm bản mới
+            return store.store(source_path, folder_name, file_name)
         
-        import shutil
+        dest_path = os.path.join(public_images_dir, file_name)
         shutil.copy2(source_path, dest_path)
         
         # Trả về đường dẫn tương đối từ public
@@ -524,11 +655,103 @@ def copy_image_to_public(source_path, event_date, event_type, base_dir):
         print(f"Lỗi khi copy ảnh {source_path}: {e}")
         return None
 
-def scan_all_posts():
-    """Quét tất cả file posts"""
-    all_events = []
+class ImageCopyPipeline:
+    """Copy ảnh bằng thread pool có giới hạn, chạy chồng lên bước quét và phân loại"""
+    
+    def __init__(self, base_dir, store, workers=4, retries=2, report_interval=2.0, on_copied=None):
+        self.base_dir = base_dir
+        self.store = store
+        self.retries = retries
+        self.report_interval = report_interval
+        # Gọi với (đường dẫn gốc, đường dẫn /images/...) cho mỗi ảnh copy xong
+        self.on_copied = on_copied
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="copy")
+        # Giới hạn số ảnh chờ copy để hàng đợi không phình khi quét nhanh hơn copy
+        self._slots = threading.BoundedSemaphore(workers * 4)
+        self._jobs = []
+        self._lock = threading.Lock()
+        self.files_done = 0
+        self.bytes_done = 0
+        self.failed = 0
+        self._started = time.perf_counter()
+        self._last_report = self._started
+    
+    def submit(self, event):
+        """Đưa các ảnh của event vào hàng đợi copy ngay khi event được chấp nhận"""
+        jobs = []
+        for img in event.images:
+            source_path = img.path
+            if source_path and media_exists(source_path):
+                self._slots.acquire()
+                future = self._executor.submit(self._copy_one, source_path, event.date_iso, event.type)
+                jobs.append((img, source_path, future))
+        self._jobs.append((event, jobs))
+    
+    def _copy_one(self, source_path, event_date, event_type):
+        """Copy một ảnh, thử lại khi lỗi"""
+        try:
+            for attempt in range(self.retries + 1):
+                with _metrics.stage("copy"):
+                    relative_path = copy_image_to_public(
+                        source_path, event_date, event_type, self.base_dir, store=self.store
+                    )
+                if relative_path:
+                    self._record(media_size(source_path))
+                    return relative_path
+                if attempt < self.retries:
+                    _metrics.count("images.retried")
+                    print(f"  ↻ Thử copy lại ({attempt + 1}/{self.retries}): {os.path.basename(source_path)}")
+                    time.sleep(0.2 * (2 ** attempt))
+            with self._lock:
+                self.failed += 1
+            _metrics.count("images.failed")
+            return None
+        finally:
+            self._slots.release()
+    
+    def _record(self, size):
+        """Cộng dồn tiến độ và in tốc độ copy định kỳ"""
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            now = time.perf_counter()
+            if now - self._last_report < self.report_interval:
+                return
+            self._last_report = now
+            line = self._progress_line(now)
+        print(line)
+    
+    def _progress_line(self, now):
+        elapsed = max(now - self._started, 1e-9)
+        return (
+            f"  … đã copy {self.files_done} file, {self.bytes_done / 1048576:.1f} MB "
+            f"({self.files_done / elapsed:.1f} file/s, {self.bytes_done / 1048576 / elapsed:.1f} MB/s)"
+        )
     
-    posts_dir = os.path.join(FACEBOOK_DIR, "your_facebook_activity", "posts")
+    def finish(self):
+        """Chờ copy xong, cập nhật images của từng event theo đúng thứ tự ban đầu"""
+        for event, jobs in self._jobs:
+            if not event.images:
+                continue
+            updated_images = []
+            for img, source_path, future in jobs:
+                relative_path = future.result()
+                if relative_path:
+                    img.path = relative_path
+                    updated_images.append(img)
+                    if self.on_copied is not None:
+                        self.on_copied(source_path, relative_path)
+                    print(f"  ✓ Đã copy: {os.path.basename(source_path)}")
+            event.images = updated_images
+        self._executor.shutdown()
+        print(self._progress_line(time.perf_counter()))
+        if self.failed:
+            print(f"  ✗ {self.failed} ảnh copy thất bại sau {self.retries} lần thử lại")
+
+def list_post_files(facebook_dir=None):
+    """Liệt kê các file posts cần quét theo đúng thứ tự xử lý"""
+    posts_dir = os.path.join(facebook_dir or FACEBOOK_DIR, "your_facebook_activity", "posts")
+    file_paths = []
     
     # Các file posts cần quét
     post_files = [
@@ -537,25 +760,538 @@ def scan_all_posts():
         "birthday_media.json"
     ]
     
-    # Quét các file posts
     for filename in post_files:
         file_path = os.path.join(posts_dir, filename)
         if os.path.exists(file_path):
-            events = process_posts_file(file_path)
-            all_events.extend(events)
+            file_paths.append(file_path)
     
-    # Quét thư mục album
+    # Thư mục album
     album_dir = os.path.join(posts_dir, "album")
     if os.path.exists(album_dir):
         for album_file in os.listdir(album_dir):
             if album_file.endswith(".json"):
-                file_path = os.path.join(album_dir, album_file)
-                events = process_posts_file(file_path)
-                all_events.extend(events)
+                file_paths.append(os.path.join(album_dir, album_file))
+    
+    return file_paths
+
+def _process_posts_file_captured(file_path, stream, base_dir):
+    """Chạy process_posts_file trong process con, giữ lại output để in theo thứ tự"""
+    out, err = io.StringIO(), io.StringIO()
+    avoided_before = media_stat_calls_avoided()
+    # Số liệu riêng cho từng file, process chính cộng dồn lại
+    set_metrics(ImportMetrics())
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        events, ok = _process_posts_file(file_path, stream, base_dir)
+    avoided = media_stat_calls_avoided() - avoided_before
+    return events, ok, out.getvalue(), err.getvalue(), avoided, _metrics.to_dict()
+
+def _init_scan_worker(media_index, filter_order, ruleset, cache_file):
+    """Khởi tạo process con quét file: dùng chung index media, thứ tự lọc, bộ luật và cache với process chính"""
+    set_media_index(media_index)
+    set_filter_order(filter_order)
+    set_ruleset(ruleset)
+    set_classification_cache(ClassificationCache(cache_file, ruleset.fingerprint) if cache_file else None)
+
+def iter_scanned_files(file_paths, stream=False, workers=1, on_event=None, base_dirs=None):
+    """Quét lần lượt các file, yield (file_path, events, ok) theo đúng thứ tự file_paths
+    
+    on_event (nếu có) được gọi cho từng event ngay khi nó được chấp nhận
+    base_dirs (nếu có) cho biết thư mục export chứa từng file, mặc định là FACEBOOK_DIR
+    """
+    base_dirs = base_dirs or {}
+    if workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            events, ok = _process_posts_file(file_path, stream, base_dirs.get(file_path), on_event)
+            yield file_path, events, ok
+        return
     
+    # Chia file cho nhiều process, nhưng gộp kết quả theo đúng thứ tự như khi chạy tuần tự
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_scan_worker,
+        initargs=(
+            _media_index,
+            get_filter_pipeline().order if not get_filter_pipeline().adaptive else None,
+            get_ruleset(),
+            _classification_cache.db_file if _classification_cache is not None else None,
+        ),
+    ) as executor:
+        futures = [
+            executor.submit(_process_posts_file_captured, file_path, stream, base_dirs.get(file_path, FACEBOOK_DIR))
+            for file_path in file_paths
+        ]
+        for file_path, future in zip(file_paths, futures):
+            try:
+                events, ok, out, err, avoided, metrics = future.result()
+            except Exception as e:
+                print(f"Lỗi khi đọc file {file_path}: {e}")
+                traceback.print_exc()
+                _metrics.count("files.failed")
+                yield file_path, [], False
+                continue
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            _metrics.merge(metrics)
+            if _media_index is not None:
+                # Cộng dồn số stat tránh được ở process con
+                with _media_index._lock:
+                    _media_index.stat_calls_avoided += avoided
+            if on_event is not None:
+                for event in events:
+                    on_event(event)
+            yield file_path, events, ok
+
+def scan_all_posts(stream=False, workers=1, file_paths=None):
+    """Quét tất cả file posts"""
+    if file_paths is None:
+        file_paths = list_post_files()
+    all_events = []
+    for _, events, _ in iter_scanned_files(file_paths, stream=stream, workers=workers):
+        all_events.extend(events)
     return all_events
 
-def main():
+MANIFEST_VERSION = 1
+
+# Số event gom lại trước khi phân tích ảnh (EXIF, hash) cùng lúc trên process pool
+MEDIA_ANALYSIS_BATCH = 64
+
+def _file_content_hash(file_path):
+    """Hash nội dung file (blake2b, đọc theo từng khối)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_file):
+    """Đọc manifest checkpoint của các lần import trước"""
+    if os.path.exists(manifest_file):
+        try:
+            manifest = json_backend.load(manifest_file)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+            print("Manifest khác phiên bản, sẽ quét lại toàn bộ")
+        except Exception as e:
+            print(f"Lỗi khi đọc manifest {manifest_file}: {e}")
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+def save_manifest(manifest_file, manifest):
+    """Ghi manifest checkpoint"""
+    json_backend.dump(manifest, manifest_file, pretty=False)
+
+def split_changed_files(file_paths, manifest, timeline_ids=None):
+    """Chia file thành (cần quét, không đổi); trả kèm fingerprint mới của từng file
+
+    timeline_ids: ID các event đang có trong timeline; file không đổi nhưng có event (ghi trong
+    eventIds của manifest) đã bị xóa khỏi timeline thì vẫn được quét lại để nhập lại event đó
+    """
+    known = manifest.get("files", {})
+    changed, unchanged, fingerprints = [], [], {}
+    for file_path in file_paths:
+        st = os.stat(file_path)
+        entry = known.get(file_path)
+        fingerprint = {"size": st.st_size, "mtime": st.st_mtime}
+        if entry and timeline_ids is not None and any(
+            event_id not in timeline_ids for event_id in entry.get("eventIds") or ()
+        ):
+            missing = sum(1 for event_id in entry["eventIds"] if event_id not in timeline_ids)
+            print(f"Quét lại {os.path.basename(file_path)}: {missing} sự kiện đã nhập không còn trong timeline")
+            entry = None
+        if entry and entry.get("size") == st.st_size:
+            if entry.get("mtime") == st.st_mtime:
+                # Cùng kích thước và mtime: coi như không đổi, khỏi đọc file
+                unchanged.append(file_path)
+                fingerprints[file_path] = dict(fingerprint, hash=entry.get("hash"))
+                continue
+            fingerprint["hash"] = _file_content_hash(file_path)
+            if fingerprint["hash"] == entry.get("hash"):
+                # Chỉ bị touch, nội dung giữ nguyên
+                unchanged.append(file_path)
+                fingerprints[file_path] = fingerprint
+                continue
+        else:
+            fingerprint["hash"] = _file_content_hash(file_path)
+        changed.append(file_path)
+        fingerprints[file_path] = fingerprint
+    return changed, unchanged, fingerprints
+
+def update_manifest(manifest, fingerprints, unchanged_files, file_event_ids):
+    """Cập nhật manifest sau khi quét; file bị lỗi sẽ được quét lại ở lần sau"""
+    known = manifest.get("files", {})
+    unchanged = set(unchanged_files)
+    files = {}
+    for file_path, fingerprint in fingerprints.items():
+        if file_path in file_event_ids:
+            files[file_path] = dict(fingerprint, eventIds=file_event_ids[file_path])
+        elif file_path in unchanged:
+            # Giữ danh sách event cũ, cập nhật mtime nếu file chỉ bị touch
+            files[file_path] = dict(known[file_path], **fingerprint)
+    manifest["version"] = MANIFEST_VERSION
+    manifest["files"] = files
+    return manifest
+
+def save_merge_candidates(candidates_file, new_candidates, event_ids):
+    """Lưu ứng viên gộp, giữ cặp cũ chưa xử lý (cả hai event vẫn còn trong timeline)"""
+    candidates = []
+    if os.path.exists(candidates_file):
+        try:
+            candidates = json_backend.load(candidates_file).get("candidates", [])
+        except Exception as e:
+            print(f"Lỗi khi đọc {candidates_file}: {e}")
+    seen = set()
+    kept = []
+    for candidate in candidates + new_candidates:
+        pair = tuple(sorted(candidate["eventIds"], key=str))
+        if pair in seen or not all(event_id in event_ids for event_id in pair):
+            continue
+        seen.add(pair)
+        kept.append(candidate)
+    if kept or os.path.exists(candidates_file):
+        atomic_write_bytes(
+            candidates_file,
+            json_backend.dumps({"generatedAt": datetime.now().isoformat(), "candidates": kept}),
+        )
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(description="Import sự kiện từ Facebook export vào timeline")
+    parser.add_argument(
+        "--source",
+        action="append",
+        metavar="DIR",
+        help=(
+            "Thư mục export Facebook, lặp lại để import nhiều export trong một lần chạy "
+            f"(mặc định: biến môi trường {FACEBOOK_DIRS_ENV} hoặc FACEBOOK_DIR)"
+        ),
+    )
+    parser.add_argument(
+        "--messenger",
+        action="store_true",
+        help="Quét thêm tin nhắn Messenger (messages/inbox/*/message_N.json) thành sự kiện theo ngày",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Đọc file posts theo kiểu stream (bộ nhớ ổn định với export rất lớn)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Số process quét file posts song song (mặc định 1: chạy tuần tự)",
+    )
+    parser.add_argument(
+        "--copy-workers",
+        type=int,
+        default=4,
+        metavar="N",
+        help="Số luồng copy ảnh song song (mặc định 4)",
+    )
+    parser.add_argument(
+        "--copy-retries",
+        type=int,
+        default=2,
+        metavar="N",
+        help="Số lần thử lại khi copy một ảnh bị lỗi (mặc định 2)",
+    )
+    parser.add_argument(
+        "--no-derivatives",
+        action="store_true",
+        help="Không tạo ảnh thu nhỏ (thumb/medium) cho ảnh mới copy",
+    )
+    parser.add_argument(
+        "--derivative-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Số process tạo ảnh thu nhỏ (mặc định bằng số CPU)",
+    )
+    parser.add_argument(
+        "--no-media-analysis",
+        action="store_true",
+        help="Không đọc ngày chụp EXIF và hash ảnh (event luôn lấy ngày đăng)",
+    )
+    parser.add_argument(
+        "--analysis-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Số process đọc EXIF / hash ảnh (mặc định bằng số CPU)",
+    )
+    parser.add_argument(
+        "--no-media-index",
+        action="store_true",
+        help="Không dựng index media, kiểm tra file trực tiếp trên đĩa",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Ghi timeline.json dạng gọn (không thụt lề) để /api/timeline đọc nhanh hơn",
+    )
+    parser.add_argument(
+        "--compact-log",
+        action="store_true",
+        help="Gộp log event vào snapshot timeline.json ngay sau khi import",
+    )
+    parser.add_argument(
+        "--log-threshold",
+        type=int,
+        default=DEFAULT_COMPACT_THRESHOLD,
+        metavar="N",
+        help=f"Tự gộp log vào snapshot khi log có từ N sự kiện (mặc định {DEFAULT_COMPACT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--shards",
+        choices=sorted(SHARD_GRANULARITIES),
+        help="Ghi thêm timeline chia shard theo năm/tháng vào data/shards (chỉ ghi lại shard có event mới)",
+    )
+    parser.add_argument(
+        "--change-history",
+        type=int,
+        default=DEFAULT_CHANGE_HISTORY,
+        metavar="N",
+        help=f"Số changeset gần nhất giữ trong change feed của timeline (mặc định {DEFAULT_CHANGE_HISTORY})",
+    )
+    parser.add_argument(
+        "--rules",
+        metavar="FILE",
+        help=(
+            "File JSON ghi đè bộ luật phân loại, ví dụ {\"WIFE_NAMES\": [...], \"EXCLUDE_KEYWORDS\": [...]} "
+            "(kèm --full để áp dụng cho cả file đã quét)"
+        ),
+    )
+    parser.add_argument(
+        "--compare-rules",
+        metavar="FILE",
+        help=(
+            "Chạy thử: quét mọi post với bộ luật hiện tại và bộ luật trong FILE, in các post được nhận/bị loại "
+            "khác nhau; không ghi timeline, manifest hay ảnh"
+        ),
+    )
+    parser.add_argument(
+        "--no-classification-cache",
+        action="store_true",
+        help=f"Không dùng cache kết quả phân loại (data/{CLASSIFICATION_CACHE_FILE})",
+    )
+    parser.add_argument(
+        "--filter-order",
+        default="auto",
+        metavar="ORDER",
+        help=(
+            "Thứ tự các bước lọc post, ví dụ timestamp,anchor,classify,media "
+            "(mặc định auto: tự sắp xếp theo chi phí và tỉ lệ loại đo được)"
+        ),
+    )
+    parser.add_argument(
+        "--similarity-threshold",
+        type=float,
+        default=DEFAULT_SIMILARITY_THRESHOLD,
+        metavar="X",
+        help=f"Ngưỡng tương đồng (0-1) để báo hai sự kiện gần trùng (mặc định {DEFAULT_SIMILARITY_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="FILE",
+        help="Ghi số liệu đo đạc (thời gian từng bước, số post bị loại, tóm tắt) ra FILE dạng JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Chạy kèm cProfile và lưu kết quả vào FILE (chỉ đo process chính)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Chạy kèm tracemalloc, đưa các vị trí cấp phát nhiều nhất vào metrics",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Bỏ qua manifest, quét lại toàn bộ export",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers phải >= 1")
+    if args.copy_workers < 1:
+        parser.error("--copy-workers phải >= 1")
+    if args.copy_retries < 0:
+        parser.error("--copy-retries phải >= 0")
+    if args.derivative_workers is not None and args.derivative_workers < 1:
+        parser.error("--derivative-workers phải >= 1")
+    if args.analysis_workers is not None and args.analysis_workers < 1:
+        parser.error("--analysis-workers phải >= 1")
+    if args.change_history < 1:
+        parser.error("--change-history phải >= 1")
+    for option, rules_file in (("--rules", args.rules), ("--compare-rules", args.compare_rules)):
+        if rules_file is not None:
+            try:
+                Ruleset.load(rules_file)
+            except ValueError as e:
+                parser.error(f"{option}: {e}")
+    if args.filter_order == "auto":
+        args.filter_order = None
+    else:
+        args.filter_order = [name.strip() for name in args.filter_order.split(",")]
+        try:
+            validate_filter_order(args.filter_order)
+        except ValueError as e:
+            parser.error(f"--filter-order: {e}")
+    return args
+
+def write_metrics(metrics_file, report):
+    """Ghi báo cáo metrics ra file JSON (nguyên tử để route không đọc phải file ghi dở)"""
+    try:
+        atomic_write_bytes(metrics_file, json_backend.dumps(report))
+    except OSError as e:
+        print(f"Lỗi khi ghi metrics {metrics_file}: {e}")
+
+def execute(args):
+    """Chạy import kèm đo đạc, trả về báo cáo (status "error" nếu import bị lỗi)"""
+    metrics = ImportMetrics()
+    set_metrics(metrics)
+    profiler = RunProfiler(args.profile, args.trace_memory)
+    started_at = datetime.now()
+    started = time.perf_counter()
+    status = "error"
+    summary = {}
+    extra = {}
+    profiler.start()
+    try:
+        summary = run_import(args)
+        status = "ok"
+    except Exception as e:
+        extra["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        extra.update(profiler.stop())
+        report = build_report(metrics, started_at, time.perf_counter() - started, status, summary, extra)
+        print_report(report)
+        if args.metrics_json:
+            write_metrics(args.metrics_json, report)
+    return report
+
+def main(argv=None):
+    report = execute(parse_args(argv))
+    if report["status"] != "ok":
+        sys.exit(1)
+    return report["summary"]
+
+def collect_sources(source_dirs=None):
+    """Các thư mục export có thật và {file posts: thư mục export chứa nó}"""
+    sources = []
+    for source in source_dirs or default_sources():
+        if os.path.isdir(source):
+            sources.append(source)
+        else:
+            print(f"Không tìm thấy thư mục export: {source}")
+    base_dirs = {}
+    for source in sources:
+        for file_path in list_post_files(source):
+            base_dirs.setdefault(file_path, source)
+    return sources, base_dirs
+
+def open_classification_cache(args, data_dir):
+    """Cache phân loại của bộ luật đang dùng, None nếu bị tắt"""
+    if args.no_classification_cache:
+        return None
+    return ClassificationCache(os.path.join(data_dir, CLASSIFICATION_CACHE_FILE), get_ruleset().fingerprint)
+
+def _accepted_posts(file_paths, base_dirs, args):
+    """Quét các file với bộ luật đang dùng, trả về {(file, id event): event} (không in từng event)"""
+    accepted = {}
+    failed = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for file_path, events, ok in iter_scanned_files(
+            file_paths, stream=args.stream, workers=args.workers, base_dirs=base_dirs
+        ):
+            if not ok:
+                failed.append(file_path)
+            for event in events:
+                accepted[(file_path, event.id)] = event
+    for file_path in failed:
+        print(f"  ✗ Lỗi khi đọc {file_path}, phần sau chỗ lỗi không được so sánh")
+    return accepted
+
+def compare_rules(args):
+    """Chạy thử hai bộ luật trên mọi post, in khác biệt; không ghi timeline, manifest hay ảnh"""
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    baseline = Ruleset.load(args.rules) if args.rules else Ruleset()
+    candidate = Ruleset.load(args.compare_rules)
+    sources, base_dirs = collect_sources(args.source)
+    file_paths = list(base_dirs)
+    if not args.no_media_index and sources:
+        with _metrics.stage("media_index"):
+            media_index, _ = load_media_index(sources)
+        set_media_index(media_index)
+    else:
+        set_media_index(None)
+
+    print(f"So sánh bộ luật {baseline.name} ({baseline.fingerprint}) với {candidate.name} ({candidate.fingerprint})")
+    print(f"Quét {len(file_paths)} file posts trong {len(sources)} export (chạy thử, không ghi timeline)")
+    results = []
+    cache_stats = []
+    for ruleset in (baseline, candidate):
+        set_ruleset(ruleset)
+        cache = open_classification_cache(args, data_dir)
+        set_classification_cache(cache)
+        before = dict(_metrics.counters)
+        try:
+            with _metrics.stage(f"compare.{'baseline' if ruleset is baseline else 'candidate'}"):
+                results.append(_accepted_posts(file_paths, base_dirs, args))
+        finally:
+            set_classification_cache(None)
+            if cache is not None:
+                cache.close()
+        cache_stats.append({
+            key: _metrics.counters.get(f"classify_cache.{key}", 0) - before.get(f"classify_cache.{key}", 0)
+            for key in ("hits", "misses")
+        })
+    old, new = results
+
+    added = [new[key] for key in new if key not in old]
+    removed = [old[key] for key in old if key not in new]
+    changed = [
+        (old[key], new[key]) for key in new
+        if key in old and (old[key].type, old[key].title) != (new[key].type, new[key].title)
+    ]
+    print("\n" + "=" * 60)
+    for event in sorted(added, key=lambda e: e.date_iso):
+        print(f"+ {event.date} - {event.type} - {event.title[:60]}")
+    for event in sorted(removed, key=lambda e: e.date_iso):
+        print(f"- {event.date} - {event.type} - {event.title[:60]}")
+    for before_event, after_event in sorted(changed, key=lambda pair: pair[1].date_iso):
+        print(
+            f"~ {after_event.date} - {before_event.type} -> {after_event.type} - "
+            f"{before_event.title[:40]} -> {after_event.title[:40]}"
+        )
+    print("=" * 60)
+    print(
+        f"Bộ luật {candidate.name}: nhận thêm {len(added)}, loại thêm {len(removed)}, đổi loại/title {len(changed)} "
+        f"(trước {len(old)}, sau {len(new)} post được nhận)"
+    )
+    return {
+        "dryRun": True,
+        "baseline": {"name": baseline.name, "fingerprint": baseline.fingerprint, "accepted": len(old),
+                     "cache": cache_stats[0]},
+        "candidate": {"name": candidate.name, "fingerprint": candidate.fingerprint, "accepted": len(new),
+                      "cache": cache_stats[1]},
+        "added": len(added),
+        "removed": len(removed),
+        "changed": len(changed),
+        "filesScanned": len(file_paths),
+    }
+
+def run_import(args):
+    """Chạy toàn bộ quá trình import, trả về tóm tắt kết quả"""
+    # Worker chạy nhiều lần import trong một process: tên đã giữ chỗ ở lần trước giờ đã nằm trên đĩa
+    with _reserved_names_lock:
+        _reserved_names.clear()
+    set_filter_order(args.filter_order)
+    if args.compare_rules:
+        return compare_rules(args)
+    set_ruleset(Ruleset.load(args.rules) if args.rules else Ruleset())
+    
     print("=" * 60)
     print("Bắt đầu quét và phân tích dữ liệu Facebook...")
     print("Chỉ chọn sự kiện thực sự liên quan đến mối quan hệ")
@@ -565,72 +1301,308 @@ def main():
     base_dir = os.path.dirname(__file__)
     timeline_file = os.path.join(base_dir, "data", "timeline.json")
     
-    # Đọc timeline hiện tại
+    # Đọc timeline hiện tại: snapshot + log event của các lần import trước
+    store = TimelineStore(timeline_file, pretty=not args.compact, compact_threshold=args.log_threshold)
+    shards = TimelineShards(shard_dir_for(timeline_file), args.shards) if args.shards else None
+    # Phải kiểm tra trước khi ghi timeline: web sửa timeline thì shard cũ không còn dùng được
+    shards_current = shards is not None and shards.is_current(timeline_file)
+    change_feed = ChangeFeed(change_feed_path_for(timeline_file), args.change_history)
+    feed_current = change_feed.is_current(timeline_file)
     existing_events = []
-    existing_ids = set()
-    if os.path.exists(timeline_file):
+    # Tạo thư mục data nếu chưa có
+    os.makedirs(os.path.dirname(timeline_file), exist_ok=True)
+    if os.path.exists(timeline_file) or os.path.exists(store.log_file):
         try:
-            with open(timeline_file, 'r', encoding='utf-8') as f:
-                timeline_data = json.load(f)
-                existing_events = timeline_data.get("timelineEvents", [])
-                existing_ids = {e.get("id") for e in existing_events}
-                # Cũng check theo date + title
-                existing_keys = {
-                    f"{e.get('date')}-{e.get('title', '')[:50]}".lower()
-                    for e in existing_events
-                }
+            with _metrics.stage("load_timeline"):
+                timeline_data = store.load()
+            existing_events = timeline_data.get("timelineEvents", [])
             print(f"Đã tìm thấy {len(existing_events)} sự kiện hiện có trong timeline")
         except Exception as e:
             print(f"Lỗi khi đọc timeline.json: {e}")
             existing_events = []
-            existing_ids = set()
-            existing_keys = set()
+    
+    # Manifest checkpoint nằm cạnh timeline.json, --full thì bỏ qua
+    manifest_file = os.path.join(os.path.dirname(timeline_file), "import_manifest.json")
+    if args.full:
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
     else:
-        existing_keys = set()
-        # Tạo thư mục data nếu chưa có
-        os.makedirs(os.path.dirname(timeline_file), exist_ok=True)
+        manifest = load_manifest(manifest_file)
     
-    # Quét tất cả posts
-    new_events = scan_all_posts()
+    # Các export được quét chung: một index media, một index trùng lặp và một lần ghi timeline
+    sources, base_dirs = collect_sources(args.source)
+    if len(sources) > 1:
+        print(f"Import {len(sources)} export cùng lúc ({len(base_dirs)} file posts)")
+    with _metrics.stage("manifest"):
+        timeline_ids = {event.get("id") for event in existing_events}
+        changed_files, unchanged_files, fingerprints = split_changed_files(list(base_dirs), manifest, timeline_ids)
     
-    # Lọc bỏ các sự kiện đã có
+    # Tin nhắn Messenger: quét lại cả cuộc hội thoại nếu có file message_N.json nào mới/thay đổi
+    conversations = []
+    if args.messenger:
+        all_conversations = [
+            conversation for source in sources for conversation in messenger_source.list_conversations(source)
+        ]
+        with _metrics.stage("manifest"):
+            changed_messages, unchanged_messages, message_fingerprints = split_changed_files(
+                [file_path for conversation in all_conversations for file_path in conversation.files], manifest,
+                timeline_ids,
+            )
+        fingerprints.update(message_fingerprints)
+        unchanged_files += unchanged_messages
+        changed_messages = set(changed_messages)
+        conversations = [
+            conversation for conversation in all_conversations
+            if any(file_path in changed_messages for file_path in conversation.files)
+        ]
+        print(f"Messenger: {len(all_conversations)} cuộc hội thoại, {len(conversations)} cần quét")
+    if unchanged_files:
+        print(f"Bỏ qua {len(unchanged_files)} file không thay đổi từ lần import trước (dùng --full để quét lại)")
+    
+    # Duyệt cây media một lần, mọi kiểm tra tồn tại/kích thước file sau đó tra trong bộ nhớ
+    if not args.no_media_index and sources:
+        with _metrics.stage("media_index"):
+            media_index, rebuilt = load_media_index(sources)
+        set_media_index(media_index)
+        if rebuilt:
+            print(f"Đã index {len(media_index)} file media trong {len(sources)} export")
+        else:
+            print(f"Dùng lại index {len(media_index)} file media (export không thay đổi)")
+    else:
+        set_media_index(None)
+    
+    # Ngày chụp EXIF + hash ảnh, phân tích song song, nhớ kết quả theo đường dẫn + mtime
+    media_analyzer = None
+    if not args.no_media_analysis:
+        media_analyzer = MediaAnalyzer(
+            os.path.join(os.path.dirname(timeline_file), MEDIA_ANALYSIS_FILE), workers=args.analysis_workers,
+            media_indexes=(_media_index,) if _media_index is not None else (),
+        )
+        if not media_analyzer.available:
+            print("Chưa cài Pillow (pip install Pillow), bỏ qua đọc ngày chụp và hash ảnh")
+            media_analyzer = None
+    public_dir = os.path.join(base_dir, "public")
+    images_dir = os.path.join(base_dir, "public", "images")
+    
+    # Ảnh của event đã có (public/images): kích thước/mtime lấy từ index thay vì stat từng ảnh mỗi lần import
+    timeline_media_index = None
+    if media_analyzer is not None and not args.no_media_index:
+        with _metrics.stage("media_index"):
+            timeline_media_index, _ = load_timeline_media_index(images_dir)
+        media_analyzer.media_indexes += (timeline_media_index,)
+    
+    def on_copied(source_path, relative_path):
+        copied_path = os.path.join(public_dir, relative_path.lstrip("/"))
+        if timeline_media_index is not None:
+            try:
+                timeline_media_index.add(copied_path)
+            except OSError:
+                pass
+        # Ảnh copy vào public có cùng kết quả phân tích, lần sau không phải giải mã lại
+        if media_analyzer is not None:
+            media_analyzer.alias(copied_path, source_path)
+    
+    # Ảnh được copy song song ngay khi event được chấp nhận, chồng lên bước quét
+    image_store = ImageStore(images_dir, os.path.join(os.path.dirname(timeline_file), IMAGE_INDEX_FILE))
+    copy_pipeline = ImageCopyPipeline(
+        base_dir, image_store, workers=args.copy_workers, retries=args.copy_retries, on_copied=on_copied
+    )
     filtered_events = []
-    for event in new_events:
-        event_id = event.get("id")
-        event_key = f"{event.get('date')}-{event.get('title', '')[:50]}".lower()
+    
+    # Hash ảnh của các event đã có, để phát hiện event mới dùng lại ảnh cũ
+    image_hashes = ImageHashIndex()
+    known_events = {event.get("id"): event for event in existing_events}
+    analysis_counts = {"redated": 0, "imageDuplicates": 0}
+    if media_analyzer is not None:
+        existing_images = [
+            (os.path.join(public_dir, img["path"].lstrip("/")), event.get("id"))
+            for event in existing_events
+            for img in event.get("images") or []
+            if img.get("path")
+        ]
+        if existing_images:
+            with _metrics.stage("media_analysis"):
+                results = media_analyzer.analyze(path for path, _ in existing_images)
+            for path, event_id in existing_images:
+                if path in results:
+                    image_hashes.add(results[path]["hash"], event_id)
+    
+    # Index trùng lặp: ID, key date+title đã bỏ dấu, bucket theo ngày để tìm bản gần trùng
+    dedup_index = DedupIndex(existing_events, threshold=args.similarity_threshold)
+    duplicate_counts = {DUPLICATE_ID: 0, DUPLICATE_KEY: 0}
+    # ID event ứng viên -> ID event trùng đã có trong timeline
+    timeline_owner = {}
+    merge_candidates = []
+    
+    def accept_event(event, hashes=()):
+        with _metrics.stage("dedup"):
+            kind, matches = dedup_index.check(event)
         
-        # Bỏ qua nếu trùng ID hoặc trùng date+title
-        if event_id in existing_ids or event_key in existing_keys:
-            continue
+        # Bỏ qua nếu trùng ID hoặc trùng date+title (sau khi chuẩn hóa)
+        if kind in duplicate_counts:
+            duplicate_counts[kind] += 1
+            # Manifest ghi ID của event trong timeline đại diện cho post này
+            timeline_owner[event.id] = dedup_index.owner(event)
+            return
+        
+        # Gần trùng thì vẫn giữ, chỉ báo lại để người dùng tự gộp
+        for other, similarity in matches:
+            merge_candidates.append(merge_candidate(event, other, similarity))
         
+        # Dùng lại ảnh (gần giống) của event khác: cũng báo là ứng viên gộp
+        shared = {}
+        for image_hash in hashes:
+            for owner in image_hashes.matches(image_hash):
+                shared[owner] = shared.get(owner, 0) + 1
+        text_matched = {other.get("id") for other, _ in matches}
+        for owner, count in shared.items():
+            if owner != event.id and owner not in text_matched and owner in known_events:
+                merge_candidates.append(
+                    merge_candidate(event, known_events[owner], count / len(hashes), reason="image")
+                )
+                analysis_counts["imageDuplicates"] += 1
+        for image_hash in hashes:
+            image_hashes.add(image_hash, event.id)
+        known_events[event.id] = event
+        
+        dedup_index.add(event)
         filtered_events.append(event)
+        copy_pipeline.submit(event)
+    
+    # Event chờ phân tích ảnh theo lô, để process pool luôn có đủ việc
+    pending_events = []
+    
+    def flush_pending():
+        if not pending_events:
+            return
+        results = {}
+        if media_analyzer is not None:
+            with _metrics.stage("media_analysis"):
+                results = media_analyzer.analyze(img.path for event in pending_events for img in event.images)
+        for event in pending_events:
+            event_results = [results[img.path] for img in event.images if img.path in results]
+            # Album up ảnh cũ: xếp event về ngày chụp thay vì ngày đăng
+            posted = datetime.fromisoformat(event.date_iso)
+            taken = capture_date(event_results, posted)
+            if taken is not None:
+                print(f"  ⌚ {event.date} -> {taken.strftime('%d/%m/%Y')} (ngày chụp): {event.title[:50]}")
+                event.set_date(taken)
+                # Title dự phòng ghi ngày đăng: đổi theo ngày chụp
+                if event.title == fallback_title(posted):
+                    event.title = fallback_title(taken)
+                analysis_counts["redated"] += 1
+            accept_event(event, [entry["hash"] for entry in event_results])
+        pending_events.clear()
+    
+    def queue_event(event):
+        pending_events.append(event)
+        if media_analyzer is None or len(pending_events) >= MEDIA_ANALYSIS_BATCH:
+            flush_pending()
+    
+    # Kết luận phân loại của post không đổi được lấy từ cache theo fingerprint bộ luật
+    classification_cache = open_classification_cache(args, os.path.dirname(timeline_file))
+    set_classification_cache(classification_cache)
+    ruleset = get_ruleset()
+    if ruleset.overrides:
+        print(f"Bộ luật {ruleset.name} ({ruleset.fingerprint}): ghi đè {', '.join(sorted(ruleset.overrides))}")
+    
+    # Quét các file posts mới hoặc đã thay đổi
+    file_event_ids = {}
+    scanned = iter_scanned_files(
+        changed_files, stream=args.stream, workers=args.workers, on_event=queue_event, base_dirs=base_dirs
+    )
+    messenger_counts = {"conversations": 0, "messages": 0, "relevant": 0, "events": 0}
+    try:
+        for file_path, events, ok in scanned:
+            flush_pending()
+            if ok:
+                file_event_ids[file_path] = [timeline_owner.get(event.id, event.id) for event in events]
+        if conversations:
+            print(f"\nĐang quét {len(conversations)} cuộc hội thoại Messenger...")
+            scanned_conversations = messenger_source.iter_scanned_conversations(
+                conversations, get_classifier(), get_title_builder(), _media_index, workers=args.workers
+            )
+            for conversation, events, ok, stats in _metrics.timed_iter("messenger", scanned_conversations):
+                for event in events:
+                    queue_event(event)
+                flush_pending()
+                if ok:
+                    for file_path in conversation.files:
+                        file_event_ids[file_path] = [timeline_owner.get(event.id, event.id) for event in events]
+                messenger_counts["conversations"] += 1
+                for key in ("messages", "relevant", "events"):
+                    messenger_counts[key] += stats.get(key, 0)
+            for key in ("messages", "relevant", "events"):
+                _metrics.count(f"messenger.{key}", messenger_counts[key])
+            print(
+                f"Messenger: {messenger_counts['messages']} tin nhắn, {messenger_counts['relevant']} tin liên quan, "
+                f"{messenger_counts['events']} sự kiện ứng viên"
+            )
+        flush_pending()
+    finally:
+        if media_analyzer is not None:
+            media_analyzer.close()
+        set_classification_cache(None)
+        if classification_cache is not None:
+            classification_cache.close()
+            classification_cache.prune()
+    if analysis_counts["redated"]:
+        print(f"\nĐã xếp {analysis_counts['redated']} sự kiện về ngày chụp ảnh (EXIF)")
     
     print(f"\nTìm thấy {len(filtered_events)} sự kiện mới (sau khi loại bỏ trùng lặp)")
+    print(
+        f"Đã bỏ {duplicate_counts[DUPLICATE_ID]} sự kiện trùng ID, "
+        f"{duplicate_counts[DUPLICATE_KEY]} sự kiện trùng ngày + tiêu đề"
+    )
+    if merge_candidates:
+        print(f"\nPhát hiện {len(merge_candidates)} cặp sự kiện gần trùng (nên xem xét gộp):")
+        for candidate in merge_candidates[:10]:
+            print(
+                f"  ≈ {candidate['similarity']:.2f} {candidate['dates'][1]} - "
+                f"{candidate['titles'][0][:40]} | {candidate['titles'][1][:40]}"
+            )
+        if len(merge_candidates) > 10:
+            print(f"  ... và {len(merge_candidates) - 10} cặp khác")
     
-    # Copy ảnh vào public/images
+    # Chờ copy ảnh vào public/images
     print("\nĐang copy ảnh vào public/images...")
-    for event in filtered_events:
-        if event.get("images"):
-            updated_images = []
-            for img in event["images"]:
-                source_path = img.get("path")
-                if source_path and os.path.exists(source_path):
-                    # Copy ảnh vào public/images
-                    relative_path = copy_image_to_public(
-                        source_path,
-                        event["dateParsed"]["date"],
-                        event["type"],
-                        base_dir
-                    )
-                    if relative_path:
-                        updated_images.append({
-                            "id": img.get("id"),
-                            "name": img.get("name"),
-                            "path": relative_path,
-                            "type": img.get("type", "image/jpeg")
-                        })
-                        print(f"  ✓ Đã copy: {os.path.basename(source_path)}")
-            event["images"] = updated_images
+    with _metrics.stage("copy_wait"):
+        copy_pipeline.finish()
+        image_store.save()
+        if media_analyzer is not None:
+            media_analyzer.save()
+    # Từ đây event mới chỉ còn là các event được chấp nhận: đổi sang schema timeline.json
+    filtered_events = to_dicts(filtered_events)
+    stats = image_store.stats
+    print(f"Ảnh: {stats['copied']} copy mới, {stats['linked']} hardlink tới nội dung đã có")
+    
+    # Ảnh thu nhỏ cho trang timeline, ảnh gốc không đổi thì bỏ qua
+    derivative_stats = None
+    if not args.no_derivatives:
+        derivative_generator = DerivativeGenerator(
+            images_dir, os.path.join(os.path.dirname(timeline_file), DERIVATIVES_INDEX_FILE),
+            workers=args.derivative_workers, store=image_store,
+        )
+        if derivative_generator.available:
+            with _metrics.stage("derivatives"):
+                derivatives = derivative_generator.generate(
+                    img["path"] for event in filtered_events for img in event["images"]
+                )
+                derivative_generator.save()
+            apply_derivatives(filtered_events, derivatives)
+            derivative_stats = derivative_generator.stats
+            print(
+                f"Ảnh thu nhỏ: {derivative_stats['created']} tạo mới, {derivative_stats['linked']} dùng lại (hardlink), "
+                f"{derivative_stats['skipped']} đã có, "
+                f"{derivative_stats['failed']} lỗi"
+            )
+        else:
+            print("Chưa cài Pillow (pip install Pillow), bỏ qua tạo ảnh thu nhỏ")
+    if timeline_media_index is not None:
+        # Thư mục ảnh vừa được chính lần import này ghi thêm (ảnh, ảnh thu nhỏ)
+        timeline_media_index.refresh()
+        print(f"Index ảnh timeline: tránh được {timeline_media_index.stat_calls_avoided} lần stat")
+    if _media_index is not None:
+        print(f"Media index: tránh được {media_stat_calls_avoided()} lần stat")
     
     # Merge với events hiện có
     all_events = existing_events + filtered_events
@@ -642,17 +1614,39 @@ def main():
     print(f"Tổng cộng: {len(all_events)} sự kiện (cũ: {len(existing_events)}, mới: {len(filtered_events)})")
     print("=" * 60)
     
-    # Lưu vào timeline.json
-    timeline_data = {
-        "timelineEvents": all_events,
-        "lastSaved": datetime.now().isoformat(),
-        "version": "1.0"
-    }
+    # Event mới chỉ được append vào log, snapshot được ghi lại (nguyên tử) khi compaction
+    with _metrics.stage("write"):
+        store.append(filtered_events)
+        wrote_snapshot = args.compact_log or store.needs_compaction() or not os.path.exists(timeline_file)
+        if wrote_snapshot:
+            store.compact(all_events)
+    if wrote_snapshot:
+        print(f"\n✓ Đã lưu vào: {timeline_file}")
+    else:
+        print(f"\n✓ Đã ghi {len(filtered_events)} sự kiện mới vào log: {store.log_file}")
+        print(f"  (log hiện có {store.log_count} sự kiện, tự gộp vào snapshot khi đạt {store.compact_threshold})")
+    
+    written_shards = []
+    if shards is not None:
+        touched_keys = {shards.shard_key(event) for event in filtered_events} if shards_current else None
+        with _metrics.stage("shards"):
+            written_shards = shards.write(all_events, timeline_file, touched_keys)
+        print(f"✓ Shard theo {args.shards}: ghi lại {len(written_shards)} shard trong {shards.shard_dir}")
+    
+    # Change feed: feed còn khớp thì changeset chỉ là event mới, không thì so lại cả timeline
+    with _metrics.stage("change_feed"):
+        timeline_version = change_feed.record(timeline_file, all_events, filtered_events if feed_current else None)
+    print(f"✓ Timeline version {timeline_version}")
     
-    with open(timeline_file, 'w', encoding='utf-8') as f:
-        json.dump(timeline_data, f, ensure_ascii=False, indent=2)
+    # Index tìm kiếm: chỉ event mới (hoặc bị sửa trên web) mới phải tách token lại
+    with _metrics.stage("search_index"):
+        search_index, search_changed = update_search_index(timeline_file, all_events)
+    print(f"✓ Index tìm kiếm: {len(search_index)} sự kiện, {search_index.token_count} từ ({search_changed} cập nhật)")
     
-    print(f"\n✓ Đã lưu vào: {timeline_file}")
+    with _metrics.stage("manifest"):
+        save_manifest(manifest_file, update_manifest(manifest, fingerprints, unchanged_files, file_event_ids))
+    candidates_file = os.path.join(os.path.dirname(timeline_file), "merge_candidates.json")
+    save_merge_candidates(candidates_file, merge_candidates, {event.get("id") for event in all_events})
     
     # Hiển thị một số sự kiện mới
     if filtered_events:
@@ -661,6 +1655,43 @@ def main():
             print(f"{i}. {event['date']} - {event['type']} - {event['title'][:60]}...")
         if len(filtered_events) > 10:
             print(f"... và {len(filtered_events) - 10} sự kiện khác")
+    
+    return {
+        "newEvents": len(filtered_events),
+        "existingEvents": len(existing_events),
+        "totalEvents": len(all_events),
+        "filesScanned": len(changed_files),
+        "filesSkipped": len(unchanged_files),
+        "sources": [
+            {
+                "dir": source,
+                "files": sum(1 for root in base_dirs.values() if root == source),
+                "filesScanned": sum(1 for file_path in changed_files if base_dirs[file_path] == source),
+            }
+            for source in sources
+        ],
+        "duplicates": {"id": duplicate_counts[DUPLICATE_ID], "key": duplicate_counts[DUPLICATE_KEY]},
+        "mergeCandidates": len(merge_candidates),
+        "images": dict(stats, failed=copy_pipeline.failed),
+        "derivatives": derivative_stats,
+        "messenger": messenger_counts if args.messenger else None,
+        "mediaAnalysis": dict(media_analyzer.stats, **analysis_counts) if media_analyzer is not None else None,
+        "classificationCache": {
+            "ruleset": ruleset.fingerprint,
+            "hits": _metrics.counters.get("classify_cache.hits", 0),
+            "misses": _metrics.counters.get("classify_cache.misses", 0),
+        } if classification_cache is not None else None,
+        "statCallsAvoided": media_stat_calls_avoided(),
+        "snapshotWritten": bool(wrote_snapshot),
+        "shardsWritten": written_shards,
+        "timelineVersion": timeline_version,
+        "searchIndex": {"events": len(search_index), "tokens": search_index.token_count, "updated": search_changed},
+        "timelineFile": timeline_file,
+        "sampleEvents": [
+            {"id": event["id"], "date": event["date"], "type": event["type"], "title": event["title"]}
+            for event in filtered_events[:10]
+        ],
+    }
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đo đạc cho importer
+- Timer cộng dồn theo bước (parse, classify, title, dedup, copy, write, ...)
+- Bộ đếm: số post đọc được, số post bị từng bộ lọc loại, độ chọn lọc từng bước lọc, ảnh copy/hardlink/dùng lại, ...
+- Tùy chọn chạy kèm cProfile / tracemalloc
+Kết quả gom thành một dict để ghi ra file JSON cho /api/import-facebook đọc
+"""
+
+import contextlib
+import cProfile
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+METRICS_VERSION = 1
+
+class ImportMetrics:
+    """Timer và bộ đếm cho một lần import (an toàn khi nhiều luồng copy cùng ghi)"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds, calls=1):
+        """Cộng thời gian vào một bước"""
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"seconds": 0.0, "calls": 0}
+            stage["seconds"] += seconds
+            stage["calls"] += calls
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Đo thời gian một đoạn code và cộng vào bước name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed_iter(self, name, iterable):
+        """Duyệt iterable, chỉ tính thời gian lấy từng phần tử vào bước name"""
+        iterator = iter(iterable)
+        seconds = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - started
+                    return
+                seconds += time.perf_counter() - started
+                yield item
+        finally:
+            self.add_time(name, seconds)
+
+    def count(self, name, amount=1):
+        """Tăng bộ đếm name"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, data):
+        """Cộng dồn số liệu từ process con (dict do to_dict trả về)"""
+        for name, stage in data.get("stages", {}).items():
+            self.add_time(name, stage["seconds"], stage["calls"])
+        for name, value in data.get("counters", {}).items():
+            self.count(name, value)
+
+    def to_dict(self):
+        """Số liệu hiện tại dạng dict (bước sắp theo thời gian giảm dần)"""
+        with self._lock:
+            stages = {
+                name: {"seconds": round(stage["seconds"], 6), "calls": stage["calls"]}
+                for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])
+            }
+            return {"stages": stages, "counters": dict(sorted(self.counters.items()))}
+
+    def rejections(self):
+        """Số post bị loại theo từng lý do"""
+        prefix = "rejected."
+        with self._lock:
+            return {
+                name[len(prefix):]: value
+                for name, value in self.counters.items()
+                if name.startswith(prefix)
+            }
+
+    def filters(self):
+        """Số post đi vào / qua từng bước lọc (độ chọn lọc của từng bước)"""
+        prefix = "filter."
+        result = {}
+        with self._lock:
+            for name, value in self.counters.items():
+                if name.startswith(prefix) and name.count(".") == 2:
+                    _, stage, field = name.split(".")
+                    result.setdefault(stage, {"seen": 0, "passed": 0})[field] = value
+        for stage in result.values():
+            stage["passRate"] = round(stage["passed"] / stage["seen"], 4) if stage["seen"] else None
+        return result
+
+class RunProfiler:
+    """cProfile / tracemalloc tùy chọn cho process chính"""
+
+    def __init__(self, profile_file=None, trace_memory=False, top=15):
+        self.profile_file = profile_file
+        self.trace_memory = trace_memory
+        self.top = top
+        self._profiler = None
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_file:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Dừng đo, trả về dict tóm tắt để đưa vào metrics"""
+        result = {}
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            stats = pstats.Stats(self._profiler)
+            top_functions = []
+            for (file_name, line, function), (_, calls, total, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: -item[1][3]
+            )[:self.top]:
+                top_functions.append({
+                    "function": f"{file_name}:{line}({function})",
+                    "calls": calls,
+                    "totalSeconds": round(total, 6),
+                    "cumulativeSeconds": round(cumulative, 6),
+                })
+            result["profile"] = {"file": self.profile_file, "top": top_functions}
+            self._profiler = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["memory"] = {
+                "currentBytes": current,
+                "peakBytes": peak,
+                "top": [
+                    {"location": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]
+                ],
+            }
+        return result
+
+def build_report(metrics, started_at, duration, status, summary, extra=None):
+    """Ghép metrics, tóm tắt và kết quả profiling thành báo cáo cuối cùng"""
+    report = {
+        "version": METRICS_VERSION,
+        "status": status,
+        "startedAt": started_at.isoformat(),
+        "finishedAt": datetime.now().isoformat(),
+        "durationSeconds": round(duration, 6),
+        "summary": summary,
+        "rejections": metrics.rejections(),
+        "filters": metrics.filters(),
+    }
+    report.update(metrics.to_dict())
+    if extra:
+        report.update(extra)
+    return report
+
+def print_report(report):
+    """In tóm tắt thời gian từng bước và số post bị loại"""
+    print("\nThời gian từng bước:")
+    for name, stage in report["stages"].items():
+        print(f"  {name:<18} {stage['seconds']:>9.3f}s  ({stage['calls']} lần)")
+    if report["rejections"]:
+        print("Post bị loại:")
+        for reason, value in sorted(report["rejections"].items(), key=lambda item: -item[1]):
+            print(f"  {reason:<16} {value}")
+    if report.get("filters"):
+        print("Bộ lọc (post vào -> qua):")
+        for name, stage in report["filters"].items():
+            print(f"  {name:<16} {stage['seen']:>7} -> {stage['passed']:<7} ({stage['passRate']:.0%} qua)")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker import chạy lâu dài cho /api/import-facebook
+- Giao tiếp JSON-RPC 2.0 qua stdin/stdout, mỗi dòng một message
+- Giữ nóng classifier đã biên dịch và index media giữa các lần import
+- Mỗi lần import là một job chạy nền, output được stream về dạng notification "progress"
+
+Method:
+    import   {"args": [...], "full": bool} -> job (chạy lần lượt từng job)
+    status   {"jobId": ...}                -> job kèm log gần nhất; không có jobId thì trả về thông tin worker
+    ping     {}                            -> {"pong": true, ...}
+    shutdown {}                            -> dừng sau khi job đang chạy xong
+Notification gửi về: "progress" {jobId, line}, "job" {job} mỗi khi job đổi trạng thái
+"""
+
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+import import_facebook_events as importer
+from post_classifier import get_classifier
+from post_parsing import default_sources
+
+# Số dòng log giữ lại cho mỗi job (trả về qua "status")
+LOG_TAIL_SIZE = 200
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+class RpcChannel:
+    """Ghi message JSON-RPC ra stdout gốc, mỗi message một dòng (an toàn khi nhiều luồng cùng ghi)"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps(dict(message, jsonrpc="2.0"), ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def result(self, request_id, result):
+        self.send({"id": request_id, "result": result})
+
+    def error(self, request_id, code, message):
+        self.send({"id": request_id, "error": {"code": code, "message": message}})
+
+    def notify(self, method, params):
+        self.send({"method": method, "params": params})
+
+class ProgressWriter(io.TextIOBase):
+    """Thay sys.stdout: mỗi dòng print của importer thành một notification "progress"
+
+    Mỗi luồng có buffer riêng để dòng của luồng copy ảnh không bị trộn lẫn nhau
+    """
+
+    def __init__(self, on_line):
+        self._on_line = on_line
+        self._local = threading.local()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", "") + text
+        *lines, self._local.buffer = buffer.split("\n")
+        for line in lines:
+            self._on_line(line)
+        return len(text)
+
+    def flush(self):
+        buffer = getattr(self._local, "buffer", "")
+        if buffer:
+            self._local.buffer = ""
+            self._on_line(buffer)
+
+class Job:
+    """Một lần import"""
+
+    def __init__(self, job_id, args):
+        self.id = job_id
+        self.args = args
+        self.state = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.report = None
+        self.log = deque(maxlen=LOG_TAIL_SIZE)
+
+    def to_dict(self, include_log=False):
+        data = {
+            "jobId": self.id,
+            "args": self.args,
+            "state": self.state,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "report": self.report,
+        }
+        if include_log:
+            data["log"] = list(self.log)
+        return data
+
+class ImportWorker:
+    """Nhận lệnh JSON-RPC, chạy job import lần lượt trên một luồng nền"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.started = time.time()
+        self.jobs = {}
+        self._next_job = 1
+        self._queue = queue.Queue()
+        self._current = None
+        self._thread = threading.Thread(target=self._run_jobs, name="import-jobs", daemon=True)
+        self._thread.start()
+
+    def on_line(self, line):
+        """Dòng output của importer: lưu vào job đang chạy và stream về cho client"""
+        job = self._current
+        if job is not None:
+            job.log.append(line)
+        self.channel.notify("progress", {"jobId": job.id if job else None, "line": line})
+
+    def warm_up(self):
+        """Biên dịch classifier và index media trước khi có job đầu tiên"""
+        get_classifier()
+        sources = [source for source in default_sources() if os.path.isdir(source)]
+        if sources:
+            media_index, _ = importer.load_media_index(sources)
+            importer.set_media_index(media_index)
+            print(f"Worker sẵn sàng, đã index {len(media_index)} file media")
+        else:
+            print("Worker sẵn sàng")
+
+    def handle(self, message):
+        """Xử lý một request JSON-RPC"""
+        request_id = message.get("id")
+        method = message.get("method")
+        params = message.get("params") or {}
+        if not isinstance(method, str) or not isinstance(params, dict):
+            self.channel.error(request_id, INVALID_REQUEST, "Request không hợp lệ")
+            return True
+        handler = {
+            "import": self.rpc_import,
+            "status": self.rpc_status,
+            "ping": self.rpc_ping,
+            "shutdown": self.rpc_shutdown,
+        }.get(method)
+        if handler is None:
+            self.channel.error(request_id, METHOD_NOT_FOUND, f"Không có method {method}")
+            return True
+        try:
+            result, keep_running = handler(params)
+        except ValueError as e:
+            self.channel.error(request_id, INVALID_PARAMS, str(e))
+            return True
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            self.channel.error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+            return True
+        if request_id is not None:
+            self.channel.result(request_id, result)
+        return keep_running
+
+    def rpc_import(self, params):
+        args = params.get("args") or []
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise ValueError("args phải là danh sách chuỗi")
+        if params.get("full") and "--full" not in args:
+            args = args + ["--full"]
+        try:
+            importer.parse_args(args)
+        except SystemExit:
+            raise ValueError(f"Tham số import không hợp lệ: {' '.join(args)}")
+        job = Job(str(self._next_job), args)
+        self._next_job += 1
+        self.jobs[job.id] = job
+        self._queue.put(job)
+        self.channel.notify("job", job.to_dict())
+        return job.to_dict(), True
+
+    def rpc_status(self, params):
+        job_id = params.get("jobId")
+        if job_id is None:
+            media_index = importer.get_media_index()
+            return {
+                "pid": os.getpid(),
+                "uptimeSeconds": round(time.time() - self.started, 3),
+                "currentJob": self._current.id if self._current else None,
+                "queuedJobs": self._queue.qsize(),
+                "jobs": len(self.jobs),
+                "mediaIndexFiles": len(media_index) if media_index is not None else None,
+            }, True
+        job = self.jobs.get(str(job_id))
+        if job is None:
+            raise ValueError(f"Không có job {job_id}")
+        return job.to_dict(include_log=True), True
+
+    def rpc_ping(self, params):
+        return {"pong": True, "pid": os.getpid(), "uptimeSeconds": round(time.time() - self.started, 3)}, True
+
+    def rpc_shutdown(self, params):
+        return {"stopping": True}, False
+
+    def _run_jobs(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._current = job
+            job.state = "running"
+            job.started_at = datetime.now().isoformat()
+            self.channel.notify("job", job.to_dict())
+            try:
+                report = importer.execute(importer.parse_args(job.args))
+            except BaseException as e:
+                traceback.print_exc()
+                report = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            sys.stdout.flush()
+            job.report = report
+            job.state = "completed" if report.get("status") == "ok" else "failed"
+            job.finished_at = datetime.now().isoformat()
+            self._current = None
+            self.channel.notify("job", job.to_dict())
+
+    def stop(self):
+        """Chờ job đang chạy và các job đã xếp hàng xong rồi dừng"""
+        self._queue.put(None)
+        self._thread.join()
+
+def serve():
+    """Chạy worker trên stdin/stdout cho tới khi nhận shutdown hoặc stdin bị đóng"""
+    # stdout gốc chỉ dành cho JSON-RPC; mọi thứ ghi thẳng vào fd 1 (process con, thư viện C) chuyển sang stderr
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    channel = RpcChannel(protocol)
+    worker = ImportWorker(channel)
+    sys.stdout = ProgressWriter(worker.on_line)
+
+    worker.warm_up()
+    sys.stdout.flush()
+    channel.notify("ready", {"pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            channel.error(None, PARSE_ERROR, f"JSON không hợp lệ: {e}")
+            continue
+        if not isinstance(message, dict):
+            channel.error(None, INVALID_REQUEST, "Request phải là object JSON")
+            continue
+        if not worker.handle(message):
+            break
+    worker.stop()
+
+if __name__ == "__main__":
+    serve()
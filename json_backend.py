@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backend JSON dùng chung cho các script Python của timeline
+Dùng orjson hoặc ujson nếu đã cài, không có thì quay về thư viện json chuẩn.
+Có thể ép backend bằng biến môi trường TIMELINE_JSON_BACKEND=orjson|ujson|json
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+def _pick_backend():
+    """Chọn backend nhanh nhất đang có"""
+    wanted = os.environ.get("TIMELINE_JSON_BACKEND", "").strip().lower()
+    available = {"orjson": orjson, "ujson": ujson}
+    if wanted == "json":
+        return "json"
+    if wanted in available:
+        if available[wanted] is not None:
+            return wanted
+        print(f"Chưa cài {wanted}, dùng json chuẩn thay thế")
+        return "json"
+    if orjson is not None:
+        return "orjson"
+    if ujson is not None:
+        return "ujson"
+    return "json"
+
+BACKEND = _pick_backend()
+
+def loads(data):
+    """Parse JSON từ str hoặc bytes"""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    if BACKEND == "ujson":
+        return ujson.loads(data)
+    return json.loads(data)
+
+def dumps(obj, pretty=True):
+    """Serialize ra bytes UTF-8; pretty=True thụt lề 2 space như json.dump(indent=2)"""
+    if BACKEND == "orjson":
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if BACKEND == "ujson":
+        text = ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False, indent=2 if pretty else 0
+        )
+    elif pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return text.encode('utf-8')
+
+def load(file_path):
+    """Đọc và parse file JSON"""
+    with open(file_path, 'rb') as f:
+        return loads(f.read())
+
+def dump(obj, file_path, pretty=True):
+    """Ghi obj ra file JSON"""
+    data = dumps(obj, pretty=pretty)
+    with open(file_path, 'wb') as f:
+        f.write(data)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phân tích ảnh đính kèm của post khi import
+- Đọc ngày chụp trong EXIF: album up ảnh cũ thì event được xếp về ngày chụp thay vì ngày đăng
+- Tính perceptual hash (dHash 64 bit) để phát hiện ảnh trùng giữa các event kể cả khi bị nén lại
+- Chạy song song trên nhiều process; kết quả lưu ở data/media_analysis.json theo đường dẫn + mtime,
+  import lại không phải giải mã lại ảnh nào
+Cần Pillow (pip install Pillow); chưa cài thì importer vẫn chạy, event giữ ngày đăng
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import json_backend
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+INDEX_FILE_NAME = "media_analysis.json"
+INDEX_VERSION = 1
+IMAGE_EXTENSIONS = frozenset([".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".heic"])
+
+# Tag EXIF: DateTimeOriginal, DateTimeDigitized (trong Exif IFD), DateTime (IFD0)
+EXIF_IFD = 0x8769
+EXIF_DATE_TAGS = (0x9003, 0x9004)
+IFD0_DATE_TAG = 0x0132
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+# Ngày chụp sớm hơn ngày đăng quá số ngày này thì event được xếp về ngày chụp
+DEFAULT_MIN_GAP_DAYS = 2
+# Hai ảnh có hash lệch không quá số bit này coi là cùng một ảnh
+DEFAULT_MAX_DISTANCE = 3
+# Hash chia thành HASH_BANDS đoạn: lệch ít hơn HASH_BANDS bit thì chắc chắn có một đoạn trùng khít
+HASH_BANDS = 4
+# Ảnh một màu / không có chi tiết cho hash toàn 0: không dùng để so trùng
+FLAT_HASH = "0" * 16
+
+def _parse_exif_date(value):
+    """'2019:05:01 10:20:30' -> ISO, None nếu không hợp lệ (máy chưa đặt giờ thường ghi 0000:00:00)"""
+    if not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.strptime(value.strip().rstrip("\x00")[:19], EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+    if dt.year < 1990 or dt > datetime.now() + timedelta(days=1):
+        return None
+    return dt.isoformat()
+
+def read_capture_date(image):
+    """Ngày chụp trong EXIF của ảnh đã mở (ISO), None nếu không có"""
+    exif = image.getexif()
+    if not exif:
+        return None
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    for tag in EXIF_DATE_TAGS:
+        taken = _parse_exif_date(exif_ifd.get(tag))
+        if taken:
+            return taken
+    return _parse_exif_date(exif.get(IFD0_DATE_TAG))
+
+def difference_hash(image):
+    """dHash 64 bit (16 ký tự hex): so sánh độ sáng các điểm cạnh nhau của ảnh thu về 9x8"""
+    pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{value:016x}"
+
+def analyze_image(source_path):
+    """Đọc ngày chụp và tính hash cho một ảnh (chạy trong process con)"""
+    with Image.open(source_path) as image:
+        taken = read_capture_date(image)
+        # JPEG: giải mã ở độ phân giải thấp, đủ cho hash 9x8 mà nhanh hơn nhiều
+        image.draft("L", (64, 64))
+        return {"taken": taken, "hash": difference_hash(image)}
+
+def hash_distance(hash_a, hash_b):
+    """Số bit khác nhau giữa hai hash"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+def _fingerprint(path, media_indexes=()):
+    """Kích thước + mtime của file; file nằm trong cây đã index (export, public/images) thì không stat lại"""
+    for media_index in media_indexes:
+        if media_index.covers(path):
+            entry = media_index.stat(path)
+            if entry is None:
+                raise FileNotFoundError(path)
+            return f"{entry[0]}-{entry[1]}"
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+class MediaAnalyzer:
+    """Phân tích ảnh bằng process pool, nhớ kết quả theo đường dẫn + mtime"""
+
+    def __init__(self, index_file, workers=None, media_indexes=()):
+        self.index_file = index_file
+        self.workers = workers or os.cpu_count() or 1
+        # Các MediaIndex (export, public/images): ảnh nằm trong đó lấy kích thước/mtime từ index
+        self.media_indexes = tuple(media_indexes)
+        self.stats = {"analyzed": 0, "cached": 0, "failed": 0}
+        self._index = None
+        self._dirty = False
+        self._executor = None
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        if os.path.exists(self.index_file):
+            try:
+                data = json_backend.load(self.index_file)
+                if data.get("version") == INDEX_VERSION:
+                    self._index = data.get("images", {})
+            except Exception as e:
+                print(f"Lỗi khi đọc kết quả phân tích ảnh {self.index_file}: {e}")
+        return self._index
+
+    def analyze(self, paths):
+        """Trả về {đường dẫn: {"taken", "hash"}} cho các ảnh đọc được (ảnh lỗi không có trong kết quả)"""
+        if not self.available:
+            return {}
+        index = self._load()
+        results = {}
+        pending = {}
+        for path in dict.fromkeys(paths):
+            if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            try:
+                fingerprint = _fingerprint(path, self.media_indexes)
+            except OSError:
+                continue
+            entry = index.get(path)
+            if entry is not None and entry.get("source") == fingerprint:
+                self.stats["cached"] += 1
+                if entry.get("hash"):
+                    results[path] = entry
+                continue
+            pending[path] = fingerprint
+
+        if not pending:
+            return results
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        futures = {path: self._executor.submit(analyze_image, path) for path in pending}
+        for path, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                # Ghi nhớ cả ảnh lỗi để lần sau không giải mã lại khi file chưa đổi
+                self.stats["failed"] += 1
+                print(f"  ✗ Không phân tích được ảnh {os.path.basename(path)}: {e}")
+                index[path] = {"source": pending[path], "taken": None, "hash": None}
+                self._dirty = True
+                continue
+            entry = index[path] = {"source": pending[path], "taken": result["taken"], "hash": result["hash"]}
+            self._dirty = True
+            self.stats["analyzed"] += 1
+            results[path] = entry
+        return results
+
+    def alias(self, path, source_path):
+        """Ghi nhận path (bản copy/hardlink của source_path) có cùng kết quả mà không giải mã lại"""
+        index = self._load()
+        entry = index.get(source_path)
+        if entry is None or not entry.get("hash"):
+            return
+        try:
+            fingerprint = _fingerprint(path, self.media_indexes)
+        except OSError:
+            return
+        if index.get(path, {}).get("source") != fingerprint:
+            index[path] = {"source": fingerprint, "taken": entry["taken"], "hash": entry["hash"]}
+            self._dirty = True
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def save(self):
+        """Ghi kết quả xuống đĩa nếu có thay đổi"""
+        if not self._dirty or self._index is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+        json_backend.dump({"version": INDEX_VERSION, "images": self._index}, self.index_file, pretty=False)
+        self._dirty = False
+
+def capture_date(results, posted_at, min_gap_days=DEFAULT_MIN_GAP_DAYS):
+    """Ngày chụp sớm nhất của các ảnh nếu sớm hơn ngày đăng quá min_gap_days, không thì None"""
+    taken = [entry["taken"] for entry in results if entry.get("taken")]
+    if not taken:
+        return None
+    earliest = datetime.fromisoformat(min(taken))
+    if earliest < posted_at - timedelta(days=min_gap_days):
+        return earliest
+    return None
+
+class ImageHashIndex:
+    """Tìm ảnh gần giống theo hash, chỉ so với các ảnh có ít nhất một đoạn hash trùng khít"""
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        if max_distance >= HASH_BANDS:
+            raise ValueError(f"max_distance phải nhỏ hơn {HASH_BANDS}")
+        self.max_distance = max_distance
+        self._bands = [{} for _ in range(HASH_BANDS)]
+        self._owners = {}
+
+    @staticmethod
+    def _band_keys(image_hash):
+        width = 16 // HASH_BANDS
+        return [image_hash[i * width:(i + 1) * width] for i in range(HASH_BANDS)]
+
+    def add(self, image_hash, owner):
+        """Ghi nhận ảnh có hash image_hash thuộc về owner (id event)"""
+        if image_hash == FLAT_HASH:
+            return
+        owners = self._owners.setdefault(image_hash, set())
+        if not owners:
+            for band, key in zip(self._bands, self._band_keys(image_hash)):
+                band.setdefault(key, []).append(image_hash)
+        owners.add(owner)
+
+    def matches(self, image_hash):
+        """Các owner có ảnh lệch không quá max_distance bit so với image_hash"""
+        found = set()
+        if image_hash == FLAT_HASH:
+            return found
+        checked = set()
+        for band, key in zip(self._bands, self._band_keys(image_hash)):
+            for other in band.get(key, ()):
+                if other in checked:
+                    continue
+                checked.add(other)
+                if hash_distance(image_hash, other) <= self.max_distance:
+                    found |= self._owners[other]
+        return found
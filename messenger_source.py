@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Nguồn sự kiện từ tin nhắn Messenger (messages/inbox/*/message_N.json)
+- Đọc từng tin nhắn theo kiểu stream, không nạp cả file (một cuộc hội thoại có thể lên tới nhiều GB)
+- Dùng lại PostClassifier (post_classifier): lọc thô bằng chuỗi neo trên text gốc, chỉ tin nhắn có thể liên quan mới phân loại đầy đủ
+- Gom tin nhắn thành thống kê theo ngày; bộ nhớ chỉ phụ thuộc số ngày của cuộc hội thoại, không phụ thuộc số tin nhắn
+- Ngày ứng viên: tin nhắn đầu tiên, ngày có nhiều tin nhắn về vợ/con, ngày gửi ảnh kèm tin nhắn liên quan
+- Các cuộc hội thoại được quét song song trên process pool
+
+Ví dụ:
+    python3 messenger_source.py /path/to/facebook-export --workers 4
+"""
+
+import argparse
+import os
+import re
+import sys
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from event_model import Event
+from post_classifier import get_classifier, get_title_builder
+from post_parsing import JsonStreamReader, default_sources, fix_encoding
+
+# Thư mục chứa tin nhắn trong export (bản mới / bản cũ) và các nhóm hội thoại được quét
+MESSAGE_DIRS = [os.path.join("your_facebook_activity", "messages"), "messages"]
+THREAD_GROUPS = ["inbox", "archived_threads"]
+
+# Cùng mốc với post: chỉ lấy từ năm 2015
+MIN_YEAR = 2015
+# Ngày "dày" từ khóa: ít nhất MIN_RELEVANT_MESSAGES tin liên quan, tỉ lệ tin liên quan trong ngày
+# không dưới MIN_KEYWORD_DENSITY và gấp KEYWORD_DENSITY_FACTOR lần mức trung bình của cả cuộc hội thoại
+# (hội thoại với vợ thì ngày nào cũng có "em yêu", chỉ ngày nổi bật mới thành sự kiện)
+MIN_RELEVANT_MESSAGES = 3
+MIN_KEYWORD_DENSITY = 0.1
+KEYWORD_DENSITY_FACTOR = 3
+# Ngày có từ ngần này tin nhắn nhắc tới sự kiện quan trọng (sinh nhật, du lịch, kỷ niệm...)
+MIN_SIGNIFICANT_MESSAGES = 2
+# Giới hạn dữ liệu giữ lại cho mỗi ngày
+MAX_DAY_SNIPPETS = 5
+MAX_DAY_PHOTOS = 10
+SNIPPET_LENGTH = 200
+
+Conversation = namedtuple("Conversation", ["thread_dir", "base_dir", "files"])
+
+_MESSAGE_FILE = re.compile(r"message_(\d+)\.json$")
+
+def list_conversations(root):
+    """Các cuộc hội thoại trong export, mỗi cuộc gồm các file message_N.json theo thứ tự N"""
+    conversations = []
+    for messages_dir in MESSAGE_DIRS:
+        for group in THREAD_GROUPS:
+            group_dir = os.path.join(root, messages_dir, group)
+            if not os.path.isdir(group_dir):
+                continue
+            for thread in sorted(os.listdir(group_dir)):
+                thread_dir = os.path.join(group_dir, thread)
+                if not os.path.isdir(thread_dir):
+                    continue
+                numbered = []
+                for name in os.listdir(thread_dir):
+                    match = _MESSAGE_FILE.match(name)
+                    if match:
+                        numbered.append((int(match.group(1)), name))
+                if numbered:
+                    files = [os.path.join(thread_dir, name) for _, name in sorted(numbered)]
+                    conversations.append(Conversation(thread_dir, root, files))
+    return conversations
+
+def iter_messages(file_path, info):
+    """Stream từng tin nhắn trong một file message_N.json; title/participants được ghi vào info"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f)
+        if reader.peek() != "{":
+            return
+        for key in reader.iter_keys():
+            if key == "messages" and reader.peek() == "[":
+                yield from reader.iter_array()
+            elif key in ("title", "participants"):
+                info[key] = reader.value()
+            else:
+                reader.skip()
+
+class _Day:
+    """Thống kê tin nhắn của một ngày trong cuộc hội thoại"""
+
+    __slots__ = ("messages", "relevant", "significant", "first_relevant", "snippets", "photos")
+
+    def __init__(self):
+        self.messages = 0
+        self.relevant = 0
+        self.significant = 0
+        self.first_relevant = None
+        # (timestamp, người gửi gốc, text đã sửa encoding), chỉ giữ MAX_DAY_SNIPPETS tin liên quan sớm nhất
+        self.snippets = []
+        # (timestamp, uri), chỉ giữ MAX_DAY_PHOTOS ảnh sớm nhất
+        self.photos = []
+
+def _snippet(sender, text):
+    """Đoạn tin nhắn đưa vào mô tả sự kiện"""
+    return f"{fix_encoding(sender or '')}: {text[:SNIPPET_LENGTH]}"
+
+def _keep_earliest(items, item, limit):
+    """Thêm item (timestamp, ...) vào items, chỉ giữ limit phần tử có timestamp nhỏ nhất"""
+    if len(items) < limit:
+        items.append(item)
+        return
+    latest = max(range(len(items)), key=lambda i: items[i][0])
+    if item[0] < items[latest][0]:
+        items[latest] = item
+
+class ConversationScanner:
+    """Gom tin nhắn của một cuộc hội thoại thành thống kê theo ngày rồi chọn ra ngày ứng viên"""
+
+    def __init__(self, classifier=None, title_builder=None, media_index=None):
+        self.classifier = classifier or get_classifier()
+        self.title_builder = title_builder or get_title_builder()
+        self.media_index = media_index
+        self.info = {}
+        self.days = {}
+        self.first_message = None
+        self.stats = {"messages": 0, "classified": 0, "relevant": 0}
+
+    def add(self, message):
+        """Ghi nhận một tin nhắn (dict theo cấu trúc export)"""
+        timestamp_ms = message.get("timestamp_ms")
+        if not isinstance(timestamp_ms, (int, float)):
+            return
+        timestamp = timestamp_ms / 1000
+        try:
+            dt = datetime.fromtimestamp(timestamp)
+        except (OverflowError, OSError, ValueError):
+            return
+        if dt.year < MIN_YEAR:
+            return
+        self.stats["messages"] += 1
+        day = self.days.get(dt.date())
+        if day is None:
+            day = self.days[dt.date()] = _Day()
+        day.messages += 1
+
+        content = message.get("content")
+        if isinstance(content, str) and content:
+            # Giữ chuỗi gốc, chỉ sửa encoding khi thật sự dùng tới
+            if self.first_message is None or timestamp < self.first_message[0]:
+                self.first_message = (timestamp, message.get("sender_name"), content)
+            # Lọc thô trên text gốc trước, đa số tin nhắn dừng ở đây
+            if self.classifier.may_mention(content):
+                self.stats["classified"] += 1
+                text = fix_encoding(content)
+                verdict = self.classifier.classify(text, [])
+                if (verdict.wife or verdict.children) and not verdict.spam and not verdict.other_people:
+                    self.stats["relevant"] += 1
+                    day.relevant += 1
+                    day.significant += verdict.significant
+                    if day.first_relevant is None or timestamp < day.first_relevant:
+                        day.first_relevant = timestamp
+                    _keep_earliest(day.snippets, (timestamp, message.get("sender_name"), text), MAX_DAY_SNIPPETS)
+
+        for photo in message.get("photos") or ():
+            if isinstance(photo, dict) and photo.get("uri"):
+                _keep_earliest(day.photos, (timestamp, photo["uri"]), MAX_DAY_PHOTOS)
+
+    @property
+    def title(self):
+        """Tên cuộc hội thoại (tên người/nhóm)"""
+        title = self.info.get("title")
+        if title:
+            return fix_encoding(title)
+        names = [fix_encoding(p.get("name", "")) for p in self.info.get("participants") or () if isinstance(p, dict)]
+        return ", ".join(name for name in names if name) or "Messenger"
+
+    def _photo_paths(self, day, base_dir):
+        paths = []
+        for _, uri in sorted(day.photos):
+            path = os.path.join(base_dir, uri)
+            if self.media_index is not None and self.media_index.covers(path):
+                exists = self.media_index.exists(path)
+            else:
+                exists = os.path.exists(path)
+            if exists:
+                paths.append(path)
+        return paths
+
+    def _kind(self, date, day, first_date, min_density):
+        """Lý do ngày được chọn làm sự kiện, None nếu không chọn"""
+        if date == first_date:
+            return "first-message"
+        if day.relevant and day.photos:
+            return "photos"
+        if day.relevant >= MIN_RELEVANT_MESSAGES and day.relevant >= day.messages * min_density:
+            return "keywords"
+        if day.significant >= MIN_SIGNIFICANT_MESSAGES:
+            return "keywords"
+        return None
+
+    def events(self, base_dir):
+        """Các sự kiện ứng viên theo thứ tự ngày"""
+        events = []
+        # Cuộc hội thoại không có tin nhắn nào về vợ/con thì bỏ qua cả tin nhắn đầu tiên
+        if not self.stats["relevant"]:
+            return events
+        thread_title = self.title
+        first_date = datetime.fromtimestamp(self.first_message[0]).date() if self.first_message else None
+        density = self.stats["relevant"] / self.stats["messages"]
+        min_density = max(MIN_KEYWORD_DENSITY, density * KEYWORD_DENSITY_FACTOR)
+        for date in sorted(self.days):
+            day = self.days[date]
+            kind = self._kind(date, day, first_date, min_density)
+            if kind is None:
+                continue
+            messages = sorted(day.snippets)
+            if kind == "first-message":
+                timestamp, sender, content = self.first_message
+                if not messages or messages[0][0] != timestamp:
+                    messages = ([(timestamp, sender, fix_encoding(content))] + messages)[:MAX_DAY_SNIPPETS]
+            else:
+                timestamp = day.first_relevant
+            dt = datetime.fromtimestamp(timestamp)
+            # Phân loại trên cả ngày, title lấy từ tin nhắn liên quan đầu tiên
+            verdict = self.classifier.classify("\n".join(text for _, _, text in messages), [])
+            if kind == "first-message":
+                event_type = "first-meet"
+                title = f"Tin nhắn đầu tiên với {thread_title}"[:100]
+            else:
+                event_type = verdict.event_type
+                title = self.title_builder.build(messages[0][2], verdict, dt)
+            snippets = "\n".join(_snippet(sender, text) for _, sender, text in messages)
+            description = f"Messenger - {thread_title} ({day.messages} tin nhắn)\n{snippets}"
+            event = Event(timestamp, dt, event_type, title, description)
+            for path in self._photo_paths(day, base_dir):
+                event.add_image(os.path.basename(path), path)
+            events.append(event)
+        return events
+
+def scan_conversation(conversation, classifier=None, title_builder=None, media_index=None):
+    """Quét một cuộc hội thoại, trả về (events, ok, stats, lỗi); ok=False nếu có file bị lỗi"""
+    scanner = ConversationScanner(classifier, title_builder, media_index)
+    ok = True
+    errors = []
+    for file_path in conversation.files:
+        try:
+            for message in iter_messages(file_path, scanner.info):
+                if isinstance(message, dict):
+                    scanner.add(message)
+        except Exception as e:
+            ok = False
+            errors.append(f"Lỗi khi đọc file {file_path}: {e}")
+    events = scanner.events(conversation.base_dir)
+    stats = dict(scanner.stats, days=len(scanner.days), events=len(events))
+    return events, ok, stats, errors
+
+# Classifier và index media của process con (nhận qua initializer)
+_worker_state = {}
+
+def _init_worker(classifier, title_builder, media_index):
+    _worker_state.update(classifier=classifier, title_builder=title_builder, media_index=media_index)
+
+def _scan_in_worker(conversation):
+    return scan_conversation(conversation, **_worker_state)
+
+def iter_scanned_conversations(conversations, classifier=None, title_builder=None, media_index=None, workers=1):
+    """Quét các cuộc hội thoại, yield (conversation, events, ok, stats) theo đúng thứ tự đầu vào"""
+    classifier = classifier or get_classifier()
+    title_builder = title_builder or get_title_builder()
+    if workers <= 1 or len(conversations) <= 1:
+        for conversation in conversations:
+            events, ok, stats, errors = scan_conversation(conversation, classifier, title_builder, media_index)
+            for error in errors:
+                print(error)
+            yield conversation, events, ok, stats
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(classifier, title_builder, media_index),
+    ) as executor:
+        futures = [executor.submit(_scan_in_worker, conversation) for conversation in conversations]
+        for conversation, future in zip(conversations, futures):
+            try:
+                events, ok, stats, errors = future.result()
+            except Exception as e:
+                print(f"Lỗi khi quét hội thoại {conversation.thread_dir}: {e}")
+                traceback.print_exc()
+                yield conversation, [], False, {}
+                continue
+            for error in errors:
+                print(error)
+            yield conversation, events, ok, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Liệt kê sự kiện ứng viên từ tin nhắn Messenger")
+    parser.add_argument("sources", nargs="*", help="Thư mục export Facebook (mặc định như importer)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Số process quét song song")
+    parser.add_argument("--limit", type=int, default=20, help="Số sự kiện in ra tối đa (mặc định 20)")
+    args = parser.parse_args(argv)
+
+    conversations = [
+        conversation for source in (args.sources or default_sources()) for conversation in list_conversations(source)
+    ]
+    print(f"Tìm thấy {len(conversations)} cuộc hội thoại")
+    all_events = []
+    totals = {}
+    for _, events, _, stats in iter_scanned_conversations(conversations, workers=max(args.workers, 1)):
+        all_events.extend(events)
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+    print(
+        f"{totals.get('messages', 0)} tin nhắn, {totals.get('relevant', 0)} tin liên quan, "
+        f"{len(all_events)} sự kiện ứng viên"
+    )
+    for event in sorted(all_events, key=lambda event: event.date_iso)[:args.limit]:
+        print(f"  {event.date} - {event.type} - {event.title[:60]} ({len(event.images)} ảnh)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
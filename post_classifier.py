@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phân loại post và tạo title cho importer
+- Bộ luật (từ khóa, pattern) là các hằng của module, ghi đè được một phần bằng file JSON (Ruleset, --rules)
+- PostClassifier biên dịch sẵn mọi từ khóa/pattern, quét text của post một lần cho mọi kết luận
+- TitleBuilder tạo title từ tập từ khóa mà PostClassifier đã quét
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+import json_backend
+from post_parsing import format_date_for_timeline, raw_strings
+
+# Tên vợ để nhận diện
+WIFE_NAMES = ["nương nương", "nuong nuong", "nuongnuong", "vợ yêu", "vo yeu", "em yêu", "em yeu"]
+
+# Tên con để nhận diện
+CHILDREN_NAMES = ["bee", "sam", "con trai", "con gái", "con gai", "son", "daughter"]
+
+# Từ khóa loại trừ (spam, quảng cáo)
+EXCLUDE_KEYWORDS = [
+    "vnreview", "lenovo", "vibe", "vob", "lvs", "ls", "lvx",  # Quảng cáo điện thoại
+    "đăng ký", "dang ky", "đăng ký thành công", "mã số", "ma so",  # Spam
+    "kết quả trúng thưởng", "ket qua trung thuong",  # Quảng cáo
+    "nhận quà", "nhan qua", "chương trình", "chuong trinh",  # Marketing
+    "voucher", "nhommua", "affiliate",  # Quảng cáo
+    "đề xuất", "de xuat",  # Facebook suggestions
+]
+
+# Từ khóa loại trừ người khác
+EXCLUDE_PEOPLE = [
+    "em trai", "em gái", "em gai", "em trai", "anh trai", "chị gái", "chi gai",
+    "brother", "sister", "bạn", "ban", "friend"
+]
+
+# Dấu hiệu link và từ khóa quảng cáo đi kèm link
+LINK_MARKERS = ["http", "www."]
+AD_INDICATORS = ["đăng ký", "mã số", "trúng thưởng", "nhận quà"]
+
+# Pattern nhận diện post về vợ
+WIFE_PATTERNS = [
+    # "vợ yêu", "em yêu", "Nương Nương"
+    r"vợ\s+yêu", r"vo\s+yeu",
+    r"em\s+yêu", r"em\s+yeu",
+    r"nương\s+nương", r"nuong\s+nuong",
+    r"cùng\s+với\s+nương", r"cung\s+voi\s+nuong",
+    r"với\s+nương", r"voi\s+nuong",
+    r"vợ\s+@", r"vo\s+@",
+    # "chúc mừng sinh nhật vợ", "happy birthday vợ"
+    r"chúc\s+mừng\s+sinh\s+nhật\s+vợ", r"chuc\s+munng\s+sinh\s+nhat\s+vo",
+    r"happy\s+birthday\s+.*vợ", r"happy\s+birthday\s+.*vo",
+    r"sinh\s+nhật\s+vợ", r"sinh\s+nhat\s+vo",
+    # "cùng vợ", "với vợ", "ăn tối cùng vợ"
+    r"cùng\s+vợ", r"cung\s+vo",
+    r"với\s+vợ", r"voi\s+vo",
+    r"ăn\s+tối\s+cùng\s+vợ", r"an\s+toi\s+cung\s+vo",
+    r"đi\s+chơi\s+với\s+vợ", r"di\s+choi\s+voi\s+vo",
+]
+
+# Pattern nhận diện post về con - "Bee", "Sam", "con trai", "con gái"
+CHILDREN_PATTERNS = [
+    r"\bbee\b",
+    r"\bsam\b",
+    r"con\s+trai",
+    r"con\s+gái", r"con\s+gai",
+    r"ku\s+bee", r"ku\s+sam",
+    r"bé\s+bee", r"bé\s+sam",
+]
+
+# Các từ khóa chỉ sự kiện quan trọng
+SIGNIFICANT_KEYWORDS = [
+    "cưới", "cuoi", "wedding", "kết hôn", "ket hon",
+    "đính hôn", "dinh hon", "engagement",
+    "sinh", "birth", "mang thai", "pregnancy",
+    "kỷ niệm", "ky niem", "anniversary",
+    "du lịch", "du lich", "travel", "trip",
+    "chúc mừng sinh nhật", "happy birthday",
+    "đầy tháng", "day thang", "tròn 1 tháng", "tron 1 thang", "full month",
+    "tạm biệt", "tam biet", "goodbye",
+    "ăn tối", "an toi", "dinner",
+    "check in", "checkin",
+]
+
+# Sự kiện về con (đầy tháng), được xét trước mọi loại khác
+FULL_MONTH_KEYWORDS = ["đầy tháng", "day thang", "tròn 1 tháng", "tron 1 thang", "full month", "tròn 1 thang"]
+
+# Loại sự kiện theo từ khóa, xét lần lượt từ trên xuống
+EVENT_TYPE_RULES = [
+    ("wedding", ["cưới", "cuoi", "wedding", "kết hôn", "ket hon"]),
+    ("engagement", ["đính hôn", "dinh hon", "engagement"]),
+    ("birth", ["sinh", "birth"]),
+    ("pregnancy", ["mang thai", "pregnancy"]),
+    ("travel", ["du lịch", "du lich", "travel", "trip", "đi chơi"]),
+    ("anniversary", ["kỷ niệm", "ky niem", "anniversary"]),
+    ("birth", ["chúc mừng sinh nhật", "happy birthday", "sinh nhật"]),
+    ("confess-love", ["nhận lời yêu", "nhan loi yeu", "chấp nhận yêu", "chap nhan yeu", "đồng ý yêu", "dong y yeu"]),
+    ("dating", ["ăn tối", "an toi", "dinner", "check in"]),
+    ("dating", ["hẹn hò", "hen ho", "dating"]),
+    ("first-meet", ["gặp", "gap", "meet", "lần đầu"]),
+]
+
+# Các đoạn bị bỏ khỏi title, áp dụng lần lượt (không phân biệt hoa thường)
+TITLE_CLEANUP_PATTERNS = [r"Võ Tuấn Nguyên đã.*?\.", r"đã thêm.*?ảnh", r"đã chia sẻ.*?\.", r"đã đăng.*?\.", r"đang.*?\."]
+# Mọi pattern dọn title đều chứa một trong hai chuỗi này: không có thì bỏ qua cả 5 lần thay thế
+TITLE_CLEANUP_TRIGGER = r"đã|đang"
+
+# Title cho sự kiện về con (đầy tháng, sinh nhật)
+TITLE_FULL_MONTH_KEYWORDS = ["đầy tháng", "day thang", "tròn 1 tháng", "tron 1 thang"]
+TITLE_BIRTHDAY_KEYWORDS = ["sinh nhật", "birthday"]
+# Title cho sự kiện về vợ, xét lần lượt: mỗi nhóm phải có ít nhất một từ khóa
+TITLE_WIFE_RULES = [
+    ("Chúc mừng sinh nhật vợ yêu", [["chúc mừng sinh nhật", "happy birthday"]]),
+    ("Cùng vợ đi chơi", [["cùng"], ["vợ"]]),
+    ("Ăn tối cùng vợ", [["ăn tối"]]),
+    ("Du lịch cùng vợ", [["du lịch", "travel"]]),
+    ("Kỷ niệm với vợ", [["kỷ niệm", "anniversary"]]),
+]
+# Title không có ý nghĩa, cần tạo lại từ nội dung
+TITLE_PLACEHOLDERS = ["checkin", "check in", "sự kiện"]
+
+# Từ khóa bước tạo title cần biết có mặt hay không, được quét chung trong regex của PostClassifier
+TITLE_KEYWORDS = frozenset(
+    TITLE_FULL_MONTH_KEYWORDS + TITLE_BIRTHDAY_KEYWORDS + ["bee", "sam"] + WIFE_NAMES + CHILDREN_NAMES
+    + [keyword for _, groups in TITLE_WIFE_RULES for group in groups for keyword in group]
+)
+
+# Kết quả phân loại một post
+PostVerdict = namedtuple(
+    "PostVerdict",
+    ["spam", "wife", "children", "other_people", "significant", "event_type", "hits"],
+)
+
+def _keyword_trie_pattern(keywords):
+    """Dựng regex dạng trie, khớp từ khóa dài nhất bắt đầu tại mỗi vị trí"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[None] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char is not None]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if None in node:
+            # Tham lam: thử nhánh dài hơn trước, không khớp thì dừng tại từ khóa này
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+_REGEX_SEPARATOR = re.compile(r"\\[sb][+*]?|\.[*+]")
+_REGEX_SPECIAL = frozenset("\\.^$*+?{}[]|()")
+
+def _required_literal(pattern):
+    """Chuỗi con mà mọi kết quả khớp của pattern đều phải chứa (None nếu pattern quá phức tạp)"""
+    pieces = [piece for piece in _REGEX_SEPARATOR.split(pattern) if piece]
+    if not pieces or any(char in _REGEX_SPECIAL for piece in pieces for char in piece):
+        return None
+    return max(pieces, key=len)
+
+def _raw_char_forms(char):
+    """Một ký tự (thường) dưới mọi dạng có thể gặp trong chuỗi gốc đã lowercase: đúng hoặc lỗi encoding"""
+    if char.isascii():
+        return [char]
+    forms = {char}
+    for form in (char, char.upper()):
+        forms.add(form.encode("utf-8").decode("latin-1").lower())
+    return sorted(forms)
+
+def _minimal_anchors(anchors):
+    """Bỏ chuỗi neo chứa chuỗi neo khác (chuỗi ngắn hơn đã đủ để không bỏ sót)"""
+    return frozenset(
+        anchor for anchor in anchors
+        if not any(other != anchor and other in anchor for other in anchors)
+    )
+
+def _raw_anchor_regex(anchors):
+    """Regex tìm chuỗi neo trực tiếp trên chuỗi gốc (chỉ lowercase), không cần sửa encoding"""
+    variants = set()
+    for anchor in _minimal_anchors(anchors):
+        forms = [""]
+        for char in anchor.lower():
+            forms = [prefix + form for prefix in forms for form in _raw_char_forms(char)]
+        variants.update(forms)
+    return re.compile(_keyword_trie_pattern(sorted(variants)))
+
+class PostClassifier:
+    """Biên dịch sẵn mọi từ khóa/pattern, quét text của post một lần cho mọi kết luận"""
+
+    def __init__(
+        self,
+        wife_names=None,
+        children_names=None,
+        exclude_keywords=None,
+        exclude_people=None,
+        wife_patterns=None,
+        children_patterns=None,
+        significant_keywords=None,
+        full_month_keywords=None,
+        event_type_rules=None,
+    ):
+        self.wife_names = frozenset(WIFE_NAMES if wife_names is None else wife_names)
+        self.children_names = frozenset(CHILDREN_NAMES if children_names is None else children_names)
+        self.exclude_keywords = frozenset(EXCLUDE_KEYWORDS if exclude_keywords is None else exclude_keywords)
+        self.exclude_people = frozenset(EXCLUDE_PEOPLE if exclude_people is None else exclude_people)
+        self.significant_keywords = frozenset(
+            SIGNIFICANT_KEYWORDS if significant_keywords is None else significant_keywords
+        )
+        self.full_month_keywords = frozenset(
+            FULL_MONTH_KEYWORDS if full_month_keywords is None else full_month_keywords
+        )
+        self.event_type_rules = [
+            (event_type, frozenset(keywords))
+            for event_type, keywords in (EVENT_TYPE_RULES if event_type_rules is None else event_type_rules)
+        ]
+        self.link_markers = frozenset(LINK_MARKERS)
+        self.ad_indicators = frozenset(AD_INDICATORS)
+
+        # Mọi từ khóa dạng chuỗi con được gom vào một regex duy nhất
+        keywords = set(self.wife_names | self.children_names | self.exclude_keywords | self.exclude_people)
+        keywords |= self.significant_keywords | self.full_month_keywords | self.link_markers | self.ad_indicators
+        for _, rule_keywords in self.event_type_rules:
+            keywords |= rule_keywords
+        # Cùng một lần quét cho TitleBuilder, không phải quét lại text khi tạo title
+        keywords |= TITLE_KEYWORDS
+        self.keywords = frozenset(keywords)
+        self._keyword_re = re.compile("(?=(" + _keyword_trie_pattern(sorted(self.keywords)) + "))")
+        # Tại mỗi vị trí regex chỉ trả về từ khóa dài nhất, các từ khóa nằm bên trong nó cũng có mặt
+        self._contained = {
+            keyword: frozenset(other for other in self.keywords if other in keyword)
+            for keyword in self.keywords
+        }
+
+        wife_patterns = WIFE_PATTERNS if wife_patterns is None else wife_patterns
+        children_patterns = CHILDREN_PATTERNS if children_patterns is None else children_patterns
+        self._wife_name_re = self._literal_regex(self.wife_names)
+        self._children_name_re = self._literal_regex(self.children_names)
+        self._wife_re = self._pattern_regex(wife_patterns)
+        self._children_re = self._pattern_regex(children_patterns)
+
+        # Post liên quan tới vợ/con bắt buộc phải chứa một trong các chuỗi neo này
+        anchors = set(self.wife_names | self.children_names)
+        for pattern in list(wife_patterns) + list(children_patterns):
+            anchors.add(_required_literal(pattern))
+        self.anchors = None if None in anchors else frozenset(anchors)
+        self._anchor_re = _raw_anchor_regex(self.anchors) if self.anchors else None
+
+    @staticmethod
+    def _literal_regex(words):
+        """Regex khớp bất kỳ chuỗi con nào trong words (không khớp gì nếu words rỗng)"""
+        if not words:
+            return re.compile(r"(?!)")
+        return re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+    @staticmethod
+    def _pattern_regex(patterns):
+        """Gộp danh sách pattern thành một regex alternation"""
+        if not patterns:
+            return re.compile(r"(?!)")
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+    def may_mention(self, raw_text):
+        """Kiểm tra nhanh một chuỗi gốc (chưa sửa encoding): False thì chắc chắn không nhắc tới vợ/con"""
+        if self._anchor_re is None:
+            return True
+        return self._anchor_re.search(raw_text.lower()) is not None
+
+    def may_be_relevant(self, post_data):
+        """Kiểm tra nhanh trên chuỗi gốc (chưa sửa encoding): False thì chắc chắn không về vợ/con"""
+        return self.may_mention("\n".join(raw_strings(post_data)))
+
+    def keyword_hits(self, text_lower):
+        """Tập mọi từ khóa xuất hiện trong text (đã lowercase)"""
+        found = set(self._keyword_re.findall(text_lower))
+        if not found:
+            return frozenset()
+        return frozenset().union(*(self._contained[keyword] for keyword in found))
+
+    def classify(self, text, tags):
+        """Trả về mọi kết luận cho post chỉ với một lần lowercase và quét text"""
+        text_lower = text.lower() if text else ""
+        hits = self.keyword_hits(text_lower)
+
+        if not text:
+            return PostVerdict(False, False, False, False, False, self._event_type(hits, False), hits)
+
+        spam = bool(hits & self.exclude_keywords) or (
+            bool(hits & self.link_markers) and bool(hits & self.ad_indicators)
+        )
+        # Kiểm tra tags trước (chính xác nhất), sau đó mới tới pattern trong text
+        wife = any(self._wife_name_re.search(tag) for tag in tags) or bool(self._wife_re.search(text_lower))
+        children = any(self._children_name_re.search(tag.lower()) for tag in tags) or bool(
+            self._children_re.search(text_lower)
+        )
+        # Có mention vợ cùng lúc thì không tính là post về người khác
+        other_people = bool(hits & self.exclude_people) and not (hits & self.wife_names)
+        significant = bool(hits & self.significant_keywords)
+        return PostVerdict(
+            spam, wife, children, other_people, significant, self._event_type(hits, children), hits
+        )
+
+    def _event_type(self, hits, children):
+        """Xác định loại sự kiện từ tập từ khóa đã khớp"""
+        # Kiểm tra sự kiện về con trước (đầy tháng, sinh nhật con)
+        if hits & self.full_month_keywords:
+            # Nếu có mention con (Bee, Sam) thì là family-event, không rõ thì để birth
+            return "family-event" if children else "birth"
+        for event_type, keywords in self.event_type_rules:
+            if hits & keywords:
+                return event_type
+        return "other"
+
+_default_classifier = None
+
+def get_classifier():
+    """Classifier dùng chung, chỉ biên dịch một lần cho mỗi process"""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = PostClassifier()
+    return _default_classifier
+
+def is_spam_or_advertisement(text):
+    """Kiểm tra xem post có phải spam/quảng cáo không"""
+    return get_classifier().classify(text, []).spam
+
+def is_about_other_people(text):
+    """Kiểm tra xem post có về người khác (không phải vợ) không"""
+    return get_classifier().classify(text, []).other_people
+
+def is_about_wife(text, tags):
+    """Kiểm tra xem post có về vợ không"""
+    return get_classifier().classify(text, tags).wife
+
+def is_about_children(text, tags):
+    """Kiểm tra xem post có về con (Bee, Sam) không"""
+    return get_classifier().classify(text, tags).children
+
+def is_significant_event(text):
+    """Đánh giá xem đây có phải sự kiện quan trọng không"""
+    return get_classifier().classify(text, []).significant
+
+def determine_event_type(text, tags):
+    """Xác định loại sự kiện dựa trên nội dung"""
+    return get_classifier().classify(text, tags).event_type
+
+def fallback_title(dt):
+    """Title khi post không có câu nào dùng được: ghi kèm ngày của sự kiện"""
+    return f"Sự kiện với vợ - {format_date_for_timeline(dt)}"
+
+class TitleBuilder:
+    """Tạo title từ post đã phân loại, dùng lại tập từ khóa (verdict.hits) mà PostClassifier đã quét"""
+
+    def __init__(self, wife_names=None, children_names=None):
+        self._cleanup_trigger = re.compile(TITLE_CLEANUP_TRIGGER, re.IGNORECASE)
+        self._cleanup = [re.compile(pattern, re.IGNORECASE) for pattern in TITLE_CLEANUP_PATTERNS]
+        self._sentence_re = re.compile(r"[^.!?\n]+")
+        self.full_month_keywords = frozenset(TITLE_FULL_MONTH_KEYWORDS)
+        self.birthday_keywords = frozenset(TITLE_BIRTHDAY_KEYWORDS)
+        self.wife_rules = [
+            (title, [frozenset(group) for group in groups]) for title, groups in TITLE_WIFE_RULES
+        ]
+        self.wife_names = frozenset(WIFE_NAMES if wife_names is None else wife_names)
+        self.children_names = frozenset(CHILDREN_NAMES if children_names is None else children_names)
+        self.placeholders = frozenset(TITLE_PLACEHOLDERS)
+
+    def _child_title(self, hits):
+        """Title cho đầy tháng / sinh nhật con, None nếu không phải"""
+        if hits & self.full_month_keywords:
+            prefix = "Đầy tháng con"
+        elif hits & self.birthday_keywords:
+            prefix = "Sinh nhật con"
+        else:
+            return None
+        if "bee" in hits:
+            return f"{prefix} trai (Bee)"
+        if "sam" in hits:
+            return f"{prefix} gái (Sam)"
+        return prefix
+
+    def _first_sentence(self, text, names, min_length):
+        """Câu đầu tiên dài hơn min_length có chứa một trong names, dừng ngay khi tìm thấy"""
+        for match in self._sentence_re.finditer(text):
+            sentence = match.group().strip()
+            if len(sentence) > min_length:
+                sentence_lower = sentence.lower()
+                if any(name in sentence_lower for name in names):
+                    return sentence[:80]
+        return None
+
+    def build(self, text, verdict, dt):
+        """Tạo title ngắn gọn và có ý nghĩa từ nội dung post"""
+        hits = verdict.hits
+        is_children_related = verdict.children
+
+        title = text[:200] if text else ""
+
+        # Loại bỏ các phần không cần thiết
+        if self._cleanup_trigger.search(title):
+            for pattern in self._cleanup:
+                title = pattern.sub("", title)
+
+        # Nếu là sự kiện về con (đầy tháng, sinh nhật), tạo title rõ ràng hơn
+        child_title = self._child_title(hits) if is_children_related else None
+        if child_title:
+            title = child_title
+        title = title.strip()
+
+        # Nếu title quá ngắn hoặc không có ý nghĩa, tạo từ description
+        if len(title) < 10 or title.lower() in self.placeholders:
+            if is_children_related:
+                # Lấy câu đầu tiên có mention Bee/Sam (chỉ quét khi text có tên con)
+                names = hits & self.children_names
+                sentence = self._first_sentence(text, names, 10) if names else None
+                if sentence:
+                    title = sentence
+            else:
+                # Kiểm tra sự kiện về vợ
+                for rule_title, groups in self.wife_rules:
+                    if all(hits & group for group in groups):
+                        title = rule_title
+                        break
+                else:
+                    # Lấy câu đầu tiên có ý nghĩa
+                    names = hits & self.wife_names
+                    sentence = self._first_sentence(text, names, 15) if names else None
+                    if sentence:
+                        title = sentence
+                    if not title or len(title) < 10:
+                        title = fallback_title(dt)
+
+        # Giới hạn độ dài
+        if len(title) > 100:
+            title = title[:97] + "..."
+
+        return title[:100]
+
+_default_title_builder = None
+
+def get_title_builder():
+    """TitleBuilder dùng chung, chỉ biên dịch một lần cho mỗi process"""
+    global _default_title_builder
+    if _default_title_builder is None:
+        _default_title_builder = TitleBuilder()
+    return _default_title_builder
+
+def build_event_title(text, verdict, dt):
+    """Tạo title ngắn gọn và có ý nghĩa từ nội dung post"""
+    return get_title_builder().build(text, verdict, dt)
+
+# Phiên bản code phân loại/tạo title: tăng khi đổi logic để kết quả cũ trong cache phân loại không còn được dùng
+CLASSIFIER_VERSION = 1
+
+# Luật ghi đè được bằng --rules: tên hằng -> tham số của PostClassifier
+RULE_PARAMETERS = {
+    "WIFE_NAMES": "wife_names",
+    "CHILDREN_NAMES": "children_names",
+    "EXCLUDE_KEYWORDS": "exclude_keywords",
+    "EXCLUDE_PEOPLE": "exclude_people",
+    "WIFE_PATTERNS": "wife_patterns",
+    "CHILDREN_PATTERNS": "children_patterns",
+    "SIGNIFICANT_KEYWORDS": "significant_keywords",
+    "FULL_MONTH_KEYWORDS": "full_month_keywords",
+    "EVENT_TYPE_RULES": "event_type_rules",
+}
+# Luật cố định nhưng vẫn ảnh hưởng kết quả, được tính vào fingerprint
+FIXED_RULES = (
+    "LINK_MARKERS", "AD_INDICATORS", "TITLE_CLEANUP_PATTERNS", "TITLE_FULL_MONTH_KEYWORDS",
+    "TITLE_BIRTHDAY_KEYWORDS", "TITLE_WIFE_RULES", "TITLE_PLACEHOLDERS",
+)
+
+class Ruleset:
+    """Bộ luật phân loại: các hằng của module, có thể ghi đè một phần bằng file JSON (--rules)"""
+
+    def __init__(self, overrides=None, name="mặc định"):
+        overrides = dict(overrides or {})
+        unknown = sorted(set(overrides) - set(RULE_PARAMETERS))
+        if unknown:
+            raise ValueError(f"không có luật {', '.join(unknown)} (ghi đè được: {', '.join(RULE_PARAMETERS)})")
+        for rule_name, value in overrides.items():
+            if rule_name == "EVENT_TYPE_RULES":
+                valid = isinstance(value, list) and all(
+                    isinstance(rule, list) and len(rule) == 2 and isinstance(rule[0], str)
+                    and isinstance(rule[1], list) and all(isinstance(keyword, str) for keyword in rule[1])
+                    for rule in value
+                )
+            else:
+                valid = isinstance(value, list) and all(isinstance(item, str) for item in value)
+            if not valid:
+                raise ValueError(f"luật {rule_name} không đúng kiểu (giống hằng cùng tên trong post_classifier)")
+        self.name = name
+        self.overrides = overrides
+        self.rules = {rule_name: overrides.get(rule_name, globals()[rule_name]) for rule_name in RULE_PARAMETERS}
+        fixed = {rule_name: globals()[rule_name] for rule_name in FIXED_RULES}
+        data = json.dumps(
+            {"version": CLASSIFIER_VERSION, "rules": self.rules, "fixed": fixed},
+            ensure_ascii=False, sort_keys=True,
+        )
+        self.fingerprint = hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, file_path):
+        """Đọc bộ luật ghi đè từ file JSON {"WIFE_NAMES": [...], ...}"""
+        try:
+            overrides = json_backend.load(file_path)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"không đọc được file luật {file_path}: {e}")
+        if not isinstance(overrides, dict):
+            raise ValueError(f"file luật {file_path} phải là một object JSON")
+        ruleset = cls(overrides, name=os.path.basename(file_path))
+        try:
+            ruleset.classifier()
+        except re.error as e:
+            raise ValueError(f"pattern không hợp lệ trong {file_path}: {e}")
+        return ruleset
+
+    def classifier(self):
+        return PostClassifier(**{param: self.rules[rule_name] for rule_name, param in RULE_PARAMETERS.items()})
+
+    def title_builder(self):
+        return TitleBuilder(self.rules["WIFE_NAMES"], self.rules["CHILDREN_NAMES"])
+
+_ruleset = None
+
+def get_ruleset():
+    """Bộ luật đang dùng trong process hiện tại"""
+    global _ruleset
+    if _ruleset is None:
+        _ruleset = Ruleset()
+    return _ruleset
+
+def set_ruleset(ruleset):
+    """Đổi bộ luật cho process hiện tại (cùng fingerprint thì giữ classifier đã biên dịch)"""
+    global _ruleset, _default_classifier, _default_title_builder
+    if ruleset.fingerprint == get_ruleset().fingerprint:
+        return
+    _ruleset = ruleset
+    _default_classifier = ruleset.classifier()
+    _default_title_builder = ruleset.title_builder()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đọc export Facebook cho importer
+- Vị trí export mặc định, sửa encoding (mojibake) cho chuỗi trong file JSON
+- Trích text/tags của post, các chuỗi gốc dùng cho lọc thô và key cache phân loại
+- Đọc file posts: nạp cả file (load_posts) hoặc stream từng post (iter_posts_streaming, JsonStreamReader)
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+
+# Đường dẫn thư mục Facebook export
+FACEBOOK_DIR = "/Users/tuannguyen8888/Downloads/facebook-tuannguyen8888-30_11_2025-BPwDyk9R"
+# Nhiều export (tài khoản của cả hai vợ chồng, các lần tải về theo năm), ngăn cách bởi os.pathsep
+FACEBOOK_DIRS_ENV = "FACEBOOK_EXPORT_DIRS"
+
+def parse_timestamp(ts):
+    """Chuyển timestamp thành datetime"""
+    try:
+        return datetime.fromtimestamp(ts)
+    except:
+        return None
+
+# Số chuỗi đã sửa encoding được nhớ lại (tag, mô tả album lặp lại rất nhiều lần)
+FIX_ENCODING_CACHE_SIZE = 8192
+
+def fix_encoding(text):
+    """Sửa lỗi encoding Unicode"""
+    if not text:
+        return ""
+    # Chuỗi ASCII không thể là mojibake: trả về ngay, không encode/decode
+    if not isinstance(text, str) or text.isascii():
+        return text
+    return _repair_mojibake(text)
+
+@lru_cache(maxsize=FIX_ENCODING_CACHE_SIZE)
+def _repair_mojibake(text):
+    """Giải mã lại chuỗi UTF-8 bị đọc nhầm thành latin1, giữ nguyên nếu không phải mojibake"""
+    try:
+        return text.encode('latin1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        # Có ký tự ngoài latin1 (đã là Unicode chuẩn) hoặc không phải chuỗi UTF-8 hợp lệ
+        return text
+
+# Key giữ nguyên chuỗi gốc khi sửa encoding lúc parse (đường dẫn file trên đĩa)
+RAW_STRING_KEYS = frozenset(["uri"])
+
+class RepairedObject(dict):
+    """Object JSON mà mọi chuỗi bên trong đã được sửa encoding ngay lúc parse
+    
+    Các hàm trích xuất nhận ra loại này và không sửa encoding lần thứ hai
+    """
+    __slots__ = ()
+
+def repair_object_pairs(pairs):
+    """object_pairs_hook cho json: sửa encoding toàn bộ chuỗi của object trong một lượt"""
+    obj = RepairedObject()
+    for key, value in pairs:
+        if value.__class__ is str:
+            if key not in RAW_STRING_KEYS:
+                value = fix_encoding(value)
+        elif value.__class__ is list:
+            value = [fix_encoding(item) if item.__class__ is str else item for item in value]
+        obj[key] = value
+    return obj
+
+def _already_repaired(text):
+    return text
+
+def _text_fixer(post_data):
+    """Hàm sửa encoding cho các trường của post (bỏ qua nếu đã sửa lúc parse)"""
+    return _already_repaired if isinstance(post_data, RepairedObject) else fix_encoding
+
+def extract_text_from_post(post_data):
+    """Trích xuất text từ post"""
+    text_parts = []
+    fix = _text_fixer(post_data)
+    
+    # Lấy title
+    if post_data.get("title"):
+        title = fix(post_data["title"])
+        text_parts.append(title)
+    
+    # Lấy post content
+    if post_data.get("data"):
+        for item in post_data["data"]:
+            if isinstance(item, dict):
+                if item.get("post"):
+                    post_text = fix(item["post"])
+                    text_parts.append(post_text)
+    
+    # Lấy description từ media
+    if post_data.get("attachments"):
+        for attachment in post_data["attachments"]:
+            if attachment.get("data"):
+                for data_item in attachment["data"]:
+                    if isinstance(data_item, dict) and data_item.get("media"):
+                        desc = data_item["media"].get("description")
+                        if desc:
+                            text_parts.append(fix(desc))
+    
+    return " ".join(text_parts)
+
+def extract_tags(post_data):
+    """Trích xuất tags từ post"""
+    tags = []
+    fix = _text_fixer(post_data)
+    if post_data.get("tags"):
+        for tag in post_data["tags"]:
+            if isinstance(tag, dict) and tag.get("name"):
+                tags.append(fix(tag["name"]).lower())
+    return tags
+
+def default_sources():
+    """Các thư mục export mặc định: biến môi trường FACEBOOK_EXPORT_DIRS, không có thì FACEBOOK_DIR"""
+    value = os.environ.get(FACEBOOK_DIRS_ENV, "")
+    sources = [path for path in value.split(os.pathsep) if path.strip()]
+    return sources or [FACEBOOK_DIR]
+
+def format_date_for_timeline(dt):
+    """Format date cho timeline (DD/MM/YYYY)"""
+    if not dt:
+        return None
+    return dt.strftime("%d/%m/%Y")
+
+def raw_strings(post_data):
+    """Các chuỗi của post mà text và tags được trích ra từ đó"""
+    return raw_text_strings(post_data) + raw_tag_strings(post_data)
+
+def raw_text_strings(post_data):
+    """Các chuỗi gốc ghép thành text của post (cùng thứ tự như extract_text_from_post)"""
+    strings = []
+    if post_data.get("title"):
+        strings.append(post_data["title"])
+    for item in post_data.get("data") or ():
+        if isinstance(item, dict) and item.get("post"):
+            strings.append(item["post"])
+    for attachment in post_data.get("attachments") or ():
+        for data_item in attachment.get("data") or ():
+            if isinstance(data_item, dict) and data_item.get("media"):
+                description = data_item["media"].get("description")
+                if description:
+                    strings.append(description)
+    return strings
+
+def raw_tag_strings(post_data):
+    """Tên các tag gốc của post"""
+    return [tag["name"] for tag in post_data.get("tags") or () if isinstance(tag, dict) and tag.get("name")]
+
+def has_raw_media(post_data):
+    """Post có trỏ tới file media nào không (chưa kiểm tra file có tồn tại)"""
+    for attachment in post_data.get("attachments") or ():
+        for data_item in attachment.get("data") or ():
+            if isinstance(data_item, dict) and data_item.get("media") and data_item["media"].get("uri"):
+                return True
+    return False
+
+def post_cache_key(post_data):
+    """Hash các trường của post mà kết luận phân loại và title phụ thuộc vào (timestamp, text, tags)"""
+    digest = hashlib.blake2b(str(post_data.get("timestamp")).encode("utf-8"), digest_size=16)
+    for group in (raw_text_strings(post_data), raw_tag_strings(post_data)):
+        digest.update(b"\x01")
+        for value in group:
+            digest.update(value.encode("utf-8", "surrogatepass") + b"\x00")
+    return digest.hexdigest()
+
+# Kích thước mỗi lần đọc file khi parse JSON theo kiểu stream
+STREAM_CHUNK_SIZE = 1 << 16
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+class JsonStreamReader:
+    """Đọc lần lượt từng giá trị JSON trong file mà không nạp cả file vào bộ nhớ"""
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE, repair=False):
+        self._f = f
+        self._chunk_size = chunk_size
+        # repair=True: sửa encoding toàn bộ chuỗi ngay khi giải mã từng object
+        self._decoder = json.JSONDecoder(object_pairs_hook=repair_object_pairs if repair else None)
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, min_size=0):
+        """Đọc thêm dữ liệu vào buffer, trả về False nếu đã hết file"""
+        if self._eof:
+            return False
+        chunk = self._f.read(max(self._chunk_size, min_size))
+        if not chunk:
+            self._eof = True
+            return False
+        # Bỏ phần đã xử lý để buffer không phình theo kích thước file
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Trả về ký tự kế tiếp (bỏ qua khoảng trắng), chuỗi rỗng nếu hết file"""
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        """Tiêu thụ ký tự cấu trúc mong đợi"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}' nhưng gặp '{found or 'EOF'}'")
+        self._pos += 1
+
+    def value(self):
+        """Giải mã trọn vẹn giá trị JSON tại vị trí hiện tại"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # Giá trị bị cắt ngang ở cuối buffer: đọc gấp đôi phần còn dở rồi thử lại
+                if not self._fill(len(self._buf) - self._pos):
+                    raise
+                continue
+            # Số nằm sát cuối buffer có thể chưa đọc đủ chữ số
+            if (end == len(self._buf) or self._buf[end] in _JSON_NUMBER_CHARS) and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    def skip(self):
+        """Bỏ qua giá trị hiện tại, mảng được đọc lướt từng phần tử"""
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.value()
+
+    def iter_array(self):
+        """Duyệt từng phần tử của mảng JSON tại vị trí hiện tại"""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            found = self.peek()
+            self._pos += 1
+            if found == "]":
+                return
+            if found != ",":
+                raise ValueError(f"JSON không hợp lệ: cần ',' hoặc ']' nhưng gặp '{found or 'EOF'}'")
+
+    def iter_keys(self):
+        """Duyệt các key của object JSON; sau mỗi key caller phải đọc hoặc bỏ qua value"""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            found = self.peek()
+            self._pos += 1
+            if found == "}":
+                return
+            if found != ",":
+                raise ValueError(f"JSON không hợp lệ: cần ',' hoặc '}}' nhưng gặp '{found or 'EOF'}'")
+
+def _stream_array_under_key(file_path, wanted_key, repair=False):
+    """Mở lại file và stream mảng nằm dưới key cấp cao nhất wanted_key"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f, repair=repair)
+        for key in reader.iter_keys():
+            if key == wanted_key and reader.peek() == "[":
+                yield from reader.iter_array()
+                return
+            reader.skip()
+
+def _load_whole_object(file_path, repair=False):
+    """Trường hợp cả file là một post duy nhất"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield json.load(f, object_pairs_hook=repair_object_pairs if repair else None)
+
+def iter_posts_streaming(file_path, repair=False):
+    """Stream từng post trong file, xử lý đủ các dạng mà load_posts hỗ trợ
+    
+    repair=True: sửa encoding mọi chuỗi ngay lúc parse (xem repair_object_pairs)
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f, repair=repair)
+        first = reader.peek()
+        if first == "[":
+            yield from reader.iter_array()
+            return
+        if first != "{":
+            return
+
+        # "posts" được ưu tiên hơn "data" bất kể thứ tự key trong file
+        data_kind = None
+        for key in reader.iter_keys():
+            if key == "posts":
+                if reader.peek() == "[":
+                    yield from reader.iter_array()
+                else:
+                    yield from _load_whole_object(file_path, repair)
+                return
+            if key == "data":
+                data_kind = "list" if reader.peek() == "[" else "other"
+            reader.skip()
+
+    if data_kind == "list":
+        # Chưa thể stream "data" ở lượt đầu vì "posts" có thể nằm phía sau
+        yield from _stream_array_under_key(file_path, "data", repair)
+    elif data_kind == "other":
+        yield from _load_whole_object(file_path, repair)
+
+def load_posts(file_path, repair=False):
+    """Đọc toàn bộ file và trả về danh sách posts
+    
+    repair=True: sửa encoding mọi chuỗi ngay lúc parse (xem repair_object_pairs)
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f, object_pairs_hook=repair_object_pairs if repair else None)
+
+    # Xử lý cả array và object
+    if isinstance(data, list):
+        posts = data
+    elif isinstance(data, dict):
+        posts = data.get("posts", data.get("data", []))
+        if not isinstance(posts, list):
+            posts = [data]
+    else:
+        posts = []
+    return posts
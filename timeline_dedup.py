@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Index khử trùng lặp event cho importer
+- Key chuẩn hóa: bỏ dấu tiếng Việt, gộp khoảng trắng, lowercase; chỉ trùng key với event đã có trong
+  timeline mới bị bỏ, hai post mới cùng ngày cùng title (vd. hai lần sinh nhật con) thành cặp ứng viên gộp
+- Event được chia bucket theo ngày, chỉ so sánh với event cùng ngày (± window_days)
+- Trong bucket dùng sketch MinHash (bottom-k) trên shingle ký tự của description
+  để phát hiện bản gần trùng, báo lại thành cặp ứng viên gộp thay vì âm thầm bỏ đi
+"""
+
+import heapq
+import re
+import unicodedata
+import zlib
+from datetime import date, timedelta
+
+UNIQUE = "unique"
+DUPLICATE_ID = "duplicate-id"
+DUPLICATE_KEY = "duplicate-key"
+NEAR_DUPLICATE = "near-duplicate"
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.7
+SHINGLE_SIZE = 5
+SKETCH_SIZE = 64
+
+_WHITESPACE = re.compile(r"\s+")
+
+def fold_text(text):
+    """Bỏ dấu (kể cả đ/Đ), gộp khoảng trắng và lowercase"""
+    if not text:
+        return ""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(char for char in decomposed if unicodedata.category(char) != "Mn")
+    return _WHITESPACE.sub(" ", stripped).strip().lower()
+
+def normalized_key(event):
+    """Key date + title đã chuẩn hóa (tương ứng key date-title[:50] cũ)"""
+    return f"{event.get('date')}-{fold_text(event.get('title', ''))[:50]}"
+
+def _event_day(event):
+    """Ngày của event dưới dạng date, None nếu không đọc được"""
+    parsed = event.get("dateParsed") or {}
+    try:
+        return date(parsed["year"], parsed["month"], parsed["day"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    try:
+        day, month, year = (int(part) for part in str(event.get("date", "")).split("/"))
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def minhash_sketch(text, size=SKETCH_SIZE):
+    """Sketch bottom-k: k giá trị hash nhỏ nhất của các shingle ký tự"""
+    folded = fold_text(text)
+    if not folded:
+        return frozenset()
+    if len(folded) <= SHINGLE_SIZE:
+        shingles = {folded}
+    else:
+        shingles = {folded[i:i + SHINGLE_SIZE] for i in range(len(folded) - SHINGLE_SIZE + 1)}
+    hashes = {zlib.crc32(shingle.encode("utf-8")) for shingle in shingles}
+    return frozenset(heapq.nsmallest(size, hashes))
+
+def estimate_similarity(sketch_a, sketch_b, size=SKETCH_SIZE):
+    """Ước lượng Jaccard từ hai sketch bottom-k"""
+    if not sketch_a or not sketch_b:
+        return 0.0
+    union = heapq.nsmallest(size, sketch_a | sketch_b)
+    both = sum(1 for value in union if value in sketch_a and value in sketch_b)
+    return both / len(union)
+
+class DedupIndex:
+    """Index ID, key chuẩn hóa và bucket theo ngày cho các event đã có"""
+
+    def __init__(self, events=(), threshold=DEFAULT_SIMILARITY_THRESHOLD, window_days=1):
+        self.threshold = threshold
+        self.window_days = window_days
+        self._ids = set()
+        # Key chuẩn hóa -> event đầu tiên mang key đó: event đã có trong timeline / event thêm trong lần chạy này
+        self._keys = {}
+        self._run_keys = {}
+        # Ngày -> danh sách [event, sketch]; sketch chỉ tính khi bucket thực sự được so sánh
+        self._buckets = {}
+        for event in events:
+            self.add(event, existing=True)
+
+    def add(self, event, existing=False):
+        """Đưa event vào index (existing=True: event đã có trong timeline)"""
+        self._ids.add(event.get("id"))
+        (self._keys if existing else self._run_keys).setdefault(normalized_key(event), event)
+        self._buckets.setdefault(_event_day(event), []).append([event, None])
+
+    def _sketch_of(self, entry):
+        if entry[1] is None:
+            event = entry[0]
+            entry[1] = minhash_sketch(event.get("description") or event.get("title", ""))
+        return entry[1]
+
+    def _nearby(self, day):
+        """Các entry cùng ngày hoặc lệch không quá window_days"""
+        if day is None:
+            yield from self._buckets.get(None, [])
+            return
+        for offset in range(-self.window_days, self.window_days + 1):
+            yield from self._buckets.get(day + timedelta(days=offset), [])
+
+    def check(self, event):
+        """Trả về (loại trùng lặp, [(event gần trùng, độ tương đồng)])"""
+        if event.get("id") in self._ids:
+            return DUPLICATE_ID, []
+        key = normalized_key(event)
+        if key in self._keys:
+            return DUPLICATE_KEY, []
+
+        sketch = minhash_sketch(event.get("description") or event.get("title", ""))
+        matches = []
+        if sketch:
+            for entry in self._nearby(_event_day(event)):
+                similarity = estimate_similarity(sketch, self._sketch_of(entry))
+                if similarity >= self.threshold:
+                    matches.append((entry[0], similarity))
+        # Cùng key với event mới khác trong lần chạy này: có thể là hai sự kiện thật, để người dùng tự gộp
+        same_key = self._run_keys.get(key)
+        if same_key is not None and not any(other is same_key for other, _ in matches):
+            matches.append((same_key, 1.0))
+        matches.sort(key=lambda match: -match[1])
+        return (NEAR_DUPLICATE if matches else UNIQUE), matches
+
+    def owner(self, event):
+        """ID của event trong index mà event này trùng (theo ID hoặc key), None nếu không trùng"""
+        if event.get("id") in self._ids:
+            return event.get("id")
+        other = self._keys.get(normalized_key(event))
+        return other.get("id") if other is not None else None
+
+def merge_candidate(event, other, similarity, reason=None):
+    """Bản ghi ứng viên gộp để lưu vào merge_candidates.json (reason: "image" nếu phát hiện qua ảnh trùng)"""
+    candidate = {
+        "eventIds": [other.get("id"), event.get("id")],
+        "similarity": round(similarity, 3),
+        "dates": [other.get("date"), event.get("date")],
+        "titles": [other.get("title", ""), event.get("title", "")],
+    }
+    if reason:
+        candidate["reason"] = reason
+    return candidate
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Index tìm kiếm toàn văn cho timeline (data/search_index.json)
+- Token đã bỏ dấu tiếng Việt (dùng chung fold_text với khử trùng lặp), lấy từ title, description, location
+- Inverted index token -> event, kèm danh sách token của từng event để cập nhật/xóa từng event
+- Facet năm, tháng, loại sự kiện lấy từ dateParsed và type
+- Importer gọi sync() sau khi merge: chỉ event mới hoặc bị sửa mới phải tách token lại
+
+Ví dụ:
+    python3 timeline_search.py "sinh nhat bee" --from 2020-01-01 --to 2021-12-31 --type birth
+"""
+
+import argparse
+import bisect
+import os
+import re
+import sys
+import unicodedata
+import zlib
+from functools import lru_cache
+
+import json_backend
+from timeline_dedup import fold_text
+from timeline_storage import TimelineStore, atomic_write_bytes
+
+INDEX_VERSION = 1
+INDEX_FILE_NAME = "search_index.json"
+
+_TOKEN = re.compile(r"\w+")
+_EMPTY = frozenset()
+
+# Số token đã bỏ dấu được nhớ lại (từ vựng của một timeline lặp lại rất nhiều)
+FOLD_CACHE_SIZE = 65536
+
+_fold_token = lru_cache(maxsize=FOLD_CACHE_SIZE)(fold_text)
+
+def tokenize(text):
+    """Tách token đã bỏ dấu và lowercase"""
+    if not text:
+        return []
+    # Tách từ trước rồi mới bỏ dấu từng từ (có cache), NFC để dấu không tách rời khỏi chữ
+    return [_fold_token(token) for token in _TOKEN.findall(unicodedata.normalize("NFC", text))]
+
+def _event_date(event):
+    """Ngày của event dạng YYYY-MM-DD (chuỗi rỗng nếu không đọc được)"""
+    parsed = event.get("dateParsed") or {}
+    if parsed.get("date"):
+        return str(parsed["date"])[:10]
+    parts = str(event.get("date") or "").split("/")
+    if len(parts) == 3 and all(part.isdigit() for part in parts):
+        return f"{int(parts[2]):04d}-{int(parts[1]):02d}-{int(parts[0]):02d}"
+    return ""
+
+def _event_text(event):
+    return " ".join(str(event.get(field) or "") for field in ("title", "description", "location"))
+
+def _fingerprint(event):
+    """Đổi khi nội dung được index của event thay đổi"""
+    data = f"{_event_date(event)}|{event.get('type') or ''}|{_event_text(event)}"
+    return zlib.crc32(data.encode("utf-8"))
+
+class SearchIndex:
+    """Inverted index + facet năm/tháng/loại cho các event của timeline"""
+
+    def __init__(self):
+        # id -> {"date", "type", "fp", "tokens"}
+        self._events = {}
+        self._postings = {}
+        self._types = {}
+        # Thứ tự theo ngày, dựng lại (lười) sau mỗi lần thêm/xóa
+        self._dates = None
+        self._order = None
+        self._rank = None
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def token_count(self):
+        return len(self._postings)
+
+    @classmethod
+    def load(cls, index_file):
+        """Đọc index đã lưu; file không có, hỏng hoặc khác version thì trả về index rỗng"""
+        index = cls()
+        if not os.path.exists(index_file):
+            return index
+        try:
+            data = json_backend.load(index_file)
+        except Exception as e:
+            print(f"Lỗi khi đọc index tìm kiếm {index_file}: {e}")
+            return index
+        if data.get("version") != INDEX_VERSION:
+            return index
+        for entry in data.get("events", []):
+            index._insert(entry["id"], entry["date"], entry["type"], entry["fp"], entry["tokens"])
+        return index
+
+    def save(self, index_file):
+        """Ghi index nguyên tử ra file"""
+        events = [
+            {"id": event_id, "date": entry["date"], "type": entry["type"], "fp": entry["fp"], "tokens": entry["tokens"]}
+            for event_id, entry in self._events.items()
+        ]
+        atomic_write_bytes(index_file, json_backend.dumps({"version": INDEX_VERSION, "events": events}, pretty=False))
+
+    def _insert(self, event_id, date, event_type, fingerprint, tokens):
+        self._events[event_id] = {"date": date, "type": event_type, "fp": fingerprint, "tokens": tokens}
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(event_id)
+        self._types.setdefault(event_type, set()).add(event_id)
+        self._invalidate()
+
+    def add(self, event):
+        """Index một event (thay thế bản cũ nếu đã có)"""
+        event_id = event.get("id")
+        if event_id in self._events:
+            self.remove(event_id)
+        tokens = sorted(set(tokenize(_event_text(event))))
+        self._insert(event_id, _event_date(event), event.get("type") or "", _fingerprint(event), tokens)
+
+    def remove(self, event_id):
+        """Bỏ event khỏi index"""
+        entry = self._events.pop(event_id, None)
+        if entry is None:
+            return
+        for token in entry["tokens"]:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(event_id)
+                if not postings:
+                    del self._postings[token]
+        type_ids = self._types.get(entry["type"])
+        if type_ids is not None:
+            type_ids.discard(event_id)
+            if not type_ids:
+                del self._types[entry["type"]]
+        self._invalidate()
+
+    def _invalidate(self):
+        self._dates = self._order = self._rank = None
+        self._vocabulary = None
+
+    def _ensure_order(self):
+        """Sắp xếp event theo ngày: _order[i] là id, _dates[i] là ngày, _rank[id] = i"""
+        if self._order is not None:
+            return
+        items = sorted(self._events.items(), key=lambda item: (item[1]["date"], str(item[0])))
+        self._order = [event_id for event_id, _ in items]
+        self._dates = [entry["date"] for _, entry in items]
+        self._rank = {event_id: position for position, event_id in enumerate(self._order)}
+
+    def sync(self, events):
+        """Đồng bộ index với danh sách event: thêm event mới, index lại event bị sửa, bỏ event đã xóa
+
+        Trả về số event đã thay đổi trong index
+        """
+        changed = 0
+        seen = set()
+        for event in events:
+            event_id = event.get("id")
+            seen.add(event_id)
+            entry = self._events.get(event_id)
+            if entry is None or entry["fp"] != _fingerprint(event):
+                self.add(event)
+                changed += 1
+        for event_id in [event_id for event_id in self._events if event_id not in seen]:
+            self.remove(event_id)
+            changed += 1
+        return changed
+
+    def _prefix_matches(self, prefix):
+        """Các event có token bắt đầu bằng prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, prefix)
+        if position < len(vocabulary) and vocabulary[position] == prefix and (
+                position + 1 == len(vocabulary) or not vocabulary[position + 1].startswith(prefix)):
+            return self._postings[prefix]
+        matches = set()
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            matches |= self._postings[vocabulary[position]]
+            position += 1
+        return matches
+
+    def search(self, text="", date_from=None, date_to=None, types=None, year=None, month=None,
+               prefix=False, limit=None):
+        """Tìm event chứa mọi từ khóa trong text, lọc theo khoảng ngày (YYYY-MM-DD), loại, năm, tháng
+
+        prefix=True: từ khóa cuối cùng được khớp theo tiền tố (gõ dở vẫn tìm được)
+        Trả về danh sách id theo thứ tự ngày tăng dần
+        """
+        if year is not None:
+            year_prefix = f"{int(year):04d}" if month is None else f"{int(year):04d}-{int(month):02d}"
+            date_from = max(date_from or "", year_prefix)
+            date_to = min(date_to or "\uffff", year_prefix + "\uffff")
+            month = None
+        month_key = f"-{int(month):02d}-" if month is not None else None
+
+        candidates = None
+        tokens = tokenize(text)
+        for position, token in enumerate(tokens):
+            if prefix and position == len(tokens) - 1:
+                matches = self._prefix_matches(token)
+            else:
+                matches = self._postings.get(token, _EMPTY)
+            # Giao từ tập nhỏ hơn để tốn ít phép so sánh nhất
+            if candidates is None:
+                candidates = matches
+            elif len(candidates) <= len(matches):
+                candidates = candidates & matches
+            else:
+                candidates = matches & candidates
+            if not candidates:
+                return []
+
+        if types:
+            if candidates is None:
+                candidates = set()
+                for event_type in types:
+                    candidates |= self._types.get(event_type, _EMPTY)
+            else:
+                events = self._events
+                candidates = {event_id for event_id in candidates if events[event_id]["type"] in types}
+
+        # Khoảng ngày -> khoảng vị trí [low, high) trong thứ tự theo ngày
+        self._ensure_order()
+        low = bisect.bisect_left(self._dates, date_from) if date_from else 0
+        high = bisect.bisect_right(self._dates, date_to + "\uffff") if date_to else len(self._dates)
+        if low >= high:
+            return []
+
+        if candidates is None:
+            results = self._order[low:high]
+        elif len(candidates) < high - low:
+            # Ít ứng viên: sắp xếp ứng viên theo vị trí thay vì duyệt cả khoảng ngày
+            rank = self._rank
+            results = [self._order[position] for position in sorted(rank[event_id] for event_id in candidates)
+                       if low <= position < high]
+        else:
+            results = [event_id for event_id in self._order[low:high] if event_id in candidates]
+        if month_key is not None:
+            events = self._events
+            results = [event_id for event_id in results if events[event_id]["date"][4:8] == month_key]
+        return results[:limit] if limit else results
+
+    def facets(self, event_ids=None):
+        """Đếm số event theo năm, tháng (YYYY-MM) và loại (mặc định trên toàn bộ index)"""
+        counts = {"year": {}, "month": {}, "type": {}}
+        entries = self._events.values() if event_ids is None else (self._events[i] for i in event_ids)
+        for entry in entries:
+            date = entry["date"]
+            if date:
+                counts["year"][date[:4]] = counts["year"].get(date[:4], 0) + 1
+                counts["month"][date[:7]] = counts["month"].get(date[:7], 0) + 1
+            counts["type"][entry["type"]] = counts["type"].get(entry["type"], 0) + 1
+        return counts
+
+def index_path_for(timeline_file):
+    """data/timeline.json -> data/search_index.json"""
+    return os.path.join(os.path.dirname(timeline_file), INDEX_FILE_NAME)
+
+def update_search_index(timeline_file, events):
+    """Đồng bộ index tìm kiếm cạnh timeline với danh sách event, trả về (index, số event thay đổi)"""
+    index_file = index_path_for(timeline_file)
+    index = SearchIndex.load(index_file)
+    changed = index.sync(events)
+    if changed or not os.path.exists(index_file):
+        index.save(index_file)
+    return index, changed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tìm kiếm sự kiện trong timeline")
+    parser.add_argument("query", nargs="?", default="", help="Từ khóa (có dấu hoặc không dấu)")
+    parser.add_argument("--from", dest="date_from", help="Từ ngày YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="Đến ngày YYYY-MM-DD")
+    parser.add_argument("--type", action="append", dest="types", help="Loại sự kiện (lặp lại để chọn nhiều loại)")
+    parser.add_argument("--year", type=int, help="Năm")
+    parser.add_argument("--month", type=int, help="Tháng (1-12)")
+    parser.add_argument("--prefix", action="store_true", help="Khớp từ khóa cuối theo tiền tố")
+    parser.add_argument("--limit", type=int, default=20, help="Số kết quả tối đa (mặc định 20)")
+    parser.add_argument("--timeline", default=os.path.join(os.path.dirname(__file__), "data", "timeline.json"),
+                        help="Đường dẫn timeline.json")
+    args = parser.parse_args(argv)
+
+    store = TimelineStore(args.timeline)
+    if not os.path.exists(args.timeline) and not os.path.exists(store.log_file):
+        print(f"Không tìm thấy timeline: {args.timeline}")
+        return 1
+    events = store.load().get("timelineEvents", [])
+    index, _ = update_search_index(args.timeline, events)
+    by_id = {event.get("id"): event for event in events}
+
+    results = index.search(
+        args.query, date_from=args.date_from, date_to=args.date_to, types=args.types,
+        year=args.year, month=args.month, prefix=args.prefix,
+    )
+    print(f"Tìm thấy {len(results)} sự kiện")
+    for event_id in results[:args.limit]:
+        event = by_id[event_id]
+        print(f"  {event.get('date')} - {event.get('type')} - {str(event.get('title', ''))[:70]}")
+    facets = index.facets(results)
+    if results:
+        print("Theo năm: " + ", ".join(f"{year}: {count}" for year, count in sorted(facets["year"].items())))
+        print("Theo loại: " + ", ".join(f"{name}: {count}" for name, count in sorted(facets["type"].items())))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
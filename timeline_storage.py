@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lưu trữ timeline cho importer
+- Snapshot data/timeline.json luôn được ghi nguyên tử (ghi file tạm rồi rename)
+- Event mới import được append vào log data/timeline.log.jsonl, mỗi dòng một event
+- Compaction gộp log vào snapshot rồi xóa log
+Người đọc (kể cả /api/timeline) lấy snapshot rồi replay log để có timeline đầy đủ
+- Tùy chọn chia timeline thành shard theo năm/tháng (data/shards) kèm manifest số event và khoảng ngày,
+  để đọc một khoảng ngày mà không phải đọc cả timeline
+- Change feed data/timeline_changes.json: mỗi lần import làm timeline thay đổi được đánh một version tăng dần
+  kèm changeset (event thêm/sửa/xóa), client hỏi "thay đổi từ version N" thay vì tải lại cả timeline
+"""
+
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime
+
+import json_backend
+
+# Số event trong log vượt ngưỡng này thì tự động compaction
+DEFAULT_COMPACT_THRESHOLD = 1000
+
+SHARD_DIR_NAME = "shards"
+SHARD_MANIFEST_NAME = "manifest.json"
+SHARD_MANIFEST_VERSION = 1
+# Độ dài tiền tố của dateParsed.date làm key shard
+SHARD_GRANULARITIES = {"year": 4, "month": 7}
+
+CHANGE_FEED_NAME = "timeline_changes.json"
+CHANGE_FEED_VERSION = 1
+# Số changeset gần nhất được giữ lại, client cũ hơn thế phải tải lại cả timeline
+DEFAULT_CHANGE_HISTORY = 50
+
+def atomic_write_bytes(file_path, data):
+    """Ghi file nguyên tử: người đọc chỉ thấy bản cũ hoặc bản mới hoàn chỉnh"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    # mkstemp tạo file quyền 0600, giữ quyền của file cũ (hoặc 0644 nếu là file mới)
+    mode = os.stat(file_path).st_mode & 0o777 if os.path.exists(file_path) else 0o644
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+def _fsync_directory(directory):
+    """Đảm bảo thao tác rename đã xuống đĩa (bỏ qua trên hệ điều hành không hỗ trợ)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def log_path_for(timeline_file):
+    """data/timeline.json -> data/timeline.log.jsonl"""
+    root, _ = os.path.splitext(timeline_file)
+    return root + ".log.jsonl"
+
+def sort_events(events):
+    """Sắp xếp event theo ngày (ổn định, giữ thứ tự cũ khi trùng ngày)"""
+    events.sort(key=lambda x: x["dateParsed"]["date"])
+    return events
+
+class TimelineStore:
+    """Snapshot + log append-only cho timeline.json"""
+
+    def __init__(self, timeline_file, pretty=True, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        self.timeline_file = timeline_file
+        self.log_file = log_path_for(timeline_file)
+        self.pretty = pretty
+        self.compact_threshold = compact_threshold
+        self.log_count = 0
+
+    def _read_log(self):
+        """Đọc các dòng log; dòng cuối ghi dở (chết giữa chừng) được bỏ qua"""
+        records = []
+        if not os.path.exists(self.log_file):
+            return records
+        with open(self.log_file, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json_backend.loads(line))
+                except ValueError:
+                    print(f"Bỏ qua dòng log hỏng {self.log_file}:{line_number}")
+        return records
+
+    def load(self):
+        """Đọc snapshot và replay log, trả về dữ liệu timeline đầy đủ"""
+        if os.path.exists(self.timeline_file):
+            timeline_data = json_backend.load(self.timeline_file)
+        else:
+            timeline_data = {"timelineEvents": [], "lastSaved": None, "version": "1.0"}
+
+        records = self._read_log()
+        self.log_count = len(records)
+        if records:
+            events = timeline_data.setdefault("timelineEvents", [])
+            known_ids = {e.get("id") for e in events}
+            for record in records:
+                event = record.get("event")
+                # Replay idempotent: compaction chết giữa chừng cũng không sinh event trùng
+                if record.get("op") == "add" and event and event.get("id") not in known_ids:
+                    events.append(event)
+                    known_ids.add(event.get("id"))
+                if record.get("savedAt"):
+                    timeline_data["lastSaved"] = record["savedAt"]
+            sort_events(events)
+        return timeline_data
+
+    def append(self, events):
+        """Ghi thêm event mới vào log, chi phí chỉ tỉ lệ với số event mới"""
+        if not events:
+            return
+        saved_at = datetime.now().isoformat()
+        lines = [
+            json_backend.dumps({"op": "add", "savedAt": saved_at, "event": event}, pretty=False) + b"\n"
+            for event in events
+        ]
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_file)), exist_ok=True)
+        with open(self.log_file, 'ab+') as f:
+            # Dòng cuối bị ghi dở từ lần trước: xuống dòng để không dính vào event mới
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines.insert(0, b"\n")
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_count += len(events)
+
+    def needs_compaction(self):
+        """Log đã đủ lớn để gộp vào snapshot chưa"""
+        return self.log_count >= self.compact_threshold
+
+    def write_snapshot(self, timeline_data):
+        """Ghi nguyên tử toàn bộ timeline vào snapshot"""
+        atomic_write_bytes(self.timeline_file, json_backend.dumps(timeline_data, pretty=self.pretty))
+
+    def compact(self, all_events):
+        """Gộp log vào snapshot: ghi snapshot mới rồi mới xóa log"""
+        timeline_data = {
+            "timelineEvents": all_events,
+            "lastSaved": datetime.now().isoformat(),
+            "version": "1.0"
+        }
+        self.write_snapshot(timeline_data)
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+        self.log_count = 0
+        return timeline_data
+
+def shard_dir_for(timeline_file):
+    """data/timeline.json -> data/shards"""
+    return os.path.join(os.path.dirname(timeline_file), SHARD_DIR_NAME)
+
+def _source_state(timeline_file):
+    """Trạng thái snapshot + log mà shard được dựng từ đó (web sửa timeline thì trạng thái đổi)"""
+    log_file = log_path_for(timeline_file)
+    snapshot_mtime = str(os.stat(timeline_file).st_mtime_ns) if os.path.exists(timeline_file) else None
+    log_size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    return {"snapshotMtime": snapshot_mtime, "logSize": log_size}
+
+def _in_range(date, date_from, date_to):
+    """date_from/date_to dạng YYYY, YYYY-MM hoặc YYYY-MM-DD, cả hai đầu đều tính"""
+    return (not date_from or date >= date_from) and (not date_to or date[:len(date_to)] <= date_to)
+
+class TimelineShards:
+    """Timeline chia shard theo năm hoặc tháng: data/shards/<key>.json + manifest.json"""
+
+    def __init__(self, shard_dir, granularity="year", pretty=False):
+        if granularity not in SHARD_GRANULARITIES:
+            raise ValueError(f"granularity phải là một trong {', '.join(SHARD_GRANULARITIES)}")
+        self.shard_dir = shard_dir
+        self.manifest_file = os.path.join(shard_dir, SHARD_MANIFEST_NAME)
+        self.granularity = granularity
+        self.pretty = pretty
+
+    def load_manifest(self):
+        """Manifest hiện có, None nếu chưa có hoặc không đọc được"""
+        if not os.path.exists(self.manifest_file):
+            return None
+        try:
+            manifest = json_backend.load(self.manifest_file)
+        except Exception as e:
+            print(f"Lỗi khi đọc manifest shard {self.manifest_file}: {e}")
+            return None
+        if manifest.get("version") != SHARD_MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def is_current(self, timeline_file):
+        """Shard có khớp với snapshot + log hiện tại không (gọi trước khi ghi timeline)"""
+        manifest = self.load_manifest()
+        return (
+            manifest is not None
+            and manifest.get("granularity") == self.granularity
+            and manifest.get("source") == _source_state(timeline_file)
+        )
+
+    def shard_key(self, event):
+        return event["dateParsed"]["date"][:SHARD_GRANULARITIES[self.granularity]]
+
+    def write(self, all_events, timeline_file, touched_keys=None):
+        """Ghi lại các shard trong touched_keys (None: ghi lại toàn bộ), rồi ghi manifest
+
+        all_events phải đã sắp xếp theo ngày; trả về danh sách key đã ghi
+        """
+        groups = {}
+        for event in all_events:
+            groups.setdefault(self.shard_key(event), []).append(event)
+
+        previous = self.load_manifest() or {}
+        previous_shards = previous.get("shards", {}) if previous.get("granularity") == self.granularity else {}
+        if touched_keys is None:
+            keys = list(groups)
+        else:
+            # Shard chưa có file cũng phải ghi
+            keys = [key for key in groups if key in touched_keys or key not in previous_shards]
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for key in keys:
+            atomic_write_bytes(
+                os.path.join(self.shard_dir, f"{key}.json"),
+                json_backend.dumps({"timelineEvents": groups[key]}, pretty=self.pretty),
+            )
+
+        shards = {
+            key: {
+                "file": f"{key}.json",
+                "count": len(events),
+                "from": events[0]["dateParsed"]["date"],
+                "to": events[-1]["dateParsed"]["date"],
+            }
+            for key, events in sorted(groups.items())
+        }
+        manifest = {
+            "version": SHARD_MANIFEST_VERSION,
+            "granularity": self.granularity,
+            "lastSaved": datetime.now().isoformat(),
+            "totalEvents": len(all_events),
+            "source": _source_state(timeline_file),
+            "shards": shards,
+        }
+        atomic_write_bytes(self.manifest_file, json_backend.dumps(manifest, pretty=True))
+
+        # Shard không còn event (hoặc của granularity cũ) bị xóa sau khi manifest mới đã ghi xong
+        for name in os.listdir(self.shard_dir):
+            if name.endswith(".json") and name != SHARD_MANIFEST_NAME and name[:-5] not in shards:
+                os.remove(os.path.join(self.shard_dir, name))
+        return keys
+
+    def load_range(self, date_from=None, date_to=None):
+        """Đọc event trong khoảng ngày, chỉ mở các shard giao với khoảng đó"""
+        manifest = self.load_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f"Chưa có manifest shard: {self.manifest_file}")
+        events = []
+        for key, shard in sorted(manifest["shards"].items()):
+            if date_from and shard["to"] < date_from:
+                continue
+            if date_to and shard["from"][:len(date_to)] > date_to:
+                continue
+            shard_events = json_backend.load(os.path.join(self.shard_dir, shard["file"]))["timelineEvents"]
+            events.extend(e for e in shard_events if _in_range(e["dateParsed"]["date"], date_from, date_to))
+        return events
+
+def read_timeline_range(timeline_file, date_from=None, date_to=None):
+    """Event của timeline trong khoảng ngày: đọc từ shard nếu shard còn khớp, không thì đọc cả timeline"""
+    shard_dir = shard_dir_for(timeline_file)
+    manifest_file = os.path.join(shard_dir, SHARD_MANIFEST_NAME)
+    if os.path.exists(manifest_file):
+        granularity = json_backend.load(manifest_file).get("granularity", "year")
+        if granularity in SHARD_GRANULARITIES:
+            shards = TimelineShards(shard_dir, granularity)
+            if shards.is_current(timeline_file):
+                return shards.load_range(date_from, date_to)
+    events = TimelineStore(timeline_file).load().get("timelineEvents", [])
+    return [e for e in events if _in_range(e["dateParsed"]["date"], date_from, date_to)]
+
+def change_feed_path_for(timeline_file):
+    """data/timeline.json -> data/timeline_changes.json"""
+    return os.path.join(os.path.dirname(timeline_file), CHANGE_FEED_NAME)
+
+def _canonical_json(value):
+    """JSON chuẩn hóa (stdlib, sort key): không đổi theo backend JSON đang cài (orjson/ujson ghi float, thứ tự key khác)"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def _event_key(event_id):
+    """Key của event trong feed: id dạng JSON để đọc lại đúng kiểu (id do web tạo có thể là số thực)"""
+    return _canonical_json(event_id)
+
+def _event_fingerprint(event):
+    """Đổi khi bất kỳ trường nào của event thay đổi"""
+    return zlib.crc32(_canonical_json(event).encode("utf-8"))
+
+class ChangeFeed:
+    """Version tăng dần + changeset của các lần ghi timeline, giữ lại history changeset gần nhất"""
+
+    def __init__(self, feed_file, history=DEFAULT_CHANGE_HISTORY):
+        if history < 1:
+            raise ValueError("history phải >= 1")
+        self.feed_file = feed_file
+        self.history = history
+
+    def load(self):
+        """Feed hiện có, None nếu chưa có hoặc không đọc được"""
+        if not os.path.exists(self.feed_file):
+            return None
+        try:
+            feed = json_backend.load(self.feed_file)
+        except Exception as e:
+            print(f"Lỗi khi đọc change feed {self.feed_file}: {e}")
+            return None
+        if feed.get("format") != CHANGE_FEED_VERSION:
+            return None
+        return feed
+
+    def is_current(self, timeline_file):
+        """Feed có khớp với snapshot + log hiện tại không (gọi trước khi ghi timeline)"""
+        feed = self.load()
+        return feed is not None and feed.get("source") == _source_state(timeline_file)
+
+    def record(self, timeline_file, all_events, added=None):
+        """Ghi nhận trạng thái timeline vừa ghi, trả về version hiện tại
+
+        added: event mới của lần ghi này khi feed còn khớp với timeline trước lúc ghi (chỉ có thêm event);
+        None thì so fingerprint toàn bộ timeline với lần trước để tìm event thêm/sửa/xóa
+        """
+        feed = self.load()
+        if feed is None:
+            # Feed mới: version đầu tiên là mốc, không có changeset nào trước nó
+            fingerprints = {_event_key(event["id"]): _event_fingerprint(event) for event in all_events}
+            feed = {"format": CHANGE_FEED_VERSION, "version": 1, "changes": []}
+            changeset = None
+        elif added is not None:
+            fingerprints = feed["fingerprints"]
+            for event in added:
+                fingerprints[_event_key(event["id"])] = _event_fingerprint(event)
+            changeset = {"added": list(added), "updated": [], "removed": []} if added else None
+        else:
+            previous = feed["fingerprints"]
+            fingerprints = {}
+            changeset = {"added": [], "updated": [], "removed": []}
+            for event in all_events:
+                key = _event_key(event["id"])
+                fingerprint = fingerprints[key] = _event_fingerprint(event)
+                old = previous.get(key)
+                if old is None:
+                    changeset["added"].append(event)
+                elif old != fingerprint:
+                    changeset["updated"].append(event)
+            changeset["removed"] = [json_backend.loads(key) for key in previous if key not in fingerprints]
+            if not any(changeset.values()):
+                changeset = None
+
+        if changeset is not None:
+            feed["version"] += 1
+            changeset = dict(version=feed["version"], savedAt=datetime.now().isoformat(), **changeset)
+            feed["changes"] = (feed["changes"] + [changeset])[-self.history:]
+        feed["fingerprints"] = fingerprints
+        feed["source"] = _source_state(timeline_file)
+        atomic_write_bytes(self.feed_file, json_backend.dumps(feed, pretty=False))
+        return feed["version"]
+
+    def changes_since(self, timeline_file, since):
+        """Gộp các changeset sau version since: {version, since, reset, added, updated, removed}
+
+        reset=True khi không trả được delta (chưa có feed, timeline bị sửa ngoài importer,
+        since lạ hoặc cũ hơn history đang giữ): client phải tải lại cả timeline
+        """
+        feed = self.load()
+        result = {"version": None, "since": since, "reset": True, "added": [], "updated": [], "removed": []}
+        if feed is None:
+            return result
+        version = feed["version"]
+        changes = feed["changes"]
+        oldest = changes[0]["version"] - 1 if changes else version
+        result["version"] = version
+        if feed.get("source") != _source_state(timeline_file) or not oldest <= since <= version:
+            return result
+
+        # id -> (loại thay đổi, event): thêm rồi xóa thì bỏ, xóa rồi thêm lại thành sửa
+        merged = {}
+        for changeset in changes:
+            if changeset["version"] <= since:
+                continue
+            for event in changeset["added"]:
+                kind = merged.get(event["id"], (None,))[0]
+                merged[event["id"]] = ("updated" if kind == "removed" else "added", event)
+            for event in changeset["updated"]:
+                kind = merged.get(event["id"], (None,))[0]
+                merged[event["id"]] = ("added" if kind == "added" else "updated", event)
+            for event_id in changeset["removed"]:
+                kind = merged.get(event_id, (None,))[0]
+                if kind == "added":
+                    del merged[event_id]
+                else:
+                    merged[event_id] = ("removed", None)
+
+        result["reset"] = False
+        for event_id, (kind, event) in merged.items():
+            result[kind].append(event_id if kind == "removed" else event)
+        return result
+
+def changes_since(timeline_file, since):
+    """Thay đổi của timeline từ version since (xem ChangeFeed.changes_since)"""
+    return ChangeFeed(change_feed_path_for(timeline_file)).changes_since(timeline_file, since)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import json
 import sys
 
+import json_backend
+
 # Dữ liệu mới từ người dùng
 new_events = [
     {
@@ -46,10 +47,10 @@ new_events = [
 
 # Đọc dữ liệu từ stdin nếu có
 if len(sys.argv) > 1 and sys.argv[1] == '--from-stdin':
-    input_data = sys.stdin.read()
+    input_data = sys.stdin.buffer.read()
     try:
-        new_events = json.loads(input_data)
-    except json.JSONDecodeError as e:
+        new_events = json_backend.loads(input_data)
+    except ValueError as e:
         print(f"Lỗi parse JSON: {e}", file=sys.stderr)
         sys.exit(1)
 
@@ -60,9 +61,8 @@ new_data = {
     "version": "1.0"
 }
 
-# Ghi vào file
-with open('data.json', 'w', encoding='utf-8') as f:
-    json.dump(new_data, f, ensure_ascii=False, indent=2)
+# Ghi vào file (--compact để ghi dạng gọn, không thụt lề)
+json_backend.dump(new_data, 'data.json', pretty='--compact' not in sys.argv)
 
 print("Đã cập nhật file data.json thành công!")
 